@@ -61,6 +61,9 @@ CREATE TABLE fill (
         ON UPDATE cascade ON DELETE restrict
 );
 
+-- Everything beyond these base tables (rollups, indexes, ...) is added by the versioned migrations in
+-- model/migrations. Run them with 'python -m src.migrate' from the model/ folder after bootstrapping.
+
 -- DEMO DATA:
 -- Dummy data acquired by Mockaroo
 
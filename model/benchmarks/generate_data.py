@@ -0,0 +1,235 @@
+"""
+Synthetic dataset generator for the strategy / trade / trade_leg / fill tables.
+
+Produces realistic data at any scale (tens of thousands to tens of millions of fills): strategies with staggered
+launch dates, multi-leg trades whose legs are opened and closed over several fills, and a tail of still-open trades.
+Rows are generated with vectorized NumPy in chronological chunks (so memory stays bounded and fill_ids grow with
+filled_time, like broker ids do), written to tab-separated files and bulk-loaded with LOAD DATA LOCAL INFILE.
+
+Usage (from the model/ folder):
+    python -m benchmarks.generate_data --fills 1000000 --truncate
+    python -m benchmarks.generate_data --fills 50000000 --out /data/synthetic --no-load
+"""
+
+# imports
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pymysql
+
+from src.settings import *
+
+# Fills generated per chunk. Bounds memory at roughly a few hundred MB regardless of the total size.
+CHUNK_FILLS = 1_000_000
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# Legs per trade and their probabilities (most trades are single-leg, spreads have 2-4 legs)
+LEG_COUNTS = np.array([1, 2, 3, 4])
+LEG_PROBS = np.array([0.6, 0.25, 0.1, 0.05])
+# Average fills per leg: opening fills plus the same number of closing fills
+AVG_FILLS_PER_LEG = 4.0
+AVG_FILLS_PER_TRADE = AVG_FILLS_PER_LEG * (LEG_COUNTS * LEG_PROBS).sum()
+
+TABLE_COLUMNS = {
+    'strategy': ['strategy_name', 'strategy_id', 'documentation_link', 'host_link', 'launch_date', 'termination_date'],
+    'trade': ['trade_id', 'strategy_id', 'open_time', 'close_time'],
+    'trade_leg': ['leg_no', 'trade_id', 'contract', 'open_time', 'close_time'],
+    'fill': ['fill_id', 'leg_no', 'trade_id', 'contract', 'qty', 'avg', 'placement_time', 'filled_time', 'brokerage'],
+}
+
+
+class DatasetGenerator():
+    """
+    Generates the dataset chunk by chunk. Trades are spread uniformly over [start, start + days) and every chunk
+    covers a consecutive slice of that period, so ids are assigned in time order across chunks.
+    """
+
+    def __init__(self, fills, strategies=10, days=730, open_fraction=0.02, contracts=500, seed=0,
+                 start='2021-01-01'):
+        self.fills = fills
+        self.strategies = strategies
+        self.days = days
+        self.open_fraction = open_fraction
+        self.rng = np.random.default_rng(seed)
+        self.start = np.datetime64(start, 's')
+        self.contracts = np.array([f'SYN{i:04d}' for i in range(contracts)], dtype=object)
+        self.contract_prices = self.rng.lognormal(mean=4.0, sigma=0.8, size=contracts).round(2)
+
+        self.n_trades = max(1, int(round(fills / AVG_FILLS_PER_TRADE)))
+        self._next_trade_id = 1
+        self._next_fill_id = 1
+
+    def strategy_frame(self):
+        ids = np.arange(1, self.strategies + 1)
+        launch = self.start - (self.rng.integers(0, 90, self.strategies) * SECONDS_PER_DAY).astype('timedelta64[s]')
+        return pd.DataFrame({
+            'strategy_name': [f'SyntheticStrategy{i}' for i in ids],
+            'strategy_id': ids,
+            'documentation_link': [f'github.com/NTS-Lightning/SyntheticStrategy{i}' for i in ids],
+            'host_link': None,
+            'launch_date': launch,
+            'termination_date': None,
+        })
+
+    def chunks(self):
+        """
+        Yield (trade, trade_leg, fill) DataFrames, one chunk at a time, in chronological order.
+        """
+        trades_per_chunk = max(1, int(CHUNK_FILLS / AVG_FILLS_PER_TRADE))
+        span = self.days * SECONDS_PER_DAY
+        n_chunks = -(-self.n_trades // trades_per_chunk)
+        for chunk in range(n_chunks):
+            n = min(trades_per_chunk, self.n_trades - chunk * trades_per_chunk)
+            lo = span * chunk // n_chunks
+            hi = span * (chunk + 1) // n_chunks
+            yield self._chunk(n, lo, hi, is_last=chunk == n_chunks - 1)
+
+    def _chunk(self, n, lo, hi, is_last):
+        rng = self.rng
+
+        ### TRADES ###
+        trade_ids = np.arange(self._next_trade_id, self._next_trade_id + n)
+        self._next_trade_id += n
+        open_offset = np.sort(rng.integers(lo, hi, n))
+        open_time = self.start + open_offset.astype('timedelta64[s]')
+        # Holding periods from minutes to days (log-normal, median ~2 hours)
+        duration = np.maximum(60, rng.lognormal(mean=np.log(7200), sigma=1.5, size=n)).astype(np.int64)
+        close_time = open_time + duration.astype('timedelta64[s]')
+        # The most recent trades are still open
+        is_open = np.zeros(n, dtype=bool)
+        if is_last:
+            is_open[n - max(1, int(round(n * self.open_fraction))):] = True
+        strategy_id = rng.integers(1, self.strategies + 1, n)
+
+        trade = pd.DataFrame({'trade_id': trade_ids, 'strategy_id': strategy_id, 'open_time': open_time,
+                              'close_time': np.where(is_open, np.datetime64('NaT'), close_time)})
+
+        ### TRADE LEGS ###
+        n_legs = rng.choice(LEG_COUNTS, size=n, p=LEG_PROBS)
+        leg_trade = np.repeat(np.arange(n), n_legs)
+        leg_no = np.arange(len(leg_trade)) - np.repeat(np.cumsum(n_legs) - n_legs, n_legs) + 1
+        contract_idx = rng.integers(0, len(self.contracts), len(leg_trade))
+        trade_leg = pd.DataFrame({'leg_no': leg_no, 'trade_id': trade_ids[leg_trade],
+                                  'contract': self.contracts[contract_idx], 'open_time': open_time[leg_trade],
+                                  'close_time': trade['close_time'].to_numpy()[leg_trade]})
+
+        ### FILLS ###
+        # Each leg opens a position over k fills and, unless the trade is still open, closes it over k more
+        n_leg = len(leg_trade)
+        leg_open = is_open[leg_trade]
+        k = 1 + rng.poisson(AVG_FILLS_PER_LEG / 2 - 1, n_leg)
+        fills_per_leg = np.where(leg_open, k, 2 * k)
+        fill_leg = np.repeat(np.arange(n_leg), fills_per_leg)
+        ordinal = np.arange(len(fill_leg)) - np.repeat(np.cumsum(fills_per_leg) - fills_per_leg, fills_per_leg)
+        k_f = k[fill_leg]
+        is_closing = ordinal >= k_f
+
+        # Split the leg quantity as evenly as possible over its opening (and closing) fills
+        side = rng.choice([-1, 1], n_leg, p=[0.3, 0.7])
+        leg_qty = rng.integers(1, 11, n_leg) * 100
+        part = np.where(is_closing, ordinal - k_f, ordinal)
+        qty = leg_qty[fill_leg] // k_f + (part < leg_qty[fill_leg] % k_f)
+        qty = qty * side[fill_leg] * np.where(is_closing, -1, 1)
+
+        entry = self.contract_prices[contract_idx] * (1 + rng.normal(0, 0.05, n_leg))
+        exit_ = entry * (1 + rng.normal(0.0005, 0.02, n_leg))
+        avg = np.where(is_closing, exit_[fill_leg], entry[fill_leg]) * (1 + rng.normal(0, 0.0005, len(fill_leg)))
+
+        # Opening fills land in the first 10% of the holding period, closing fills in the last 10%
+        t_trade = leg_trade[fill_leg]
+        window = np.maximum(1, duration[t_trade] // 10)
+        start_offset = np.where(is_closing, duration[t_trade] - window, 0)
+        placement = open_time[t_trade] + (start_offset + rng.integers(0, window)).astype('timedelta64[s]')
+        filled = placement + rng.integers(1, 11, len(fill_leg)).astype('timedelta64[s]')
+
+        fill = pd.DataFrame({'leg_no': leg_no[fill_leg], 'trade_id': trade_ids[t_trade],
+                             'contract': self.contracts[contract_idx][fill_leg], 'qty': qty,
+                             'avg': avg.round(4), 'placement_time': placement, 'filled_time': filled,
+                             'brokerage': 'SYNTHETIC'})
+        fill = fill.sort_values('filled_time', kind='stable', ignore_index=True)
+        fill.insert(0, 'fill_id', np.arange(self._next_fill_id, self._next_fill_id + len(fill)))
+        self._next_fill_id += len(fill)
+
+        return trade, trade_leg, fill
+
+
+def write_tsv(df, path, append):
+    df.to_csv(path, sep='\t', header=False, index=False, na_rep='\\N', mode='a' if append else 'w',
+              date_format='%Y-%m-%d %H:%M:%S')
+
+
+def generate(generator, out_dir):
+    """
+    Write every table to <out_dir>/<table>.tsv and return the row count per table.
+    """
+    paths = {table: os.path.join(out_dir, f'{table}.tsv') for table in TABLE_COLUMNS}
+    write_tsv(generator.strategy_frame(), paths['strategy'], append=False)
+    counts = {'strategy': generator.strategies, 'trade': 0, 'trade_leg': 0, 'fill': 0}
+    for i, (trade, trade_leg, fill) in enumerate(generator.chunks()):
+        for table, df in (('trade', trade), ('trade_leg', trade_leg), ('fill', fill)):
+            write_tsv(df, paths[table], append=i > 0)
+            counts[table] += len(df)
+        print(f'  chunk {i + 1}: {counts["fill"]:,} fills written')
+    return paths, counts
+
+
+def load(paths, truncate):
+    """
+    Bulk-load the generated files. Key checks are switched off for the load since the generator guarantees them.
+    """
+    conn = pymysql.connect(host=RDS_HOSTNAME, user=RDS_USER, password=RDS_PASSWORD, database=DB_NAME,
+                           local_infile=True, autocommit=False)
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SET foreign_key_checks = 0, unique_checks = 0')
+            if truncate:
+                for table in ('fill', 'trade_leg', 'trade', 'strategy', 'daily_pnl', 'rollup_watermark'):
+                    cur.execute(f'TRUNCATE TABLE `{table}`')
+            for table in ('strategy', 'trade', 'trade_leg', 'fill'):
+                start = time.perf_counter()
+                cur.execute(f"""
+                    LOAD DATA LOCAL INFILE %s INTO TABLE `{table}`
+                    FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+                    ({', '.join(TABLE_COLUMNS[table])});
+                    """, (paths[table],))
+                conn.commit()
+                print(f'  loaded {table} in {time.perf_counter() - start:.1f}s')
+            cur.execute('SET foreign_key_checks = 1, unique_checks = 1')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate and bulk-load a synthetic trading dataset.')
+    parser.add_argument('--fills', type=int, default=100_000, help='approximate number of fills (10k to 50M)')
+    parser.add_argument('--strategies', type=int, default=10)
+    parser.add_argument('--days', type=int, default=730, help='calendar days of history')
+    parser.add_argument('--open-fraction', type=float, default=0.02, help='fraction of trades left open')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help='directory for the .tsv files (default: a temp directory)')
+    parser.add_argument('--truncate', action='store_true', help='empty the tables before loading')
+    parser.add_argument('--no-load', action='store_true', help='only write the .tsv files')
+    args = parser.parse_args()
+
+    out_dir = args.out or tempfile.mkdtemp(prefix='lightning-db-')
+    os.makedirs(out_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    generator = DatasetGenerator(args.fills, strategies=args.strategies, days=args.days,
+                                 open_fraction=args.open_fraction, seed=args.seed)
+    paths, counts = generate(generator, out_dir)
+    print(f'Generated {counts} in {time.perf_counter() - start:.1f}s into {out_dir}')
+
+    if not args.no_load:
+        start = time.perf_counter()
+        load(paths, args.truncate)
+        print(f'Loaded in {time.perf_counter() - start:.1f}s')
+
+        from src import pnl_rollup
+        start = time.perf_counter()
+        pnl_rollup.rebuild()
+        print(f'Rebuilt the daily P&L rollup in {time.perf_counter() - start:.1f}s')
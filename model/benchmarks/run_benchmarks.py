@@ -0,0 +1,248 @@
+"""
+Endpoint latency benchmark.
+
+Drives every GET route of the strategy, portfolio and risk-management blueprints through the Flask test client
+against the configured (local) database, and reports per endpoint:
+    p50 / p95 / p99 latency, throughput (requests per second) and peak RSS of the process while it ran.
+Results are saved as JSON in benchmarks/results/ so that runs can be compared for regressions.
+
+Usage (from the model/ folder, ideally after 'python -m benchmarks.generate_data'):
+    python -m benchmarks.run_benchmarks --requests 200 --concurrency 4
+    python -m benchmarks.run_benchmarks --compare latest
+    python -m benchmarks.run_benchmarks --only get_strategy_pnl
+"""
+
+# imports
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from src import create_app, db_pool
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+BLUEPRINT_PREFIXES = ('/strategy/', '/port/', '/rm/')
+# p95 slowdowns larger than this fraction are flagged as regressions when comparing runs
+REGRESSION_THRESHOLD = 0.10
+
+# Query parameters per route, every variant is benchmarked separately. '{strategy}' is replaced with the benchmarked
+# strategy, and routes that are not listed get DEFAULT_PARAMS.
+DEFAULT_PARAMS = [{'strategy': '{strategy}'}]
+ENDPOINT_PARAMS = {
+    '/strategy/get_strategy_hist_trades': [{'strategy': '{strategy}', 'lookback': 0},
+                                           {'strategy': '{strategy}', 'lookback': 6},
+                                           {'strategy': '{strategy}', 'lookback': 0, 'limit': 1000},
+                                           {'strategy': '{strategy}', 'lookback': 0, 'format': 'jsonl'}],
+    '/port/get_active_strategies': [{}],
+    '/port/get_daily_pnl': [{}],
+    '/port/get_strategies_statistics': [{'strategies': '*'}],
+    '/port/get_top_of_book': [{}],
+    '/rm/get_port_risk_metrics': [{}],
+}
+
+
+class RSSSampler():
+    """
+    Samples the resident set size of this process in a background thread and keeps the peak.
+    Reads /proc/self/statm where available and falls back to the (process lifetime) ru_maxrss elsewhere.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+    def current(self):
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * self._page_size
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def discover_endpoints(app, strategy, only=None):
+    """
+    URL (with query string) of every GET route of the benchmarked blueprints, one per ENDPOINT_PARAMS variant.
+    """
+    urls = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if not rule.rule.startswith(BLUEPRINT_PREFIXES) or 'GET' not in rule.methods or rule.arguments:
+            continue
+        if only and not any(o in rule.rule for o in only):
+            continue
+        for params in ENDPOINT_PARAMS.get(rule.rule, DEFAULT_PARAMS):
+            query = '&'.join(f'{k}={str(v).format(strategy=strategy)}' for k, v in params.items())
+            urls.append(rule.rule + (f'?{query}' if query else ''))
+    return urls
+
+
+def benchmark_endpoint(app, url, requests, concurrency, warmup):
+    """
+    Issue warmup + requests GETs against url with concurrency threads, each thread using its own test client.
+    """
+    clients = [app.test_client() for _ in range(concurrency)]
+    for i in range(warmup):
+        clients[0].get(url)
+
+    latencies = np.empty(requests)
+    statuses = np.empty(requests, dtype=np.int32)
+    sizes = np.empty(requests, dtype=np.int64)
+
+    def run(worker):
+        client = clients[worker]
+        for i in range(worker, requests, concurrency):
+            start = time.perf_counter()
+            response = client.get(url)
+            latencies[i] = time.perf_counter() - start
+            statuses[i] = response.status_code
+            sizes[i] = len(response.get_data())
+
+    with RSSSampler() as rss:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(run, range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(latencies * 1000, [50, 95, 99])
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': int((statuses >= 400).sum()),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'mean_ms': round(float(latencies.mean() * 1000), 3),
+        'throughput_rps': round(requests / elapsed, 2),
+        'peak_rss_mb': round(rss.peak / 2 ** 20, 1),
+        'avg_response_bytes': int(sizes.mean()),
+    }
+
+
+def dataset_size():
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            sizes = {}
+            for table in ('strategy', 'trade', 'trade_leg', 'fill'):
+                cur.execute(f'select count(*) from `{table}`')
+                sizes[table] = cur.fetchone()[0]
+    return sizes
+
+
+def benchmark_strategy():
+    """
+    The strategy with the most trades, so the per-strategy endpoints see the heaviest realistic load.
+    """
+    with db_pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                Select strategy.strategy_name
+                from trade join strategy on trade.strategy_id = strategy.strategy_id
+                group by strategy.strategy_name
+                order by count(*) desc
+                limit 1;
+                """)
+            row = cur.fetchone()
+    if row is None:
+        raise Exception('The database has no trades to benchmark against')
+    return row[0]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(RESULTS_DIR)).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def compare(current, previous_path):
+    """
+    Print p50/p95 changes against a previous run, flagging p95 regressions above REGRESSION_THRESHOLD.
+    """
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f'\nCompared with {os.path.basename(previous_path)} (revision {previous.get("revision")}):')
+    regressions = 0
+    for name, result in current['endpoints'].items():
+        before = previous['endpoints'].get(name)
+        if before is None:
+            print(f'  {name}: new endpoint')
+            continue
+        change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0.0
+        flag = '  REGRESSION' if change > REGRESSION_THRESHOLD else ''
+        regressions += bool(flag)
+        print(f'  {name}: p50 {before["p50_ms"]} -> {result["p50_ms"]} ms, '
+              f'p95 {before["p95_ms"]} -> {result["p95_ms"]} ms ({change:+.0%}){flag}')
+    return regressions
+
+
+def latest_result(exclude=None):
+    paths = sorted(p for p in glob.glob(os.path.join(RESULTS_DIR, '*.json')) if p != exclude)
+    return paths[-1] if paths else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark every API endpoint against the local database.')
+    parser.add_argument('--requests', type=int, default=100, help='measured requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=1, help='concurrent clients per endpoint')
+    parser.add_argument('--strategy', default=None, help='strategy to query (default: the one with the most trades)')
+    parser.add_argument('--only', nargs='*', help='only run endpoints whose path contains one of these strings')
+    parser.add_argument('--compare', default=None, help="previous results file to compare with, or 'latest'")
+    args = parser.parse_args()
+
+    app = create_app()
+    strategy = args.strategy or benchmark_strategy()
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'dataset': dataset_size(),
+        'strategy': strategy,
+        'endpoints': {},
+    }
+    print(f'Benchmarking against {results["dataset"]} with strategy {strategy}')
+
+    for url in discover_endpoints(app, strategy, args.only):
+        result = benchmark_endpoint(app, url, args.requests, args.concurrency, args.warmup)
+        results['endpoints'][url] = result
+        print(f'{url:70} p50 {result["p50_ms"]:9.2f} ms  p95 {result["p95_ms"]:9.2f} ms  '
+              f'p99 {result["p99_ms"]:9.2f} ms  {result["throughput_rps"]:8.1f} req/s  '
+              f'{result["peak_rss_mb"]:7.1f} MB  errors {result["errors"]}')
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'\nSaved results to {path}')
+
+    if args.compare:
+        previous = latest_result(exclude=path) if args.compare == 'latest' else args.compare
+        if previous is None:
+            print('No previous results to compare with')
+        else:
+            compare(results, previous)
@@ -0,0 +1,113 @@
+"""
+Startup-time benchmark.
+
+Measures, each in fresh interpreters and as the median of several runs:
+    import      importing src (settings, pool, caches, archive) without touching the database
+    app         create_app(), i.e. importing every blueprint and building the Flask app
+    first       serving a first request that needs no database (GET /test)
+    worker      like a gunicorn worker of the preloaded app: fork a process that has already created the app and
+                time it until it served its first request (and opened its pool connections, with --db)
+and lists the modules that take the longest to import. The preloaded worker boot is what gunicorn.conf.py relies on,
+so it should stay a small fraction of the cold start. Results are saved as JSON in benchmarks/results/startup/.
+
+Usage (from the model/ folder):
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --runs 5 --db        also open the pool's connections in the forked worker
+"""
+
+# imports
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+from benchmarks.run_benchmarks import RESULTS_DIR, git_revision
+
+STARTUP_RESULTS_DIR = os.path.join(RESULTS_DIR, 'startup')
+
+# Run in a fresh interpreter, prints the timings of one cold start and one preloaded worker boot as JSON
+PROBE = """
+import json, os, time
+start = time.perf_counter()
+import src
+imported = time.perf_counter()
+app = src.create_app()
+created = time.perf_counter()
+client = app.test_client()
+assert client.get('/test').status_code == 200
+served = time.perf_counter()
+
+read_end, write_end = os.pipe()
+forked = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    if {open_pool}:
+        src.db_pool.open()
+    app.test_client().get('/test')
+    os.write(write_end, str(time.perf_counter() - forked).encode())
+    os._exit(0)
+os.waitpid(pid, 0)
+worker = float(os.read(read_end, 64).decode())
+print(json.dumps({{'import': imported - start, 'app': created - imported, 'first': served - created, 'worker': worker}}))
+"""
+
+
+def measure(runs, open_pool):
+    """
+    {phase: [seconds per run]} over runs fresh interpreters.
+    """
+    timings = {}
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', PROBE.format(open_pool=open_pool)])
+        for phase, seconds in json.loads(output.decode().strip().splitlines()[-1]).items():
+            timings.setdefault(phase, []).append(seconds)
+    return timings
+
+
+def slowest_imports(top):
+    """
+    The top modules by cumulative import time when importing src, from python -X importtime.
+    """
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import src'], capture_output=True).stderr
+    modules = []
+    for line in output.decode().splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((int(cumulative) / 1000, name.strip()))
+    # A package's cumulative time includes its submodules, so e.g. src heads the list
+    return [{'module': name, 'ms': round(ms, 1)} for ms, name in sorted(modules, reverse=True)[:top]]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the cold start and the preloaded worker boot of the API.')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to start')
+    parser.add_argument('--db', action='store_true', help="open the pool's connections in the forked worker")
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    args = parser.parse_args()
+
+    timings = measure(args.runs, args.db)
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'runs': args.runs,
+        'phases_ms': {phase: round(statistics.median(values) * 1000, 1) for phase, values in timings.items()},
+        'slowest_imports': slowest_imports(args.top),
+    }
+    phases = results['phases_ms']
+    cold = phases['import'] + phases['app'] + phases['first']
+    print(f'cold start {cold:8.1f} ms  (import {phases["import"]:.1f}, create_app {phases["app"]:.1f}, '
+          f'first request {phases["first"]:.1f})')
+    print(f'preloaded worker boot {phases["worker"]:8.1f} ms{" (with pool connections)" if args.db else ""}')
+    print('\nSlowest imports (cumulative):')
+    for entry in results['slowest_imports']:
+        print(f'  {entry["ms"]:8.1f} ms  {entry["module"]}')
+
+    os.makedirs(STARTUP_RESULTS_DIR, exist_ok=True)
+    path = os.path.join(STARTUP_RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'\nSaved results to {path}')
@@ -0,0 +1,49 @@
+"""
+Production server configuration for gunicorn. From the model/ folder:
+    gunicorn -c gunicorn.conf.py app:application
+
+The app is imported once by the master process (preload_app) and every worker is forked from it, so a worker is ready
+as soon as it is forked and the imported modules (pandas, NumPy, ...) are shared copy-on-write instead of being loaded
+once per worker. Importing the app opens no database connection and starts no thread: every worker opens its own
+pooled connections after the fork (post_worker_init), and the pool and the update feed reset themselves in a forked
+process (see src/pool.py and src/push.py), so workers never share a database socket.
+
+Workers default to one per CPU core, each with SERVER_THREADS threads; see the SERVER section of src/settings.py.
+"""
+
+# imports
+import gc
+import os
+
+from src.settings import SERVER_BIND, SERVER_GRACEFUL_TIMEOUT, SERVER_THREADS, SERVER_TIMEOUT, SERVER_WORKERS
+
+bind = SERVER_BIND
+workers = SERVER_WORKERS or os.cpu_count()
+# Threaded workers: the routes block on MySQL, and every /stream/updates client holds a thread for as long as it listens
+worker_class = 'gthread'
+threads = SERVER_THREADS
+preload_app = True
+timeout = SERVER_TIMEOUT
+graceful_timeout = SERVER_GRACEFUL_TIMEOUT
+keepalive = 5
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach, so that collections in the workers do not write to
+    # (and thereby copy) the memory pages they share with the master
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    from src import db_pool
+    try:
+        db_pool.open()
+    except Exception as e:
+        # The pool connects on demand anyway, the first requests will retry
+        worker.log.warning(f'Could not open the database connections at startup: {e}')
+
+
+def worker_exit(server, worker):
+    from src import db_pool, replica_router
+    db_pool.close()
+    replica_router.close()
@@ -0,0 +1,20 @@
+-- Daily P&L rollup maintained incrementally from the fill table by src/rollup.py.
+
+-- Table to represent the daily P&L rollup, which is the P&L of every strategy on every day (booked on the open date
+-- of the trade).
+CREATE TABLE IF NOT EXISTS daily_pnl (
+    strategy_id integer NOT NULL,
+    date date NOT NULL,
+    pnl double NOT NULL DEFAULT 0,
+    fills integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (strategy_id, date)
+);
+
+-- Table to represent how far each rollup has read the fill table, as the newest (filled_time, fill_id) folded in.
+CREATE TABLE IF NOT EXISTS rollup_watermark (
+    rollup_name varchar(50) NOT NULL,
+    last_filled_time datetime,
+    last_fill_id integer,
+    updated_at datetime,
+    PRIMARY KEY (rollup_name)
+);
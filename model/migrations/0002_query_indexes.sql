@@ -0,0 +1,21 @@
+-- Secondary and covering indexes for the DBModel read paths. Until now every table only had its primary key, so
+-- every strategy lookup, open/historical trade listing and P&L join was a full scan.
+
+-- Strategies are resolved by name on every request, and a name must identify exactly one strategy.
+CREATE UNIQUE INDEX ux_strategy_name ON strategy (strategy_name);
+
+-- Open trades: strategy_id = ? and close_time is null, ordered by open_time.
+CREATE INDEX ix_trade_strategy_close_open ON trade (strategy_id, close_time, open_time);
+
+-- Historical trades and lookbacks: strategy_id = ? and open_time > ?, ordered by open_time.
+CREATE INDEX ix_trade_strategy_open ON trade (strategy_id, open_time, close_time);
+
+-- trade -> trade_leg join. The primary key leads with leg_no, so it cannot serve lookups by trade_id.
+CREATE INDEX ix_trade_leg_trade ON trade_leg (trade_id, leg_no, contract);
+
+-- trade_leg -> fill join, covering qty and avg (and fill_id through the primary key) so the P&L and capital
+-- aggregates never read the fill rows themselves.
+CREATE INDEX ix_fill_trade_leg ON fill (trade_id, leg_no, qty, avg);
+
+-- Watermark scans of the P&L rollup: fills newer than (filled_time, fill_id).
+CREATE INDEX ix_fill_filled_time ON fill (filled_time, fill_id);
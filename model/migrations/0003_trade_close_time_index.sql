@@ -0,0 +1,3 @@
+-- Data-version probe of the result cache: max(close_time) over all trades. The existing trade indexes lead with
+-- strategy_id, so without this one the probe would scan the trade table on every request.
+CREATE INDEX ix_trade_close_time ON trade (close_time);
@@ -0,0 +1,5 @@
+-- Keyset pagination of historical trades orders by (open_time, trade_id) within a strategy. ix_trade_strategy_open
+-- had close_time between the two, so that order needed a filesort; rebuild it with trade_id right after open_time
+-- (close_time stays in the index to keep it covering).
+DROP INDEX ix_trade_strategy_open ON trade;
+CREATE INDEX ix_trade_strategy_open ON trade (strategy_id, open_time, trade_id, close_time);
@@ -0,0 +1,25 @@
+-- Monthly range partitioning of trade (by open_time) and fill (by filled_time), so that time-bounded queries only read
+-- the months they need and old months can be dropped or archived as whole partitions instead of with long deletes.
+--
+-- MySQL requires that:
+-- - partitioned tables neither have nor are referenced by foreign keys. The three foreign keys are dropped, and
+--   referential integrity of trade -> trade_leg -> fill is now up to the writers (the ingestion endpoint validates it).
+-- - every unique key contains the partitioning column. The primary keys become (trade_id, open_time) and
+--   (fill_id, filled_time), which makes those columns NOT NULL. This migration stops with an error if any trade has no
+--   open_time or any fill has no filled_time; fix those rows first.
+--
+-- Both tables start out with a single catch-all partition. 'python -m src.partitions maintain' then splits it into
+-- one partition per month of existing data plus PARTITION_MONTHS_AHEAD future months, and must be run regularly
+-- (e.g. daily from cron) to keep creating partitions ahead of time.
+
+ALTER TABLE fill DROP FOREIGN KEY fk_3;
+ALTER TABLE trade_leg DROP FOREIGN KEY fk_2;
+ALTER TABLE trade DROP FOREIGN KEY fk_1;
+
+ALTER TABLE trade DROP INDEX trade_id, DROP PRIMARY KEY, MODIFY open_time datetime NOT NULL,
+    ADD PRIMARY KEY (trade_id, open_time);
+ALTER TABLE fill DROP PRIMARY KEY, MODIFY filled_time datetime NOT NULL,
+    ADD PRIMARY KEY (fill_id, filled_time);
+
+ALTER TABLE trade PARTITION BY RANGE COLUMNS (open_time) (PARTITION p_future VALUES LESS THAN (MAXVALUE));
+ALTER TABLE fill PARTITION BY RANGE COLUMNS (filled_time) (PARTITION p_future VALUES LESS THAN (MAXVALUE));
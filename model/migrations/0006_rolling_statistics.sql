@@ -0,0 +1,32 @@
+-- Online rolling statistics maintained day by day from the daily_pnl rollup by src/rolling.py.
+
+-- Table to represent the running statistics of a strategy after the last day folded in: Welford mean and sum of
+-- squared deviations, equity, peak and maximum drawdown, and the recent daily P&L the rolling windows slide over
+-- (as JSON).
+CREATE TABLE IF NOT EXISTS rolling_stats_state (
+    strategy_id integer NOT NULL,
+    last_date date NOT NULL,
+    state mediumtext NOT NULL,
+    updated_at datetime,
+    PRIMARY KEY (strategy_id)
+);
+
+-- Table to represent the statistics of every strategy as of the end of every day, annualized over 252 trading days.
+-- Rolling windows are null until the strategy has a full window of days.
+CREATE TABLE IF NOT EXISTS rolling_stats (
+    strategy_id integer NOT NULL,
+    date date NOT NULL,
+    pnl double NOT NULL,
+    equity double NOT NULL,
+    drawdown double NOT NULL,
+    mean double,
+    volatility double,
+    sharpe double,
+    volatility_20 double,
+    sharpe_20 double,
+    volatility_60 double,
+    sharpe_60 double,
+    volatility_252 double,
+    sharpe_252 double,
+    PRIMARY KEY (strategy_id, date)
+);
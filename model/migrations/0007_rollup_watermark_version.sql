@@ -0,0 +1,4 @@
+-- Counter bumped whenever daily_pnl changes without the watermark moving: backdated fills folded in directly by
+-- ingestion, and rebuilds. Part of the result cache's data-version probe, so that every worker drops P&L results
+-- computed before such a change.
+ALTER TABLE rollup_watermark ADD COLUMN version bigint NOT NULL DEFAULT 0;
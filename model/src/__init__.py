@@ -1,12 +1,90 @@
 # Some set up for the application 
 
+from functools import partial
 from flask import Flask
 from flask_cors import CORS
 import pymysql
-from config import *
+from src.settings import *
+from src.pool import ConnectionPool
+from src.rollup import PnLRollup
+from src.rolling import RollingStatistics
+from src.positions import PositionBook
+from src.cache import ResultCache
+from src.registry import StrategyRegistry
+from src.archive import ParquetArchive
+from src.columnar import ColumnarStore
+from src.push import UpdateFeed
+from src.lots import LotLedger
+from src.metrics import InstrumentedCursor, instrument_app, observe_pool_wait, registry
+from src.profiling import install_profiling
+from src.replicas import Replica, ReplicaRouter, install_lag_tolerance
 
-# create a DB object that we will use in other parts of the API
-db = pymysql.connect(host=RDS_HOSTNAME, user=RDS_USER, password=RDS_PASSWORD, database='nts_lightning_db_v2', autocommit=True)
+# arguments of every connection, a replica's entry in DB_REPLICAS overrides them
+connect_args = dict(host=RDS_HOSTNAME, user=RDS_USER, password=RDS_PASSWORD, database=DB_NAME, autocommit=True,
+                    cursorclass=InstrumentedCursor)
+
+# create a pool of DB connections that we will use in other parts of the API
+db_pool = ConnectionPool(
+    partial(pymysql.connect, **connect_args),
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    ping_interval=DB_POOL_PING_INTERVAL,
+    reconnect_attempts=DB_RECONNECT_ATTEMPTS,
+    reconnect_backoff=DB_RECONNECT_BACKOFF,
+    on_wait=observe_pool_wait)
+
+# current pool size for /metrics, the waits and queries themselves are recorded as they happen (see src/metrics.py)
+registry.gauge('db_pool_connections', 'Open pooled connections by state', ('state',),
+               lambda: {(state,): value for state, value in db_pool.stats().items() if state in ('idle', 'in_use')})
+
+# routes the analytic reads of every DBModel to the read replicas (see src/replicas.py). Replica pools connect on demand
+# and give up on an unreachable replica after one attempt, the read then falls back to the primary
+replica_router = ReplicaRouter(
+    db_pool,
+    [Replica(f"{replica.get('host', RDS_HOSTNAME)}:{replica.get('port', 3306)}",
+             ConnectionPool(partial(pymysql.connect, **{**connect_args, **replica}),
+                            min_size=0,
+                            max_size=DB_REPLICA_POOL_MAX_SIZE,
+                            timeout=DB_POOL_TIMEOUT,
+                            ping_interval=DB_POOL_PING_INTERVAL,
+                            reconnect_attempts=1,
+                            on_wait=observe_pool_wait))
+     for replica in DB_REPLICAS],
+    max_lag=DB_REPLICA_MAX_LAG,
+    check_interval=DB_REPLICA_CHECK_INTERVAL)
+registry.gauge('db_replica_lag_seconds', 'Replication lag of each read replica at its last check', ('replica',),
+               lambda: {(r['name'],): r['lag'] for r in replica_router.stats()['replicas'] if r['lag'] is not None})
+
+# Parquet cold tier of archived trades shared by every DBModel (see src/archive.py)
+cold_archive = ParquetArchive(db_pool, ARCHIVE_DIR, compression=ARCHIVE_COMPRESSION, batch_trades=ARCHIVE_BATCH_TRADES)
+
+# DuckDB snapshot of trade / trade_leg / fill for the analytic scans of every DBModel (see src/columnar.py)
+columnar_store = ColumnarStore(db_pool, COLUMNAR_PATH, archive=cold_archive, max_age=COLUMNAR_MAX_AGE,
+                               batch_rows=COLUMNAR_SYNC_BATCH_ROWS)
+
+# daily P&L rollup shared by every DBModel (see src/rollup.py)
+pnl_rollup = PnLRollup(db_pool, refresh_interval=PNL_ROLLUP_REFRESH_INTERVAL, archive=cold_archive)
+
+# per-strategy running and rolling-window statistics over the rollup, shared by every DBModel (see src/rolling.py)
+rolling_stats = RollingStatistics(db_pool, pnl_rollup, refresh_interval=ROLLING_STATS_REFRESH_INTERVAL)
+
+# in-memory book of open positions shared by every DBModel (see src/positions.py)
+position_book = PositionBook(db_pool, refresh_interval=POSITION_BOOK_REFRESH_INTERVAL)
+
+# cache of DBModel read results shared by every DBModel (see src/cache.py)
+result_cache = ResultCache(db_pool, max_entries=RESULT_CACHE_MAX_ENTRIES, ttl=RESULT_CACHE_TTL,
+                           probe_interval=RESULT_CACHE_PROBE_INTERVAL, enabled=RESULT_CACHE_ENABLED)
+
+# in-memory copy of the strategy table shared by every DBModel (see src/registry.py)
+strategy_registry = StrategyRegistry(db_pool, refresh_interval=STRATEGY_REGISTRY_REFRESH_INTERVAL)
+
+# lot-matched realized / unrealized P&L shared by every DBModel (see src/lots.py)
+lot_ledger = LotLedger(db_pool, archive=cold_archive)
+
+# pushes open-trade and P&L changes to /stream/updates subscribers (see src/push.py)
+update_feed = UpdateFeed(db_pool, position_book, pnl_rollup, strategy_registry, interval=PUSH_INTERVAL,
+                         queue_size=PUSH_QUEUE_SIZE)
 
 def create_app():
     app = Flask(__name__)
@@ -16,17 +94,32 @@ def create_app():
     # cookie and can be used for any other security related needs by 
     # extensions or your application
     app.config['SECRET_KEY'] = SECRET_KEY
+
+    # request latency and response serialization metrics (see src/metrics.py)
+    instrument_app(app)
+    # per-request breakdowns for requests carrying the profiling token (see src/profiling.py)
+    install_profiling(app, db_pool)
+    # replication lag tolerated by each request (max_lag / X-Max-Replica-Lag, see src/replicas.py)
+    install_lag_tolerance(app)
     
+    # gzip / brotli encoding of large buffered responses
+    from src.api.responses import compress_response
+    app.after_request(compress_response)
+
     # Import the various routes
     from src.api.strategy_api import strategy_blueprint
     from src.api.portfolio_api import portfolio_blueprint
     from src.api.rm_api import rm_blueprint
+    from src.api.ingest_api import ingest_blueprint
+    from src.api.stream_api import stream_blueprint
     from src.views import views_blueprint
 
     # Register the routes that we just imported so they can be properly handled
     app.register_blueprint(strategy_blueprint,       url_prefix='/strategy')
     app.register_blueprint(portfolio_blueprint,       url_prefix='/port')
     app.register_blueprint(rm_blueprint,       url_prefix='/rm')
+    app.register_blueprint(ingest_blueprint,       url_prefix='/ingest')
+    app.register_blueprint(stream_blueprint,       url_prefix='/stream')
     app.register_blueprint(views_blueprint,          url_prefix='/')
 
     return app
\ No newline at end of file
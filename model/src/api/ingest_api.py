@@ -0,0 +1,54 @@
+from flask import Blueprint, jsonify, request, make_response
+from src.db_model import DBModel
+from src.ingest import ValidationError, validate_batch
+from src.settings import INGEST_MAX_BATCH_ROWS
+import pymysql
+import time
+
+ingest_blueprint = Blueprint('ingest_blueprint', __name__)
+
+db_model = DBModel()
+
+"""
+Ingestion:
+
+Stores the write routes strategies use to push their trades, trade legs and fills.
+"""
+
+@ingest_blueprint.route('/batch', methods=['POST'])
+def ingest_batch():
+    """
+    Method to write a batch of trades, trade legs and fills in one transaction. Safe to retry: a fill_id that is
+    already stored is skipped, and a trade or leg that is already stored is only updated to set its close_time.
+    Takes a JSON body of the format:
+    ---------------------------------------
+    {
+        "trades": [{"trade_id", "strategy_id", "open_time", "close_time"}, ...],
+        "trade_legs": [{"leg_no", "trade_id", "contract", "open_time", "close_time"}, ...],
+        "fills": [{"fill_id", "leg_no", "trade_id", "contract", "qty", "avg", "placement_time", "filled_time",
+                   "brokerage"}, ...]
+    }
+    ---------------------------------------
+    Every key is optional, times are "YYYY-MM-DD HH:MM:SS" strings and rows may reference trades or legs stored by an
+    earlier batch. Returns the row counts written (see DBModel.ingest_batch) and the time taken, 400 with a list of
+    errors if the batch does not match the schema, and 409 if it references a missing strategy, trade or leg.
+    """
+    start = time.perf_counter()
+    payload = request.get_json(silent=True)
+    if payload is None:
+        return make_response(jsonify(errors=['The request body must be JSON']), 400)
+
+    try:
+        batch = validate_batch(payload, INGEST_MAX_BATCH_ROWS)
+    except ValidationError as e:
+        return make_response(jsonify(errors=e.errors), 400)
+
+    try:
+        r_json = db_model.ingest_batch(batch)
+    except pymysql.err.IntegrityError as e:
+        return make_response(jsonify(errors=[f'Batch rejected, nothing was written: {e}']), 409)
+    except Exception as e:
+        return make_response(f'Error: {e}', 500)
+
+    r_json['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    return make_response(jsonify(r_json), 200)
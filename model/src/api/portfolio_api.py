@@ -1,9 +1,10 @@
 from flask import Blueprint, jsonify, request, make_response
-from src import db
 from src.db_model import DBModel
-import pandas as pd
+from src.api.responses import conditional_get, data_response
 
 portfolio_blueprint = Blueprint('portfolio_blueprint', __name__)
+# ETags and 304 Not Modified for polling clients
+conditional_get(portfolio_blueprint)
 
 db_model = DBModel()
 
@@ -17,11 +18,11 @@ Stores all routes to get information about the portfolio in its entirety.
 def get_active_strategies():  # <-- Status: Passing All Tests
     """
     Method to get a list of all active strategies. An active strategy is defined as one that is currently running on an EC2.
-    Returns all attributes of the strategy table.
+    Returns all attributes of the strategy table. Pass format=columnar for a column-oriented response.
     """
     try:
         acts = db_model.get_active_strategies()
-        return make_response(acts, 200)
+        return data_response(acts)
     except Exception as e:
         return make_response(f'Error: {e}', 500)
 
@@ -36,14 +37,64 @@ def get_daily_pnl():  # <-- Status: Passing All Tests
         "pnl": <P&L on date>
     }
     ---------------------------------------
+    Pass format=columnar for a column-oriented response.
     """
     try:
         dpnl = db_model.get_daily_pnl()
-        return make_response(dpnl, 200)
+        return data_response(dpnl)
+    except Exception as e:
+        return make_response(f'Error: {e}', 500)
+
+@portfolio_blueprint.route('/get_strategies_statistics')
+def get_strategies_statistics():
+    """
+    Method to get the performance stats of several strategies in one request, as a table with one row per strategy.
+    Returns a JSON of the following format:
+    ---------------------------------------
+    {
+        "strategy_name": <Strategy Name>,
+        "strategy_id": <Strategy ID>,
+        "cumulative_pnl", "ytd_pnl", "avg_annual_return", "avg_daily_return", "avg_daily_trades", "sharpe":
+            <Same Stats as /strategy/get_strategy_statistics>
+    }
+    ---------------------------------------
+    strategies: Comma-separated strategy names, or * (default) for all active strategies
+    Pass format=columnar for a column-oriented response.
+    """
+    strategies = request.args.get('strategies', '*')
+    if strategies != '*':
+        strategies = tuple(s for s in strategies.split(',') if s)
+
+    try:
+        stats = db_model.get_strategies_statistics(strategies)
+        return data_response(stats)
+    except Exception as e:
+        return make_response(f'Error: {e}', 500)
+
+@portfolio_blueprint.route('/rebuild_pnl_rollup', methods=['POST'])
+def rebuild_pnl_rollup():
+    """
+    Method to recompute the daily P&L rollup from the full fill history. Only needed after backdated fills or manual
+    corrections to the trade/fill tables; new fills are picked up incrementally.
+    """
+    try:
+        rows = db_model.rebuild_pnl_rollup()
+        return make_response(jsonify(rows=rows), 200)
+    except Exception as e:
+        return make_response(f'Error: {e}', 500)
+
+@portfolio_blueprint.route('/reload_position_book', methods=['POST'])
+def reload_position_book():
+    """
+    Method to reload the in-memory position book from the database. Only needed after backdated fills or manual
+    corrections to the trade/fill tables; new fills and closed trades are picked up incrementally.
+    """
+    try:
+        db_model.reload_position_book()
+        return make_response(jsonify(reloaded=True), 200)
     except Exception as e:
         return make_response(f'Error: {e}', 500)
 
-# TODO
 @portfolio_blueprint.route('/get_top_of_book')
 def get_top_of_book():
     """
@@ -53,10 +104,14 @@ def get_top_of_book():
     {
         "capital_usage": <Aggregate Value of All Open Trades>,
         "active_trades": <Count of All Open Trades>,
-        ...
+        "strategies": [{"strategy_id", "strategy_name", "active_trades", "capital_usage"}, ...],
+        "positions": [{"contract", "net_qty", "capital_usage", "legs"}, ...],
+        "as_of": <filled_time of the Newest Fill in the Book>
+    }
+    ---------------------------------------
     """
     try:
         tob = db_model.get_top_of_book()
-        return make_response(tob, 200)
+        return make_response(jsonify(tob), 200)
     except Exception as e:
         return make_response(f'Error: {e}', 500)
\ No newline at end of file
@@ -0,0 +1,157 @@
+from flask import Response, current_app, g, jsonify, request, make_response, stream_with_context
+from src import result_cache
+from src.metrics import serialization_timer
+from src.replicas import begin_lag_tracking, end_lag_tracking
+from src.results import ResultSet
+from src.settings import BROTLI_QUALITY, COMPRESSION_MIN_SIZE, GZIP_LEVEL, RESULT_CACHE_TTL
+import gzip
+import hashlib
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+"""
+Helpers shared by the blueprints to turn DBModel results into HTTP responses.
+"""
+
+RESPONSE_FORMATS = ('records', 'columnar')
+
+# Response types worth compressing
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/plain', 'text/html', 'text/csv')
+
+
+def data_response(result, status=200, headers=None):
+    """
+    Build the response for a ResultSet. The shape is chosen with the optional format query parameter:
+    ---------------------------------------
+    ?format=records (default):  [{<col>: <value>, ...}, ...]
+    ?format=columnar:           {"columns": [<col>, ...], "data": {<col>: [<value>, ...], ...}}
+    ---------------------------------------
+    The columnar shape names every column once instead of once per row, which keeps large trade and P&L
+    responses considerably smaller and avoids building a dict per row.
+    """
+    response_format = request.args.get('format', 'records')
+    if response_format not in RESPONSE_FORMATS:
+        return make_response(f'Error: Unknown format {response_format}, expected one of {", ".join(RESPONSE_FORMATS)}', 400)
+
+    return make_response(jsonify(result_payload(result, response_format)), status, headers or {})
+
+
+def result_payload(result, response_format='records'):
+    """
+    JSON-serializable form of a ResultSet in the given format. Any other value is returned unchanged.
+    """
+    if not isinstance(result, ResultSet):
+        return result
+    if response_format == 'columnar':
+        return result.to_columnar()
+    return result.to_records()
+
+
+def jsonl_response(batches):
+    """
+    Stream a generator that yields column names and then lists of row tuples (e.g. DBModel.stream_historical_trades)
+    as JSON Lines, one {<col>: <value>, ...} object per line. Rows are encoded and sent batch by batch, so the first
+    bytes go out as soon as the first batch is read and the full result is never held in memory.
+    """
+    # Read the column names before responding, so that a failing query still turns into an error status
+    columns = next(batches)
+
+    def generate():
+        dumps = current_app.json.dumps
+        for rows in batches:
+            with serialization_timer():
+                chunk = ''.join(dumps(dict(zip(columns, row))) + '\n' for row in rows)
+            yield chunk
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def compress_response(response):
+    """
+    after_request hook: gzip or brotli encode a buffered response of a compressible type and at least
+    COMPRESSION_MIN_SIZE bytes, whichever the client accepts (brotli first, if the brotli package is installed).
+    Streamed responses are sent as they are, so that their first rows are not held back by the compressor.
+    """
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if (response.status_code < 200 or response.status_code in (204, 206) or response.is_streamed
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or (response.content_length or 0) < COMPRESSION_MIN_SIZE):
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        encoding, body = 'br', brotli.compress(response.get_data(), quality=BROTLI_QUALITY)
+    elif accepted['gzip']:
+        encoding, body = 'gzip', gzip.compress(response.get_data(), compresslevel=GZIP_LEVEL)
+    else:
+        return response
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    # Each encoding is its own representation, so it gets its own strong ETag
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(f'{etag}-{encoding}')
+    return response
+
+
+def conditional_get(blueprint, exclude=()):
+    """
+    Give the GET responses of a blueprint's routes (except the endpoint names in exclude) a strong ETag derived from
+    the data version of the result cache (see src/cache.py), and answer a request whose If-None-Match holds the
+    current ETag with 304 Not Modified before the route runs. Polling clients then only download a result again after
+    fills, trades or strategies changed, or after RESULT_CACHE_TTL seconds for results that depend on the clock.
+    Responses built from read replica data (see src/replicas.py) get no ETag, as they may predate that data version.
+    """
+    excluded = {f'{blueprint.name}.{name}' for name in exclude}
+
+    def current_etag():
+        if request.method != 'GET' or request.endpoint in excluded:
+            return None
+        try:
+            version = result_cache.version(), result_cache.generation
+        except Exception:
+            # Without a data version the route simply runs unconditionally
+            return None
+        # Results that depend on the clock (lookbacks, YTD figures) are only reused for the cache's ttl
+        epoch = int(time.time() // RESULT_CACHE_TTL)
+        key = repr((version, epoch, request.path, sorted(request.args.items(multi=True))))
+        return hashlib.sha1(key.encode()).hexdigest()[:24]
+
+    @blueprint.before_request
+    def not_modified():
+        etag = current_etag()
+        if etag is None:
+            return None
+        g.etag = etag
+        g.replica_lag_token = begin_lag_tracking()
+        # Any content encoding of the current data is still valid for the client that has it
+        for tag in (etag, f'{etag}-gzip', f'{etag}-br'):
+            if request.if_none_match.contains(tag):
+                response = Response(status=304)
+                response.set_etag(tag)
+                response.vary.add('Accept-Encoding')
+                return response
+        return None
+
+    @blueprint.after_request
+    def set_etag(response):
+        etag = g.pop('etag', None)
+        token = g.pop('replica_lag_token', None)
+        replica_lag = end_lag_tracking(token) if token is not None else None
+        if etag is not None and replica_lag is None and response.status_code == 200 and 'ETag' not in response.headers:
+            response.set_etag(etag)
+        return response
+
+    @blueprint.teardown_request
+    def stop_lag_tracking(exc):
+        # The request failed before after_request ran
+        token = g.pop('replica_lag_token', None)
+        if token is not None:
+            end_lag_tracking(token)
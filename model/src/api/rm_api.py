@@ -1,9 +1,14 @@
 from flask import Blueprint, jsonify, request, make_response
-from src import db
 from src.db_model import DBModel
-import pandas as pd
+from src.api.responses import conditional_get
+from src.risk import risk_engine
+from src.settings import SIMULATION_MAX_PATHS, SIMULATION_RUIN_LEVEL, SIMULATION_TIME_BUDGET
+from src.simulation import simulator
+from datetime import datetime
 
 rm_blueprint = Blueprint('rm_blueprint', __name__)
+# ETags and 304 Not Modified for polling clients, except for results that differ between identical requests
+conditional_get(rm_blueprint, exclude=('get_strategy_risk_metrics',))
 
 db_model = DBModel()
 
@@ -13,11 +18,10 @@ Risk Management Page:
 Stores all routes to get risk metrics regarding current and historical portfolio states.
 """
 
-# TODO
 @rm_blueprint.route('/get_port_risk_metrics')
 def get_port_risk_metrics():
     """
-    Returns aggregated risk metrics for all active strategies across the entire portfolio.
+    Returns aggregated risk metrics for all active strategies across the entire portfolio, computed over the daily P&L.
     Output will come in the format:
     ---------------------------------------
     {
@@ -25,24 +29,125 @@ def get_port_risk_metrics():
         "ES": <Expected Shortfall>,
         "MaxDD": <Maximum Drawdown>,
         "MaxDDDate": <Date of Maximum Drawdown>,
-        ...
+        "method": <historical | parametric>,
+        "confidence": <Confidence Level>,
+        "window": <Rolling Window in Days>,
+        "days": <Days of P&L History>,
+        "as_of": <Last Date of P&L>,
+        "levels": [{"confidence": <Confidence Level>, "VaR": <Value at Risk>, "ES": <Expected Shortfall>}, ...]
     }
+    ---------------------------------------
+    Optional parameters:
+    method: 'historical' (default) or 'parametric'
+    confidence: Confidence level, or a comma-separated list of them (default 0.95). VaR/ES are for the first one.
+    window: Rolling window in days (default 252)
+    series: 'true' to also return the rolling VaR, ES and drawdown for every day
     """
-    
-    return make_response('Not Implemented Yet', 200)
+    try:
+        method = request.args.get('method', 'historical')
+        confidences = [float(c) for c in request.args.get('confidence', '0.95').split(',')]
+        window = int(request.args.get('window', 252))
+        series = request.args.get('series', 'false').lower() == 'true'
+    except Exception as e:
+        return make_response(f'Error: Invalid parameters: {e}', 400)
+
+    try:
+        dpnl = db_model.get_daily_pnl()
+    except Exception as e:
+        return make_response(f'Error: {e}', 500)
+
+    try:
+        today = datetime.now().strftime('%Y-%m-%d')
+        levels = [risk_engine.metrics(dpnl['date'], dpnl['pnl'], today, confidence, window, method,
+                                      series=series and i == 0)
+                  for i, confidence in enumerate(confidences)]
+    except ValueError as e:
+        return make_response(f'Error: {e}', 400)
+    except Exception as e:
+        return make_response(f'Error calculating risk metrics: {e}', 500)
+
+    r_json = levels[0]
+    r_json['levels'] = [{'confidence': l['confidence'], 'VaR': l['VaR'], 'ES': l['ES']} for l in levels]
+    return make_response(jsonify(r_json), 200)
 
-# TODO
 @rm_blueprint.route('/get_strategy_risk_metrics')
 def get_strategy_risk_metrics():
     """
-    Returns risk metrics for a particular strategy.
+    Returns simulated forward-looking risk metrics for a strategy (or every active strategy with strategy=*), from
+    bootstrap or Monte Carlo paths of its daily P&L run on a process pool.
+    Output will come in the format:
+    ---------------------------------------
+    {
+        "strategies": {
+            <Strategy Name>: {
+                "VaR": <Value at Risk of the P&L over the horizon>,
+                "ES": <Expected Shortfall of the P&L over the horizon>,
+                "mean_pnl": <Mean simulated P&L over the horizon>,
+                "drawdown": {"p50": <Median Max Drawdown>, "p95": <95th pct.>, "p99": <99th pct.>, "worst": <Worst>},
+                "probability_of_ruin": <Share of paths losing ruin_level or more at any point>,
+                "paths": <Paths Simulated>,
+                "history_days": <Days of P&L History Sampled>
+            }, ...
+        },
+        "method": <bootstrap | montecarlo>, "paths": <Paths Requested>, "horizon": <Days>, "seed": <Seed>,
+        "time_budget": {"budget_s", "elapsed_s", "budget_used", "paths_requested", "paths_completed", "truncated",
+                        "workers"}
+    }
+    ---------------------------------------
+    Optional parameters:
+    paths: Paths per strategy (default 10000, at most SIMULATION_MAX_PATHS)
+    horizon: Days simulated per path (default 21)
+    method: 'bootstrap' (default, circular block bootstrap) or 'montecarlo' (normal days)
+    block_size: Bootstrap block length in days (default 5)
+    confidence: Confidence level of VaR/ES (default 0.95)
+    ruin_level: Loss that counts as ruin (default SIMULATION_RUIN_LEVEL)
+    seed: Random seed, the same seed always gives the same result (default 0)
+    budget: Time budget in seconds, paths not finished by then are dropped and reported (default SIMULATION_TIME_BUDGET)
     """
     # First, get the strategy from the request
     try:
         strategy = request.args.get('strategy')
-        if db_model.strategy_exists(strategy) == False:
+        if strategy != '*' and db_model.strategy_exists(strategy) == False:
             return make_response(f'Error: Strategy {strategy} does not exist.', 400)
     except Exception as e:
         return make_response(f'Error: {e}', 500)
 
-    return make_response('Not Implemented Yet', 200)
+    try:
+        paths = int(request.args.get('paths', 10000))
+        horizon = int(request.args.get('horizon', 21))
+        method = request.args.get('method', 'bootstrap')
+        block_size = int(request.args.get('block_size', 5))
+        confidence = float(request.args.get('confidence', 0.95))
+        ruin_level = float(request.args.get('ruin_level', SIMULATION_RUIN_LEVEL))
+        seed = int(request.args.get('seed', 0))
+        budget = float(request.args.get('budget', SIMULATION_TIME_BUDGET))
+        if not 0 < paths <= SIMULATION_MAX_PATHS:
+            raise ValueError(f'paths must be between 1 and {SIMULATION_MAX_PATHS}')
+        if horizon < 1 or block_size < 1 or budget <= 0 or seed < 0:
+            raise ValueError('horizon, block_size and budget must be positive and seed non-negative')
+        if not 0 < confidence < 1:
+            raise ValueError(f'Confidence must be between 0 and 1, got {confidence}')
+    except Exception as e:
+        return make_response(f'Error: Invalid parameters: {e}', 400)
+
+    try:
+        # One query for all strategies, instead of one per strategy
+        spnl = db_model.split_by_strategy(db_model.get_strategies_pnl('*' if strategy == '*' else [strategy]))
+    except Exception as e:
+        return make_response(f'Error: {e}', 500)
+
+    try:
+        histories = {name: (strategy_id, days['pnl']) for name, (strategy_id, days) in spnl.items()}
+        results, report = simulator.run(histories, paths, horizon, method, block_size, confidence, ruin_level, seed,
+                                        budget)
+    except ValueError as e:
+        return make_response(f'Error: {e}', 400)
+    except Exception as e:
+        return make_response(f'Error running risk simulation: {e}', 500)
+
+    if strategy != '*' and strategy not in results:
+        # A strategy without any closed P&L yet has nothing to sample from
+        results[strategy] = None
+    r_json = {'strategies': results, 'method': method, 'paths': paths, 'horizon': horizon, 'seed': seed,
+              'time_budget': report}
+    return make_response(jsonify(r_json), 200)
@@ -1,12 +1,29 @@
 from flask import Blueprint, jsonify, request, make_response
-from src import db
-from src.db_model import DBModel
-import pandas as pd
+from src.db_model import DBModel, query_deadline
+from src.api.responses import RESPONSE_FORMATS, conditional_get, data_response, jsonl_response, result_payload
+from src.settings import DASHBOARD_MAX_TASKS, DASHBOARD_TIMEOUT, DASHBOARD_WORKERS, HIST_TRADES_MAX_LIMIT, STREAM_BATCH_ROWS
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+import contextvars
+import time
 
 strategy_blueprint = Blueprint('strategy_blueprint', __name__)
+# ETags and 304 Not Modified for polling clients, except for results that differ between identical requests
+conditional_get(strategy_blueprint, exclude=('get_strategy_dashboard',))
 
 db_model = DBModel()
 
+# Runs the sections of /strategy/dashboard concurrently, its threads are started on first use
+dashboard_executor = ThreadPoolExecutor(max_workers=DASHBOARD_WORKERS, thread_name_prefix='dashboard')
+
+# Dashboard section -> DBModel method taking a strategy name
+DASHBOARD_SECTIONS = {
+    'status': db_model.get_strategy_status,
+    'statistics': db_model.get_strategy_statistics,
+    'pnl': db_model.get_strategy_pnl,
+    'open_trades': db_model.get_open_trades,
+}
+
 """
 Strategy Page:
 
@@ -38,37 +55,14 @@ def get_strategy_status():  # <-- Status: Passing All Tests
     except Exception as e:
         return make_response(f'Error: {e}', 500)
 
-    # Get the strategy info and open trades from the DB
+    # Get the strategy info from the DB, and its open trades from the in-memory position book
     try:
-        strategy_info = db_model.get_strategy_info(strategy)
-        open_trades = db_model.get_open_trades(strategy)
+        status = db_model.get_strategy_status(strategy)
     except Exception as e:
         return make_response(f'Error retrieving Database Model strategy information: {e}', 500)
 
-    # Get variables for the return JSON
-    s_name = strategy
-    try:
-        s_id = strategy_info[0]['strategy_id']
-    except Exception as e:
-        s_id = 0
-    s_running_on = 'unknown'
-    s_capital_usage = 0
-    try:
-        for i in range(len(open_trades)):
-            s_capital_usage += open_trades[i]['capital_usage']
-    except Exception as e:
-        s_capital_usage = 0
-    try:
-        s_active_trades = len(open_trades)
-    except:
-        s_active_trades = 0
-
     # Format and return as a JSON
-    return make_response(jsonify(strategy_name=s_name,
-                                 strategy_id=s_id,
-                                 active_trades=s_active_trades,
-                                 capital_usage=s_capital_usage,
-                                 running_on=s_running_on), 200)
+    return make_response(jsonify(status), 200)
 
 
 @strategy_blueprint.route('/get_strategy_statistics')
@@ -112,6 +106,14 @@ def get_strategy_hist_trades():  # <-- Status: Passing All Tests
     ex.) get_strategy_hist_trades(LongGME, 6)
          - Returns a JSON of all historical trades and their corresponding attributes for the last 6 calendar months from the LongGME strategy.
          - JSON is inclusive of the current calendar day but exclusive of all open trades (not historical)
+    Pass format=columnar for a column-oriented response.
+
+    Trades are ordered by (open_time, trade_id). For large histories, either:
+    - Page through them with limit (at most HIST_TRADES_MAX_LIMIT). While there are more trades, the response carries
+      the X-Next-After-Open-Time and X-Next-After-Trade-Id headers; pass them back as after_open_time and
+      after_trade_id to get the next page.
+    - Or stream all of them with format=jsonl: one JSON object per line, read from MySQL with an unbuffered cursor.
+      after_open_time / after_trade_id resume an interrupted export.
     """
     try:
         strategy = request.args.get('strategy')
@@ -119,8 +121,32 @@ def get_strategy_hist_trades():  # <-- Status: Passing All Tests
         # Potentially convert the type to an integer
         if type(lookback) == str:
             lookback = int(lookback)
+        after_open_time = request.args.get('after_open_time')
+        after_trade_id = request.args.get('after_trade_id')
+        limit = request.args.get('limit')
+        if (after_open_time is None) != (after_trade_id is None):
+            raise ValueError('after_open_time and after_trade_id must be passed together')
+        if after_open_time is not None:
+            after_open_time = datetime.fromisoformat(after_open_time).strftime('%Y-%m-%d %H:%M:%S')
+            after_trade_id = int(after_trade_id)
+        if limit is not None:
+            limit = int(limit)
+            if not 0 < limit <= HIST_TRADES_MAX_LIMIT:
+                raise ValueError(f'limit must be between 1 and {HIST_TRADES_MAX_LIMIT}')
+    except Exception as e:
+        return make_response(f'Error: Invalid parameters: {e}', 400)
+
+    try:
+        if request.args.get('format') == 'jsonl':
+            return jsonl_response(db_model.stream_historical_trades(strategy, lookback, after_open_time,
+                                                                    after_trade_id, STREAM_BATCH_ROWS))
 
-        return make_response(db_model.get_historical_trades(strategy, lookback), 200)
+        trades = db_model.get_historical_trades(strategy, lookback, after_open_time, after_trade_id, limit)
+        headers = {}
+        if limit is not None and len(trades) == limit:
+            headers['X-Next-After-Open-Time'] = trades['open_time'][-1].strftime('%Y-%m-%d %H:%M:%S')
+            headers['X-Next-After-Trade-Id'] = str(trades['trade_id'][-1])
+        return data_response(trades, headers=headers)
     except Exception as e:
         return make_response(f'Error: {e}', 500)
 
@@ -135,11 +161,12 @@ def get_strategy_open_trades():  # <-- Status: Passing All Tests
     ex.) get_strategy_open_trades(LunchBreakReversion)
          - Returns a JSON of all open trades and their corresponding attributes from the LunchBreakReversion strategy. 
          - JSON is inclusive of every trade that has a non-zero net open value (aggregate qty of all legs != 0)
+    Pass format=columnar for a column-oriented response.
     """
     try:
         strategy = request.args.get('strategy')
 
-        return make_response(db_model.get_open_trades(strategy), 200)
+        return data_response(db_model.get_open_trades(strategy))
     except Exception as e:
         return make_response(f'Error: {e}', 500)
 
@@ -155,6 +182,7 @@ def get_strategy_pnl():  # <-- Status: Passing All Tests
         "pnl": <P&L on date>
     }
     ---------------------------------------
+    Pass format=columnar for a column-oriented response.
     """
     # First, get the strategy from the request
     try:
@@ -164,26 +192,193 @@ def get_strategy_pnl():  # <-- Status: Passing All Tests
     except Exception as e:
         return make_response(f'Error: {e}', 500)
 
-    # Next, get the P&L from the DB
+    # Next, get the P&L from the DB. The rollup is already daily, so no further resampling is needed.
     try:
         json_data = db_model.get_strategy_pnl(strategy)
     except Exception as e:
         return make_response(f'Error getting Strategy PNL: {e}', 500)
 
-    # Lastly, convert the JSON to a dataframe and perform the necessary data manipulation.
-    try:
-        df = pd.DataFrame(json_data)
-        df['date'] = pd.to_datetime(df['date'])
-        df = df.set_index('date')
-        df = df.groupby(pd.Grouper(freq='D')).sum()
-        df = df.reset_index()
-        df['date'] = df['date'].dt.strftime('%Y-%m-%d')
-        col_headers = [x for x in df.columns]
-        json_data = []
-        for entry in df.values:
-            json_data.append(dict(zip(col_headers, entry)))
+    return data_response(json_data)
+
+
+@strategy_blueprint.route('/get_strategy_lot_pnl')
+def get_strategy_lot_pnl():
+    """
+    Method to get a strategy's realized P&L by close date and its unrealized P&L, from matching fills against the
+    lots they close.
+    Returns a JSON of the following format:
+    ---------------------------------------
+    {
+        "realized": [{"date": <Close Date>, "pnl": <Realized P&L on Date>}, ...],
+        "unrealized": [{"contract", "qty": <Open Quantity>, "avg_price": <Average Open Price>, "mark",
+                        "unrealized_pnl"}, ...],
+        "realized_pnl": <Total Realized P&L>,
+        "unrealized_pnl": <Total Unrealized P&L of the Marked Contracts>,
+        "method": <fifo | average>,
+        "by": <leg | contract>
+    }
+    ---------------------------------------
+    method: 'fifo' (default) or 'average' (average cost)
+    by: 'leg' (default, lots matched within each trade leg) or 'contract' (across the strategy's trades)
+    marks: Comma-separated contract:price pairs to value open lots at, e.g. GME:70.5,AMC:4.2
+    Pass format=columnar for column-oriented realized / unrealized tables.
+    """
+    try:
+        strategy = request.args.get('strategy')
+        if db_model.strategy_exists(strategy) == False:
+            return make_response(f'Error: Strategy {strategy} does not exist.', 400)
+    except Exception as e:
+        return make_response(f'Error: {e}', 500)
+
+    method = request.args.get('method', 'fifo')
+    by = request.args.get('by', 'leg')
+    response_format = request.args.get('format', 'records')
+    try:
+        marks = {}
+        for pair in request.args.get('marks', '').split(','):
+            if pair:
+                contract, price = pair.rsplit(':', 1)
+                marks[contract] = float(price)
+    except ValueError:
+        return make_response('Error: marks must be comma-separated contract:price pairs', 400)
+
+    try:
+        r_json = db_model.get_strategy_lot_pnl(strategy, method, by, marks)
+    except ValueError as e:
+        return make_response(f'Error: {e}', 400)
+    except Exception as e:
+        return make_response(f'Error getting lot-matched P&L: {e}', 500)
+
+    r_json = {key: result_payload(value, response_format) for key, value in r_json.items()}
+    r_json.update(method=method, by=by)
+    return make_response(jsonify(r_json), 200)
+
+
+@strategy_blueprint.route('/get_strategy_rolling_stats')
+def get_strategy_rolling_stats():
+    """
+    Method to get a strategy's current running and rolling-window statistics and their daily history, updated
+    incrementally as each day closes.
+    Returns a JSON of the following format:
+    ---------------------------------------
+    {
+        "current": {
+            "as_of": <Last Closed Day>, "days": <Days Folded In>, "cumulative_pnl", "mean": <Mean Daily P&L>,
+            "volatility": <Annualized Volatility>, "sharpe": <Annualized Sharpe>, "peak": <Peak Cumulative P&L>,
+            "drawdown": <Current Drawdown>, "max_drawdown", "max_drawdown_date",
+            "windows": {"20": {"volatility", "sharpe"}, "60": {...}, "252": {...}}
+        },
+        "series": [{"date", "pnl", "equity", "drawdown", "mean", "volatility", "sharpe", "volatility_20",
+                    "sharpe_20", "volatility_60", "sharpe_60", "volatility_252", "sharpe_252"}, ...]
+    }
+    ---------------------------------------
+    since: Only return the series from this day on (YYYY-MM-DD)
+    series: 'true' (default) or 'false' to only return the current values
+    Pass format=columnar for a column-oriented series.
+    """
+    try:
+        strategy = request.args.get('strategy')
+        if db_model.strategy_exists(strategy) == False:
+            return make_response(f'Error: Strategy {strategy} does not exist.', 400)
+    except Exception as e:
+        return make_response(f'Error: {e}', 500)
+
+    response_format = request.args.get('format', 'records')
+    series = request.args.get('series', 'true').lower() != 'false'
+    try:
+        since = request.args.get('since')
+        if since is not None:
+            since = datetime.strptime(since, '%Y-%m-%d').date()
+    except ValueError:
+        return make_response('Error: since must be a date in the format YYYY-MM-DD', 400)
+
+    try:
+        r_json = db_model.get_strategy_rolling_stats(strategy, since, series)
+    except Exception as e:
+        return make_response(f'Error getting rolling statistics: {e}', 500)
+
+    r_json = {key: result_payload(value, response_format) for key, value in r_json.items()}
+    return make_response(jsonify(r_json), 200)
+
+
+@strategy_blueprint.route('/dashboard')
+def get_strategy_dashboard():
+    """
+    Method to get several sections of the strategy page for one or more strategies in one request. Every
+    (strategy, section) pair runs concurrently on its own pooled connection, so the request takes as long as the
+    slowest query rather than their sum.
+    Output will come in the format:
+    ---------------------------------------
+    {
+        "strategies": {<Strategy Name>: {<Section>: <Same Payload as the Section's Own Route>, ...}, ...},
+        "timings_ms": {<Strategy Name>: {<Section>: <Query Time>, ...}, ...},
+        "errors": {<Strategy Name>: {<Section>: <Error Message>, ...}, ...},
+        "elapsed_ms": <Wall Time of the Request>,
+        "sequential_ms": <Sum of the Section Times>
+    }
+    ---------------------------------------
+    strategies: Comma-separated strategy names
+    sections: Comma-separated sections, any of status, statistics, pnl, open_trades (default: all)
+    format: 'records' (default) or 'columnar' for the pnl and open_trades sections
+    A failing or timed out section is left out of "strategies" and reported in "errors"; the others are still returned.
+    A timed out section cannot be stopped from here, but its queries are bounded by the same deadline (MySQL
+    max_execution_time), so it fails and releases its pooled connection soon after the response is sent.
+    """
+    start = time.perf_counter()
+    try:
+        strategies = [s for s in request.args.get('strategies', request.args.get('strategy', '')).split(',') if s]
+        sections = [s for s in request.args.get('sections', ','.join(DASHBOARD_SECTIONS)).split(',') if s]
+        response_format = request.args.get('format', 'records')
+        if not strategies:
+            raise ValueError('No strategies specified')
+        unknown = [s for s in sections if s not in DASHBOARD_SECTIONS]
+        if unknown:
+            raise ValueError(f'Unknown section(s) {", ".join(unknown)}, expected any of {", ".join(DASHBOARD_SECTIONS)}')
+        if response_format not in RESPONSE_FORMATS:
+            raise ValueError(f'Unknown format {response_format}, expected one of {", ".join(RESPONSE_FORMATS)}')
+        if len(strategies) * len(sections) > DASHBOARD_MAX_TASKS:
+            raise ValueError(f'At most {DASHBOARD_MAX_TASKS} strategy x section queries are allowed per request')
     except Exception as e:
-        return make_response(f'Error converting JSON data to a DataFrame: {e}', 500)
+        return make_response(f'Error: Invalid parameters: {e}', 400)
+
+    try:
+        for strategy in strategies:
+            if db_model.strategy_exists(strategy) == False:
+                return make_response(f'Error: Strategy {strategy} does not exist.', 400)
+    except Exception as e:
+        return make_response(f'Error: {e}', 500)
+
+    deadline = time.monotonic() + DASHBOARD_TIMEOUT
+
+    def run_section(strategy, section):
+        section_start = time.perf_counter()
+        with query_deadline(deadline):
+            result = DASHBOARD_SECTIONS[section](strategy)
+        # Serialized in the worker too, so that conversion of large sections also runs in parallel
+        return result_payload(result, response_format), time.perf_counter() - section_start
+
+    # Each section runs in a copy of the request's context, so that a profiled request also records its sections' queries
+    futures = {dashboard_executor.submit(contextvars.copy_context().run, run_section, strategy, section):
+               (strategy, section) for strategy in strategies for section in sections}
+    done, not_done = wait(futures, timeout=DASHBOARD_TIMEOUT)
+
+    r_json = {'strategies': {s: {} for s in strategies}, 'timings_ms': {s: {} for s in strategies},
+              'errors': {}}
+    sequential = 0.0
+    for future, (strategy, section) in futures.items():
+        if future in not_done:
+            future.cancel()
+            r_json['errors'].setdefault(strategy, {})[section] = f'Timed out after {DASHBOARD_TIMEOUT}s'
+            continue
+        try:
+            payload, elapsed = future.result()
+        except Exception as e:
+            r_json['errors'].setdefault(strategy, {})[section] = f'Error: {e}'
+            continue
+        r_json['strategies'][strategy][section] = payload
+        r_json['timings_ms'][strategy][section] = round(elapsed * 1000, 3)
+        sequential += elapsed
 
-    # Error with pd.Dataframe - need to pass a list of lists not a list of dicts
-    return make_response(json_data, 200)
+    r_json['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    r_json['sequential_ms'] = round(sequential * 1000, 3)
+    return make_response(jsonify(r_json), 200)
@@ -0,0 +1,73 @@
+from flask import Blueprint, Response, current_app, request, make_response, stream_with_context
+from src import strategy_registry, update_feed
+from src.settings import PUSH_HEARTBEAT
+import queue
+
+stream_blueprint = Blueprint('stream_blueprint', __name__)
+
+"""
+Streams:
+
+Stores the routes that push updates to the client instead of being polled.
+"""
+
+@stream_blueprint.route('/updates')
+def updates():
+    """
+    Method to subscribe to the open trades, capital usage and today's P&L of strategies, as a Server-Sent Events stream.
+    Replaces polling /strategy/get_strategy_open_trades, /strategy/get_strategy_status and /port/get_daily_pnl.
+    Every event carries one strategy, in the format:
+    ---------------------------------------
+    event: snapshot | update
+    data: {
+        "strategy_id": <Strategy ID>,
+        "strategy_name": <Strategy Name>,
+        "active_trades": <Count of Open Trades>,
+        "capital_usage": <Aggregate Value of Open Trades>,
+        "today_pnl": <P&L of Trades Opened Today>,
+        "trades": [{"trade_id", "strategy_id", "open_time", "capital_usage", "fills",
+                    "legs": [{"leg_no", "contract", "qty", "capital_usage", "fills"}, ...]}, ...],
+        "closed_trades": [<Trade ID>, ...]
+    }
+    ---------------------------------------
+    A snapshot event with every open trade is sent per strategy on subscription. After that, update events list only
+    the trades that changed (in full) and the trades that closed since the previous event. Comment lines are sent as
+    keep-alives. If the client falls too far behind, the stream ends and the client should reconnect.
+    strategies: Comma-separated strategy names, or * (default) for all active strategies
+    """
+    strategies = request.args.get('strategies', '*')
+    if strategies == '*':
+        strategy_ids = strategy_registry.active_ids()
+    else:
+        names = [s for s in strategies.split(',') if s]
+        unknown = [name for name in names if not strategy_registry.exists(name)]
+        if unknown:
+            return make_response(f'Error: unknown strategies {", ".join(unknown)}', 400)
+        strategy_ids = strategy_registry.ids(names)
+    if not strategy_ids:
+        return make_response('Error: no strategies to subscribe to', 400)
+
+    try:
+        subscription = update_feed.subscribe(strategy_ids)
+    except Exception as e:
+        return make_response(f'Error: {e}', 500)
+    dumps = current_app.json.dumps
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = subscription.events.get(timeout=PUSH_HEARTBEAT)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                if event is None:
+                    break
+                yield f'event: {event[0]}\ndata: {dumps(event[1])}\n\n'
+        finally:
+            # Also reached when the client disconnects, as the next write fails
+            update_feed.unsubscribe(subscription)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
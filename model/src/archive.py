@@ -0,0 +1,357 @@
+"""
+Cold tier for closed trades: compressed Parquet files on local disk, partitioned by strategy.
+
+'run' moves every trade closed before a cutoff, with its legs and fills, out of MySQL in batches. Each batch is written
+to one file per table and strategy under ARCHIVE_DIR/<table>/strategy_id=<id>/, then deleted from MySQL in a single
+transaction. Besides the raw trade / trade_leg / fill rows, the trades files hold each trade's historical-trades
+aggregates (contract, no_legs, fills, pnl), so reads never need the archived fills.
+
+DBModel combines the archive with the live tables: get_historical_trades and the JSON Lines export merge the strategy's
+archived trades (memory-mapped, cached per process until the strategy's files change) with the live query, and the
+trade counts of the statistics include archived trades. daily_pnl keeps the P&L of archived trades, and
+PnLRollup.rebuild folds it back in from the archive.
+
+Every batch is recorded in ARCHIVE_DIR/_pending.json before any file is written and cleared once MySQL committed.
+A batch left pending by a crash is completed (or its files removed) at the start of the next run.
+
+Usage (from the model/ folder):
+    python -m src.archive status                list the archived files and rows per table
+    python -m src.archive run 2023-01-01        archive every trade closed before 1 January 2023
+"""
+
+# imports
+import json
+import os
+import sys
+import threading
+from datetime import date, datetime
+
+# pyarrow is imported on first use (see _arrow), processes that never read or write the archive do not load it
+pa = pc = pq = None
+
+# Columns of get_historical_trades, in order, which are also the first columns of the archived trades
+TRADE_COLUMNS = ['trade_id', 'open_time', 'close_time', 'contract', 'no_legs', 'fills', 'pnl']
+
+# Archived table -> (column, arrow type) of its files
+COLUMNS = {
+    'trades': [('trade_id', 'int64'), ('open_time', 'timestamp'), ('close_time', 'timestamp'), ('contract', 'string'),
+               ('no_legs', 'int64'), ('fills', 'int64'), ('pnl', 'float64')],
+    'trade_legs': [('leg_no', 'int64'), ('trade_id', 'int64'), ('contract', 'string'), ('open_time', 'timestamp'),
+                   ('close_time', 'timestamp')],
+    'fills': [('fill_id', 'int64'), ('leg_no', 'int64'), ('trade_id', 'int64'), ('contract', 'string'),
+              ('qty', 'int64'), ('avg', 'float64'), ('placement_time', 'timestamp'), ('filled_time', 'timestamp'),
+              ('brokerage', 'string')],
+}
+
+# Rows of one batch, each query returning the strategy_id followed by the columns of the table's schema
+BATCH_QUERIES = {
+    'trades': """
+        Select coalesce(trade.strategy_id, 0), trade.trade_id, trade.open_time, trade.close_time,
+        (select trade_leg.contract from trade_leg where trade_leg.trade_id = trade.trade_id
+         order by trade_leg.leg_no limit 1),
+        (select max(fill.leg_no) from fill where fill.trade_id = trade.trade_id),
+        (select count(*) from fill where fill.trade_id = trade.trade_id),
+        (select sum(fill.qty * fill.avg) * -1 from fill where fill.trade_id = trade.trade_id)
+        from trade
+        where trade.trade_id in ({ids})
+        """,
+    'trade_legs': """
+        Select coalesce(trade.strategy_id, 0), trade_leg.leg_no, trade_leg.trade_id, trade_leg.contract,
+        trade_leg.open_time, trade_leg.close_time
+        from trade_leg
+        join trade on trade_leg.trade_id = trade.trade_id
+        where trade_leg.trade_id in ({ids})
+        """,
+    'fills': """
+        Select coalesce(trade.strategy_id, 0), fill.fill_id, fill.leg_no, fill.trade_id, fill.contract, fill.qty,
+        fill.avg, fill.placement_time, fill.filled_time, fill.brokerage
+        from fill
+        join trade on fill.trade_id = trade.trade_id
+        where fill.trade_id in ({ids})
+        """,
+}
+# Children first, in place of the dropped foreign keys' order
+DELETE_ORDER = ['fill', 'trade_leg', 'trade']
+
+PENDING_FILE = '_pending.json'
+
+
+def _arrow():
+    """
+    Import pyarrow into the module globals on first use.
+    """
+    global pa, pc, pq
+    if pa is None:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+        pa, pc, pq = pyarrow, pyarrow.compute, pyarrow.parquet
+
+
+def _schema(name):
+    _arrow()
+    types = {'int64': pa.int64(), 'float64': pa.float64(), 'string': pa.string(), 'timestamp': pa.timestamp('us')}
+    return pa.schema([(column, types[kind]) for column, kind in COLUMNS[name]])
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class ParquetArchive():
+    """
+    Reads and writes the Parquet cold tier of closed trades. With path None the archive is disabled: it is always
+    empty and run() refuses to move anything.
+    """
+
+    def __init__(self, pool, path, compression='zstd', batch_trades=10_000):
+        self.pool = pool
+        self.path = path
+        self.compression = compression
+        self.batch_trades = batch_trades
+        self._lock = threading.Lock()
+        # (table, strategy_id) -> (file names it was read from, arrow table)
+        self._tables = {}
+
+    ### READERS ###
+
+    def historical_trades(self, strategy_id, since=None, after_open_time=None, after_trade_id=None, limit=None):
+        """
+        Archived trades of a strategy, with the same filters and (open_time, trade_id) order as the historical trades
+        query: opened after since, after the (after_open_time, after_trade_id) keyset, with at least one fill.
+        Returns a list of row tuples in TRADE_COLUMNS order.
+        """
+        if not self._files('trades', strategy_id):
+            return []
+        table = self._read('trades', strategy_id)
+        if table.num_rows == 0:
+            return []
+        mask = pc.greater(table['fills'], 0)
+        if since is not None:
+            mask = pc.and_(mask, pc.greater(table['open_time'], self._timestamp(since)))
+        if after_open_time is not None:
+            after = self._timestamp(after_open_time)
+            mask = pc.and_(mask, pc.or_(
+                pc.greater(table['open_time'], after),
+                pc.and_(pc.equal(table['open_time'], after), pc.greater(table['trade_id'], after_trade_id))))
+        table = table.filter(mask)
+        if limit is not None:
+            table = table.slice(0, limit)
+        return list(zip(*[table[col].to_pylist() for col in TRADE_COLUMNS]))
+
+    def fills(self, strategy_id):
+        """
+        Every archived fill of a strategy as an arrow table.
+        """
+        return self._read('fills', strategy_id)
+
+    def trade_counts(self, strategy_ids):
+        """
+        {strategy_id: archived trade count} of the given strategies (those without archived trades are left out).
+        """
+        counts = {}
+        for strategy_id in strategy_ids:
+            if not self._files('trades', strategy_id):
+                continue
+            rows = self._read('trades', strategy_id).num_rows
+            if rows:
+                counts[strategy_id] = rows
+        return counts
+
+    def daily_pnl(self):
+        """
+        P&L of every archived trade booked like the daily_pnl rollup does it: [(strategy_id, date, pnl, fills)], summed
+        per strategy and day the trade was opened.
+        """
+        rows = []
+        for strategy_id in self._strategy_ids('trades'):
+            df = self._read('trades', strategy_id).select(['open_time', 'fills', 'pnl']).to_pandas()
+            df = df[df['fills'] > 0]
+            if len(df) == 0:
+                continue
+            g = df.groupby(df['open_time'].dt.date).agg(pnl=('pnl', 'sum'), fills=('fills', 'sum'))
+            rows += [(strategy_id, day, float(pnl), int(fills)) for day, pnl, fills in
+                     zip(g.index, g['pnl'], g['fills'])]
+        return rows
+
+    def status(self):
+        """
+        {table: [(strategy_id, files, rows)]} of everything archived.
+        """
+        status = {}
+        for name in COLUMNS:
+            status[name] = []
+            for strategy_id in self._strategy_ids(name):
+                files = self._files(name, strategy_id)
+                status[name].append((strategy_id, len(files), self._read(name, strategy_id).num_rows))
+        return status
+
+    ### ARCHIVING ###
+
+    def run(self, cutoff):
+        """
+        Move every trade closed before cutoff (a date or datetime), with its legs and fills, to the archive. Returns
+        {table: rows archived}.
+        """
+        if self.path is None:
+            raise ArchiveError('The archive is disabled (ARCHIVE_DIR is None)')
+        os.makedirs(self.path, exist_ok=True)
+        self._recover()
+
+        totals = {name: 0 for name in COLUMNS}
+        batch_no = 0
+        run_id = datetime.now().strftime('%Y%m%dT%H%M%S')
+        while True:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute('select trade_id from trade where close_time < %s order by close_time limit %s',
+                                (cutoff, self.batch_trades))
+                    trade_ids = [row[0] for row in cur.fetchall()]
+                    if not trade_ids:
+                        break
+                    rows = {}
+                    for name, query in BATCH_QUERIES.items():
+                        cur.execute(query.format(ids=', '.join(['%s'] * len(trade_ids))), trade_ids)
+                        rows[name] = cur.fetchall()
+
+                    paths = self._write_batch(f'{run_id}-{batch_no:05d}', trade_ids, rows)
+                    try:
+                        self._delete(conn, cur, trade_ids)
+                    except Exception:
+                        self._remove(paths)
+                        raise
+                    os.remove(os.path.join(self.path, PENDING_FILE))
+
+            for name in COLUMNS:
+                totals[name] += len(rows[name])
+            batch_no += 1
+        return totals
+
+    ### HELPERS ###
+
+    def _write_batch(self, batch_id, trade_ids, rows):
+        """
+        Write one file per table and strategy for a batch and return their paths. The batch is recorded as pending
+        first, so a crash at any point leaves enough behind for _recover().
+        """
+        _arrow()
+        files = {}
+        for name, table_rows in rows.items():
+            by_strategy = {}
+            for row in table_rows:
+                by_strategy.setdefault(row[0], []).append(row[1:])
+            for strategy_id, strategy_rows in by_strategy.items():
+                files[self._file_path(name, strategy_id, batch_id)] = (name, strategy_rows)
+
+        with open(os.path.join(self.path, PENDING_FILE), 'w') as f:
+            json.dump({'files': list(files), 'trade_ids': trade_ids}, f)
+
+        for path, (name, strategy_rows) in files.items():
+            schema = _schema(name)
+            table = pa.Table.from_arrays(
+                [pa.array(list(values), type=field.type) for field, values in zip(schema, zip(*strategy_rows))],
+                schema=schema)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            pq.write_table(table, path + '.tmp', compression=self.compression)
+            os.replace(path + '.tmp', path)
+        return list(files)
+
+    def _delete(self, conn, cur, trade_ids):
+        conn.begin()
+        for table in DELETE_ORDER:
+            cur.execute(f'delete from `{table}` where trade_id in ({", ".join(["%s"] * len(trade_ids))})', trade_ids)
+        conn.commit()
+
+    def _recover(self):
+        """
+        Finish the batch a crashed run left pending: if all of its files were written, its trades are deleted from
+        MySQL (a no-op if that already happened), otherwise its files are removed and the trades stay live.
+        """
+        pending = os.path.join(self.path, PENDING_FILE)
+        if not os.path.exists(pending):
+            return
+        with open(pending) as f:
+            batch = json.load(f)
+        if all(os.path.exists(path) for path in batch['files']):
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    self._delete(conn, cur, batch['trade_ids'])
+        else:
+            self._remove(batch['files'])
+        os.remove(pending)
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            for name in (path, path + '.tmp'):
+                if os.path.exists(name):
+                    os.remove(name)
+
+    def _read(self, name, strategy_id):
+        """
+        Every archived row of a table for one strategy as one arrow table (trades sorted by open_time, trade_id).
+        Files are memory-mapped, and the result is kept until the strategy's set of files changes.
+        """
+        _arrow()
+        files = self._files(name, strategy_id)
+        key = (name, strategy_id)
+        cached = self._tables.get(key)
+        if cached is not None and cached[0] == files:
+            return cached[1]
+
+        if files:
+            directory = self._directory(name, strategy_id)
+            table = pa.concat_tables([pq.read_table(os.path.join(directory, f), memory_map=True) for f in files])
+        else:
+            table = _schema(name).empty_table()
+        if name == 'trades':
+            table = table.sort_by([('open_time', 'ascending'), ('trade_id', 'ascending')])
+        with self._lock:
+            self._tables[key] = (files, table)
+        return table
+
+    def _files(self, name, strategy_id):
+        if self.path is None:
+            return ()
+        try:
+            return tuple(sorted(f for f in os.listdir(self._directory(name, strategy_id)) if f.endswith('.parquet')))
+        except FileNotFoundError:
+            return ()
+
+    def _strategy_ids(self, name):
+        if self.path is None:
+            return []
+        try:
+            entries = os.listdir(os.path.join(self.path, name))
+        except FileNotFoundError:
+            return []
+        return sorted(int(e.split('=', 1)[1]) for e in entries if e.startswith('strategy_id='))
+
+    def _directory(self, name, strategy_id):
+        return os.path.join(self.path, name, f'strategy_id={strategy_id}')
+
+    def _file_path(self, name, strategy_id, batch_id):
+        return os.path.join(self._directory(name, strategy_id), f'{batch_id}.parquet')
+
+    @staticmethod
+    def _timestamp(value):
+        if not isinstance(value, datetime):
+            value = datetime.fromisoformat(str(value))
+        return pa.scalar(value, type=pa.timestamp('us'))
+
+
+if __name__ == '__main__':
+    from src import cold_archive as archive
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    if command == 'status':
+        for name, strategies in archive.status().items():
+            print(f'{name}: {sum(rows for _, _, rows in strategies)} rows')
+            for strategy_id, files, rows in strategies:
+                print(f'  strategy_id={strategy_id:<6} {files} file(s)  {rows} rows')
+    elif command == 'run' and len(sys.argv) == 3:
+        for name, rows in archive.run(date.fromisoformat(sys.argv[2])).items():
+            print(f'{name}: archived {rows} rows')
+    else:
+        print(__doc__)
+        sys.exit(2)
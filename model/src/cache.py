@@ -0,0 +1,179 @@
+# imports
+import collections
+import functools
+import inspect
+import threading
+import time
+
+from src.profiling import profiling
+from src.replicas import note_lag, track_lag
+from src.rollup import PnLRollup
+
+
+class ResultCache():
+    """
+    Bounded LRU cache of DBModel read results, invalidated by a data-version probe rather than by time alone.
+
+    The data version is a handful of single-row index lookups (newest fill, highest trade_id, latest trade close, the
+    strategy table's size and latest termination), so it changes whenever fills, trades or strategies do. It also
+    includes the P&L rollup's watermark and the rolling statistics' progress: both are refreshed lazily and without
+    blocking, so a P&L result read before the rollup caught up with the newest fill is invalidated once it has. The
+    watermark row also carries a counter that ingestion and rebuilds bump when they change daily_pnl behind the
+    watermark, e.g. for a backdated fill that is neither the newest fill nor the highest fill_id. The
+    version is probed at most once per probe_interval seconds per process. An entry computed under an older version
+    is treated as a miss and recomputed, so repeated dashboard polls between two fills cost one probe query instead of
+    the full joins.
+    Entries also expire after ttl seconds, which bounds the staleness of results that depend on the clock (lookbacks,
+    YTD figures) rather than on the data.
+
+    A result computed from a read replica (see src/replicas.py) may predate the data version it is stored under, so it
+    only lives for the replica's lag (at least a second) plus probe_interval, by when the replica has caught up with
+    that version.
+
+    Cached values are shared between requests and must not be modified by callers.
+    """
+
+    def __init__(self, pool, max_entries=1024, ttl=300.0, probe_interval=0.5, enabled=True):
+        self.pool = pool
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.probe_interval = probe_interval
+        self.enabled = enabled
+
+        # key -> (value, data version, expiry, replica lag or None), least recently used first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self._version = None
+        self._probed_at = 0.0
+        # Bumped by clear(), for changes the data version does not see (used in the API's ETags)
+        self.generation = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+        self._probes = 0
+
+    ### READERS ###
+
+    def get_or_compute(self, name, args, compute):
+        """
+        Return the cached result of name(*args) for the current data version, or compute(), store and return it.
+        Requests being profiled always compute.
+        """
+        if not self.enabled or profiling():
+            return compute()
+
+        key = (name, args)
+        version = self.version()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, entry_version, expiry, lag = entry
+                if entry_version == version and expiry > now:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    if lag is not None:
+                        note_lag(lag)
+                    return value
+                if entry_version != version:
+                    self._invalidations += 1
+                else:
+                    self._expirations += 1
+                del self._entries[key]
+            self._misses += 1
+
+        # Computed outside the lock, so a slow query never blocks cache hits for other keys
+        with track_lag() as lag:
+            value = compute()
+        ttl = self.ttl if lag[0] is None else min(self.ttl, max(lag[0], 1.0) + self.probe_interval)
+        with self._lock:
+            self._entries[key] = (value, version, now + ttl, lag[0])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+        return value
+
+    def version(self):
+        """
+        The current data version, probed from the database at most once per probe_interval seconds.
+        """
+        if time.monotonic() - self._probed_at < self.probe_interval:
+            return self._version
+        with self._probe_lock:
+            # Another thread may have probed while this one waited
+            if time.monotonic() - self._probed_at >= self.probe_interval:
+                self._version = self._probe()
+                self._probed_at = time.monotonic()
+                self._probes += 1
+            return self._version
+
+    ### MAINTENANCE ###
+
+    def clear(self):
+        """
+        Drop every entry, e.g. after the P&L rollup was rebuilt without any change to the fill table.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+        self._probed_at = 0.0
+
+    def stats(self):
+        """
+        Snapshot of the cache's size and hit/miss/eviction counters.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'invalidations': self._invalidations,
+                'probes': self._probes,
+            }
+
+    ### HELPERS ###
+
+    def _probe(self):
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    Select (select max(fill_id) from fill),
+                    (select concat(filled_time, '/', fill_id) from fill where filled_time is not null
+                     order by filled_time desc, fill_id desc limit 1),
+                    (select max(trade_id) from trade),
+                    (select max(close_time) from trade),
+                    (select count(*) from strategy),
+                    (select max(termination_date) from strategy),
+                    (select concat(last_filled_time, '/', last_fill_id, '/', version) from rollup_watermark
+                     where rollup_name = %s),
+                    (select concat(max(last_date), '/', max(updated_at)) from rolling_stats_state);
+                    """, (PnLRollup.NAME,))
+                return cur.fetchone()
+
+
+def cached(method):
+    """
+    Decorator for DBModel read methods: serve the result from the model's ResultCache, keyed by the method name and
+    its arguments. Arguments are bound to the method's signature with defaults applied, so that the same call spelled
+    positionally, by keyword or with a default left out shares one entry.
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = tuple(bound.arguments.items())[1:]
+        return self.cache.get_or_compute(method.__name__, key, lambda: method(self, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,460 @@
+"""
+Embedded columnar backend for the analytic scans of DBModel: a DuckDB snapshot of the trade, trade_leg and fill tables.
+
+'sync' brings the snapshot file (COLUMNAR_PATH) up to date: the fills past its (filled_time, fill_id) watermark, and the
+trades and legs that are new, were still open or got new fills, are upserted into a copy of the file, which then
+replaces it. Processes reading the snapshot therefore never see a half-applied sync, and reopen the file once it was
+replaced. The first sync loads everything, including the trades moved to the cold tier (see src/archive.py). Trades
+are never deleted from the snapshot, so archiving them changes nothing; 'rebuild' reloads it all after manual
+corrections or backdated fills, like PnLRollup.rebuild.
+
+DBModel computes the methods listed in COLUMNAR_METHODS from the snapshot: the daily P&L is aggregated from the fills
+(booked like the daily_pnl rollup, see src/rollup.py), the days without P&L are filled in and the statistics aggregates
+are computed, all by DuckDB's vectorized engine instead of MySQL scans and pandas. A snapshot older than the request
+tolerates (COLUMNAR_MAX_AGE seconds, or the request's max_lag, see src/replicas.py) is not used and the method reads
+MySQL. Like a lagging replica, results computed from the snapshot are only cached for as long as its age.
+
+'check' refreshes the rollup and syncs the snapshot, then runs every columnar method and its MySQL counterpart and
+compares the results.
+
+duckdb is only imported by processes that use the snapshot, and is only needed with COLUMNAR_METHODS set.
+
+Usage (from the model/ folder):
+    python -m src.columnar status                 rows and age of the snapshot
+    python -m src.columnar sync                   bring the snapshot up to date (e.g. every minute from cron)
+    python -m src.columnar sync --every 60        keep bringing it up to date every 60 seconds
+    python -m src.columnar rebuild                reload the whole snapshot
+    python -m src.columnar check [strategy ...]   compare the columnar and MySQL results (all active strategies)
+"""
+
+# imports
+import argparse
+import glob
+import os
+import shutil
+import threading
+import time
+import weakref
+from datetime import datetime
+
+import pandas as pd
+
+from src.metrics import InstrumentedSSCursor
+from src.replicas import max_lag, note_lag
+from src.results import ResultSet
+from src.rollup import PnLRollup
+
+# duckdb is imported on first use (see _duckdb), processes that never use the snapshot do not load it
+duckdb = None
+
+# Snapshot table -> (column, DuckDB type), the columns of the MySQL table of the same name
+COLUMNS = {
+    'trade': [('trade_id', 'BIGINT'), ('strategy_id', 'BIGINT'), ('open_time', 'TIMESTAMP'),
+              ('close_time', 'TIMESTAMP')],
+    'trade_leg': [('leg_no', 'BIGINT'), ('trade_id', 'BIGINT'), ('contract', 'VARCHAR'), ('open_time', 'TIMESTAMP'),
+                  ('close_time', 'TIMESTAMP')],
+    'fill': [('fill_id', 'BIGINT'), ('leg_no', 'BIGINT'), ('trade_id', 'BIGINT'), ('contract', 'VARCHAR'),
+             ('qty', 'BIGINT'), ('avg', 'DOUBLE'), ('placement_time', 'TIMESTAMP'), ('filled_time', 'TIMESTAMP'),
+             ('brokerage', 'VARCHAR')],
+}
+PRIMARY_KEYS = {'trade': ('trade_id',), 'trade_leg': ('trade_id', 'leg_no'), 'fill': ('fill_id',)}
+# Snapshot table -> directory of its files in the archive
+ARCHIVE_TABLES = {'trade': 'trades', 'trade_leg': 'trade_legs', 'fill': 'fills'}
+
+# Daily P&L booked like the daily_pnl rollup: sum(qty * avg) * -1 per strategy and day the trade was opened
+DAILY_PNL_VIEW = """
+    create or replace view daily_pnl as
+    select coalesce(trade.strategy_id, 0) as strategy_id, cast(trade.open_time as date) as date,
+    sum(fill.qty * fill.avg) * -1 as pnl, count(*) as fills
+    from fill
+    join trade on fill.trade_id = trade.trade_id
+    group by coalesce(trade.strategy_id, 0), cast(trade.open_time as date)
+    """
+
+# Every calendar day from the first to the last day of daily, with 0 P&L on days without trades (like
+# DBModel._fill_days)
+FILLED_DAYS_QUERY = """
+    with daily as ({daily})
+    select strftime(days.day, '%Y-%m-%d') as date, coalesce(daily.pnl, 0) as pnl
+    from range((select min(date) from daily), (select max(date) from daily) + interval 1 day, interval 1 day)
+    as days(day)
+    left join daily on daily.date = cast(days.day as date)
+    order by days.day
+    """
+
+
+def _duckdb():
+    """
+    Import duckdb into the module globals on first use.
+    """
+    global duckdb
+    if duckdb is None:
+        import duckdb as module
+        duckdb = module
+
+
+def _in(values):
+    return ', '.join(['?'] * len(values))
+
+
+class ColumnarStore():
+    """
+    Reads and maintains the DuckDB snapshot. With path None the snapshot is disabled: it never exists and sync()
+    refuses to run.
+    """
+
+    def __init__(self, pool, path, archive=None, max_age=300.0, batch_rows=50_000):
+        self.pool = pool
+        self.path = path
+        self.archive = archive
+        self.max_age = max_age
+        self.batch_rows = batch_rows
+
+        self._init_state()
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._init_state())
+
+    def _init_state(self):
+        """
+        Start without an open snapshot. Also runs in a forked child, which opens its own connection to the file.
+        """
+        self._lock = threading.Lock()
+        # Read-only connection, the (inode, mtime) of the file it was opened on and the snapshot's sync time
+        self._con = None
+        self._opened = None
+        self._synced_at = None
+
+    ### READERS ###
+
+    def fresh(self):
+        """
+        Whether the snapshot exists and is no older than the current request tolerates. Its age is reported to the
+        result cache (see src/replicas.py) when it is.
+        """
+        if self._connection() is None:
+            return False
+        age = max(time.time() - self._synced_at, 0.0)
+        tolerance = self.max_age if max_lag.get() is None else max_lag.get()
+        if age > tolerance:
+            return False
+        note_lag(age)
+        return True
+
+    def daily_pnl(self, strategy_id=None):
+        """
+        Daily P&L of the whole portfolio, or of one strategy, with every calendar day from the first to the last day
+        with P&L. A ResultSet with the columns date ('YYYY-MM-DD') and pnl, like DBModel.get_daily_pnl.
+        """
+        where = '' if strategy_id is None else 'where strategy_id = ?'
+        daily = f'select date, sum(pnl) as pnl from daily_pnl {where} group by date'
+        return self._query(FILLED_DAYS_QUERY.format(daily=daily), () if strategy_id is None else (strategy_id,))
+
+    def strategies_pnl(self, strategy_ids):
+        """
+        Daily P&L of several strategies without filling in days, a ResultSet with the columns strategy_id, date and
+        pnl ordered by strategy and date.
+        """
+        return self._query(f"""
+            Select strategy_id, date, pnl
+            from daily_pnl
+            where strategy_id in ({_in(strategy_ids)})
+            order by strategy_id, date;
+            """, tuple(strategy_ids))
+
+    def statistics_aggregates(self, strategy_ids, year_start):
+        """
+        Per-strategy sums the statistics are computed from, as a DataFrame with the columns strategy_id, cum_pnl,
+        pnl_sq, ytd_pnl, first and last (dates of the first and last day with P&L), ordered by strategy.
+        """
+        with self._cursor() as cur:
+            return cur.execute(f"""
+                Select strategy_id, sum(pnl) as cum_pnl, sum(pnl * pnl) as pnl_sq,
+                sum(case when date >= ? then pnl else 0 end) as ytd_pnl,
+                cast(min(date) as timestamp) as first, cast(max(date) as timestamp) as last
+                from daily_pnl
+                where strategy_id in ({_in(strategy_ids)})
+                group by strategy_id
+                order by strategy_id;
+                """, (year_start.date(), *strategy_ids)).fetchdf()
+
+    def trade_counts(self, strategy_ids):
+        """
+        {strategy_id: trade count} of the given strategies, archived trades included.
+        """
+        with self._cursor() as cur:
+            return dict(cur.execute(f"""
+                Select strategy_id, count(*)
+                from trade
+                where strategy_id in ({_in(strategy_ids)})
+                group by strategy_id;
+                """, tuple(strategy_ids)).fetchall())
+
+    def status(self):
+        """
+        Rows per table and age of the snapshot, None without a snapshot.
+        """
+        if self._connection() is None:
+            return None
+        with self._cursor() as cur:
+            status = {name: cur.execute(f'select count(*) from {name}').fetchone()[0] for name in COLUMNS}
+            status['watermark'] = cur.execute('select last_filled_time, last_fill_id from snapshot_state').fetchone()
+        status['age_seconds'] = round(time.time() - self._synced_at, 1)
+        return status
+
+    ### MAINTENANCE ###
+
+    def sync(self, rebuild=False):
+        """
+        Bring the snapshot up to date with MySQL, or reload it from scratch with rebuild. Returns {table: rows
+        upserted}.
+        """
+        if self.path is None:
+            raise Exception('Error syncing the columnar snapshot: it is disabled (COLUMNAR_PATH is None)')
+        _duckdb()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        working = f'{self.path}.{os.getpid()}.tmp'
+        if os.path.exists(self.path) and not rebuild:
+            shutil.copyfile(self.path, working)
+        elif os.path.exists(working):
+            os.remove(working)
+
+        started = time.time()
+        try:
+            con = duckdb.connect(working)
+            try:
+                counts = self._sync(con, started)
+                con.execute('checkpoint')
+            finally:
+                con.close()
+            os.replace(working, self.path)
+        finally:
+            if os.path.exists(working):
+                os.remove(working)
+        return counts
+
+    ### HELPERS ###
+
+    def _connection(self):
+        """
+        The read-only connection to the current snapshot file, reopened after a sync replaced it. None without one.
+        """
+        if self.path is None:
+            return None
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        opened = (stat.st_ino, stat.st_mtime_ns)
+        if self._opened == opened:
+            return self._con
+        _duckdb()
+        with self._lock:
+            if self._opened != opened:
+                # Attached to a new in-memory database rather than opened by path, which DuckDB would resolve to the
+                # database instance it already has for the replaced file. Cursors on the previous connection still in
+                # use keep it open until they are done
+                con = duckdb.connect()
+                con.execute(f"attach '{self.path.replace(chr(39), chr(39) * 2)}' as snapshot (read_only)")
+                self._synced_at = con.execute('select synced_at from snapshot.snapshot_state').fetchone()[0]
+                self._con, self._opened = con, opened
+            return self._con
+
+    def _cursor(self):
+        """
+        A cursor (DuckDB's per-thread connection) on the current snapshot, which each cursor has to select itself.
+        """
+        con = self._connection()
+        if con is None:
+            raise Exception('There is no columnar snapshot, run python -m src.columnar sync')
+        cur = con.cursor()
+        cur.execute('use snapshot')
+        return cur
+
+    def _query(self, query, args):
+        with self._cursor() as cur:
+            cur.execute(query, args)
+            return ResultSet.from_cursor(cur)
+
+    def _sync(self, con, started):
+        for name, columns in COLUMNS.items():
+            keys = ', '.join(PRIMARY_KEYS[name])
+            con.execute(f"create table if not exists {name} ("
+                        f"{', '.join(f'{column} {kind}' for column, kind in columns)}, primary key ({keys}))")
+        con.execute('create table if not exists snapshot_state (last_filled_time timestamp, last_fill_id bigint, '
+                    'synced_at double)')
+        con.execute(DAILY_PNL_VIEW)
+        state = con.execute('select last_filled_time, last_fill_id from snapshot_state').fetchone()
+
+        counts = {name: 0 for name in COLUMNS}
+        if state is None:
+            for name in COLUMNS:
+                counts[name] += self._load_archive(con, name)
+
+        conn = self.pool.acquire()
+        finished = False
+        try:
+            with conn.cursor() as cur:
+                high = PnLRollup._high_watermark(cur)
+            if state is None:
+                # Everything up to the watermark, fills landing meanwhile are left for the next sync
+                fills = ('where filled_time <= %s and (filled_time < %s or fill_id <= %s)', (high[0], high[0], high[1])
+                         ) if high is not None else ('where false', ())
+                counts['fill'] += self._copy(conn, con, 'fill', *fills)
+                counts['trade'] += self._copy(conn, con, 'trade', '', ())
+                counts['trade_leg'] += self._copy(conn, con, 'trade_leg', '', ())
+            else:
+                counts.update(self._sync_changes(conn, con, state, high))
+            finished = True
+        finally:
+            self.pool.release(conn, discard=not finished)
+
+        watermark = high if high is not None and (state is None or state[0] is None or high > state) else state
+        con.execute('delete from snapshot_state')
+        con.execute('insert into snapshot_state values (?, ?, ?)',
+                    (watermark[0] if watermark else None, watermark[1] if watermark else None, started))
+        return counts
+
+    def _sync_changes(self, conn, con, state, high):
+        """
+        Upsert the fills past the snapshot's watermark, then the trades that are new, were open in the snapshot or got
+        one of those fills, and their legs.
+        """
+        counts = {}
+        low = state
+        if high is not None and (low[0] is None or high > low):
+            fill_range = ('filled_time <= %s and (filled_time < %s or fill_id <= %s)'
+                          + ('' if low[0] is None else ' and filled_time >= %s and (filled_time > %s or fill_id > %s)'))
+            fill_args = (high[0], high[0], high[1]) + (() if low[0] is None else (low[0], low[0], low[1]))
+        else:
+            fill_range, fill_args = 'false', ()
+        counts['fill'] = self._copy(conn, con, 'fill', f'where {fill_range}', fill_args)
+
+        last_trade_id = con.execute('select coalesce(max(trade_id), 0) from trade').fetchone()[0]
+        open_ids = [row[0] for row in con.execute('select trade_id from trade where close_time is null').fetchall()]
+        where = f'where trade_id > %s or trade_id in (select trade_id from fill where {fill_range})'
+        args = (last_trade_id,) + fill_args
+        if open_ids:
+            where += f' or trade_id in ({", ".join(["%s"] * len(open_ids))})'
+            args += tuple(open_ids)
+        trade_ids = []
+        counts['trade'] = self._copy(conn, con, 'trade', where, args, collect=trade_ids)
+
+        counts['trade_leg'] = 0
+        for start in range(0, len(trade_ids), 1000):
+            chunk = trade_ids[start:start + 1000]
+            counts['trade_leg'] += self._copy(conn, con, 'trade_leg',
+                                              f'where trade_id in ({", ".join(["%s"] * len(chunk))})', tuple(chunk))
+        return counts
+
+    def _copy(self, conn, con, name, where, args, collect=None):
+        """
+        Upsert the rows of a MySQL table matching where into the snapshot, batch_rows at a time through an unbuffered
+        cursor. The first column of every row is appended to collect, if given. Returns the rows copied.
+        """
+        columns = [column for column, _ in COLUMNS[name]]
+        cur = conn.cursor(InstrumentedSSCursor)
+        try:
+            cur.execute(f'select {", ".join(columns)} from {name} {where}', args)
+            copied = 0
+            while True:
+                rows = cur.fetchmany(self.batch_rows)
+                if not rows:
+                    break
+                con.register('batch', pd.DataFrame.from_records(rows, columns=columns))
+                con.execute(f'insert or replace into {name} select * from batch')
+                con.unregister('batch')
+                if collect is not None:
+                    collect.extend(row[0] for row in rows)
+                copied += len(rows)
+            return copied
+        finally:
+            cur.close()
+
+    def _load_archive(self, con, name):
+        """
+        Load a table's archived rows, which MySQL no longer has, into an empty snapshot.
+        """
+        if self.archive is None or self.archive.path is None:
+            return 0
+        pattern = os.path.join(self.archive.path, ARCHIVE_TABLES[name], 'strategy_id=*', '*.parquet')
+        if not glob.glob(pattern):
+            return 0
+        columns = [column for column, _ in COLUMNS[name]]
+        before = con.execute(f'select count(*) from {name}').fetchone()[0]
+        con.execute(f"insert or replace into {name} select {', '.join(columns)} "
+                    f"from read_parquet(?, hive_partitioning = true)", (pattern,))
+        return con.execute(f'select count(*) from {name}').fetchone()[0] - before
+
+
+### PARITY CHECK ###
+
+def _same(columnar, mysql):
+    """
+    Whether two ResultSets hold the same rows, floats compared with a relative tolerance of 1e-9 (the engines sum in
+    different orders).
+    """
+    if columnar.columns != mysql.columns or len(columnar) != len(mysql):
+        return False
+    for column in columnar.columns:
+        a, b = pd.Series(columnar[column]), pd.Series(mysql[column])
+        if pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+            if not ((a - b).abs() <= 1e-9 * b.abs().clip(lower=1)).all():
+                return False
+        elif [None if pd.isna(x) else x for x in a] != [None if pd.isna(x) else x for x in b]:
+            return False
+    return True
+
+
+def check(strategies):
+    """
+    Run every columnar method and its MySQL counterpart on freshly synced data. Returns [(call, same)].
+    """
+    from src.cache import ResultCache
+    from src.db_model import COLUMNAR_CAPABLE, DBModel
+
+    mysql, columnar = DBModel(), DBModel()
+    for model in (mysql, columnar):
+        model.cache = ResultCache(model.pool, enabled=False)
+    mysql.columnar_methods = ()
+    columnar.columnar_methods = COLUMNAR_CAPABLE
+    # Compare both engines at the same point: everything up to the rollup's watermark
+    mysql.pnl_rollup.refresh()
+    columnar.columnar.sync()
+
+    names = strategies or [mysql.strategies.name(sid) for sid in mysql.strategies.active_ids()]
+    calls = [('get_daily_pnl', ()), ('get_strategies_pnl', ('*',)), ('get_strategies_statistics', ('*',))]
+    calls += [('get_strategy_pnl', (name,)) for name in names]
+    calls += [('get_strategies_statistics', (tuple(names),))]
+    token = max_lag.set(float('inf'))
+    try:
+        return [(f'{method}{args}', _same(getattr(columnar, method)(*args), getattr(mysql, method)(*args)))
+                for method, args in calls]
+    finally:
+        max_lag.reset(token)
+
+
+if __name__ == '__main__':
+    from src import columnar_store as store
+
+    parser = argparse.ArgumentParser(description='Maintain and check the columnar snapshot.')
+    parser.add_argument('command', choices=['status', 'sync', 'rebuild', 'check'])
+    parser.add_argument('strategies', nargs='*', help='strategies to check (default: all active strategies)')
+    parser.add_argument('--every', type=float, help='sync: keep syncing every this many seconds')
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        print(store.status() or 'There is no columnar snapshot')
+    elif args.command in ('sync', 'rebuild'):
+        while True:
+            start = time.perf_counter()
+            counts = store.sync(rebuild=args.command == 'rebuild')
+            print(f'{datetime.now():%Y-%m-%d %H:%M:%S} synced in {time.perf_counter() - start:.1f} s: '
+                  + ', '.join(f'{name} {rows} rows' for name, rows in counts.items()))
+            if args.command == 'rebuild' or args.every is None:
+                break
+            time.sleep(max(args.every - (time.perf_counter() - start), 0))
+    else:
+        results = check(args.strategies)
+        for call, same in results:
+            print(f'{"ok  " if same else "DIFF"}  {call}')
+        raise SystemExit(0 if all(same for _, same in results) else 1)
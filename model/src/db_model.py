@@ -1,18 +1,109 @@
 # imports
-from src import db
+from src import (cold_archive, columnar_store, db_pool, lot_ledger, pnl_rollup, position_book, replica_router,
+                 result_cache, rolling_stats, strategy_registry)
+from src.archive import ParquetArchive
+from src.cache import ResultCache, cached
+from src.ingest import insert_statement
+from src.settings import COLUMNAR_METHODS
+from src.lots import LOT_KEYS, LOT_METHODS, LotLedger
+from src.metrics import InstrumentedSSCursor, instrumented
+from src.profiling import section
+from src.replicas import ReplicaRouter
+from contextlib import contextmanager
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
+from src.results import ResultSet
+from src.positions import PositionBook
+from src.registry import StrategyRegistry
+from src.rollup import PnLRollup
+from src.rolling import RollingStatistics
+import contextvars
+import heapq
+import time
+import numpy as np
+import pymysql
 import pandas as pd
 
 
+# Stats returned by get_strategy_statistics / get_strategies_statistics, in order
+STATISTICS_COLUMNS = ['cumulative_pnl', 'ytd_pnl', 'avg_annual_return', 'avg_daily_return', 'avg_daily_trades',
+                      'sharpe']
+# Methods that can be computed from the columnar snapshot (see src/columnar.py), selected with COLUMNAR_METHODS
+COLUMNAR_CAPABLE = ('get_daily_pnl', 'get_strategy_pnl', 'get_strategies_pnl', 'get_strategies_statistics')
+# time.monotonic() after which the current context's queries are cut off by MySQL, None for no limit (see query_deadline)
+_query_deadline = contextvars.ContextVar('query_deadline', default=None)
+
+
+@contextmanager
+def query_deadline(deadline):
+    """
+    Bound the SELECT statements DBModel runs inside the block to end by deadline (a time.monotonic() value), e.g. for
+    work whose caller stops waiting then. Each statement gets the remaining time as its MySQL max_execution_time, so a
+    query still running at the deadline is interrupted and its connection returned to the pool.
+    """
+    token = _query_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _query_deadline.reset(token)
+
+
+@instrumented
 class DBModel():
     """
     Model for methods that interface with the database connection.
     Deployment: AWS RDS: MySQL
+    Tabular read methods return a ResultSet (see src/results.py), which the routes serialize as rows or columns.
+    Analytic reads (P&L, statistics, historical trades) may be served by a read replica, see src/replicas.py; writes
+    and freshness-sensitive reads always use the primary. The methods in COLUMNAR_METHODS are computed from the
+    columnar snapshot instead when it is recent enough, see src/columnar.py.
     """
 
-    def __init__(self):
-        self.cur = db.cursor()
+    def __init__(self, pool=None):
+        # Connections are checked out of the pool per method call, so one DBModel can serve concurrent requests
+        self.pool = pool if pool is not None else db_pool
+        self.replicas = replica_router if pool is None else ReplicaRouter(pool)
+        self.archive = cold_archive if pool is None else ParquetArchive(pool, None)
+        self.pnl_rollup = pnl_rollup if pool is None else PnLRollup(pool)
+        self.rolling = rolling_stats if pool is None else RollingStatistics(pool, self.pnl_rollup)
+        self.position_book = position_book if pool is None else PositionBook(pool)
+        self.cache = result_cache if pool is None else ResultCache(pool, enabled=False)
+        self.strategies = strategy_registry if pool is None else StrategyRegistry(pool)
+        self.lots = lot_ledger if pool is None else LotLedger(pool)
+        self.columnar = columnar_store if pool is None else None
+        self.columnar_methods = tuple(COLUMNAR_METHODS)
+
+    @contextmanager
+    def _cursor(self, analytic=False):
+        """
+        Check a connection out of the pool and yield a cursor on it. The connection is returned when the block exits.
+        Analytic reads, which can tolerate some replication lag, get a connection to a read replica when one is healthy
+        and close enough to the primary. Inside query_deadline, the session's max_execution_time is set to the time left
+        and restored before the connection goes back to the pool.
+        """
+        deadline = _query_deadline.get()
+        with (self.replicas if analytic else self.pool).connection() as conn:
+            with conn.cursor() as cur:
+                if deadline is None:
+                    yield cur
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError('Query deadline passed before the query started')
+                cur.execute('set session max_execution_time = %s', (max(1, int(remaining * 1000)),))
+                try:
+                    yield cur
+                finally:
+                    cur.execute('set session max_execution_time = default')
+
+    def _columnar(self, method):
+        """
+        The columnar store if method is to be computed from the columnar snapshot and the snapshot is recent enough for
+        this request, else None.
+        """
+        if self.columnar is None or method not in self.columnar_methods or not self.columnar.fresh():
+            return None
+        return self.columnar
 
     ### HOME PAGE ###
 
@@ -33,81 +124,63 @@ class DBModel():
             "launch_date": "2021-01-01 00:00:00",
             "termination_date": None
         }
+        Served from the in-memory strategy registry (see src/registry.py).
         """
-
         try:
             if strategy == '*':
-                self.cur.execute(f'select * from strategy')
+                columns, rows = self.strategies.rows()
             else:
-                self.cur.execute(
-                    f'select * from strategy where strategy_name = "{strategy}"')
+                columns, rows = self.strategies.rows(self.strategies.ids([strategy]))
         except Exception as e:
             raise Exception(f'Error retrieving strategy information: {e}')
 
-        col_headers = [x[0] for x in self.cur.description]
-        json_data = []
-        the_data = self.cur.fetchall()
-        for row in the_data:
-            json_data.append(dict(zip(col_headers, row)))
-        return json_data
+        return ResultSet.from_rows(columns, rows)
 
+    @cached
     def get_daily_pnl(self):
         """
-        Method to get all daily P&L across the entire portfolio. Data requires further cleaning in the strategy api method.
+        Method to get all daily P&L across the entire portfolio. Reads the daily_pnl rollup (see src/rollup.py), which is
+        brought up to date with any new fills first. Days without any P&L are filled in with 0.
         """
+        store = self._columnar('get_daily_pnl')
+        if store is not None:
+            try:
+                return store.daily_pnl()
+            except Exception as e:
+                raise Exception(f'Error retrieving daily P&L from the columnar snapshot: {e}')
+
         try:
-            self.cur.execute("""
-                Select trade.open_time as date, sum(fill.qty * fill.avg) * -1 as pnl
-                from trade
-                join trade_leg on trade.trade_id = trade_leg.trade_id
-                join fill on trade_leg.leg_no = fill.leg_no and trade_leg.trade_id = fill.trade_id
-                group by trade.open_time
-                order by trade.open_time;
-                """)
+            self.pnl_rollup.maybe_refresh()
         except Exception as e:
-            raise Exception(f'Error retrieving strategy information: {e}')
+            raise Exception(f'Error refreshing the daily P&L rollup: {e}')
 
-        col_headers = [x[0] for x in self.cur.description]
-        json_data = []
-        the_data = self.cur.fetchall()
-        for row in the_data:
-            json_data.append(dict(zip(col_headers, row)))
-        try:
-            json_data_c = json_data.copy()
-            # Error with pd.Dataframe - need to pass a list of lists not a list of dicts
-            df = pd.DataFrame(json_data_c)
-            df['date'] = pd.to_datetime(df['date'])
-            df = df.set_index('date')
-            df = df.groupby(pd.Grouper(freq='D')).sum()
-            df = df.reset_index()
-            df['date'] = df['date'].dt.strftime('%Y-%m-%d')
-            col_headers = [x for x in df.columns]
-            json_data2 = []
-            for entry in df.values:
-                json_data2.append(dict(zip(col_headers, entry)))
-            return json_data2
-        except:
-            return json_data
+        with self._cursor(analytic=True) as cur:
+            try:
+                cur.execute("""
+                    Select date, sum(pnl) as pnl
+                    from daily_pnl
+                    group by date
+                    order by date;
+                    """)
+            except Exception as e:
+                raise Exception(f'Error retrieving strategy information: {e}')
+
+            result = ResultSet.from_cursor(cur)
+        return self._fill_days(result)
 
     def get_active_strategies(self):
         """
         Get a list of all active strategies. An active strategy is defined as one that is currently running on an EC2.
-        Returns all attributes of the strategy table.
+        Returns all attributes of the strategy table, served from the in-memory strategy registry.
         """
-
         try:
-            self.cur.execute(
-                f'select * from strategy where termination_date is null')
+            columns, rows = self.strategies.rows(self.strategies.active_ids())
         except Exception as e:
             raise Exception(f'Error retrieving strategy information: {e}')
 
-        col_headers = [x[0] for x in self.cur.description]
-        json_data = []
-        the_data = self.cur.fetchall()
-        for row in the_data:
-            json_data.append(dict(zip(col_headers, row)))
-        return json_data
+        return ResultSet.from_rows(columns, rows)
 
+    @cached
     def get_strategy_statistics(self, strategy):
         """
         Method to get a strategy's performance stats. Stats will be exclusive of all open trades.
@@ -121,71 +194,289 @@ class DBModel():
         Average Trades per Day: <Average Count of Trades per Day (trading days)>
         Sharpe: <Cumulative Sharpe Ratio of Strategy>
         ---------------------------------------
+        Computed by get_strategies_statistics for a single strategy.
+        """
+        stats = self.get_strategies_statistics((strategy,))
+        if len(stats) == 0:
+            raise Exception(f'Error converting strategy information to JSON: no P&L for strategy {strategy}')
+        return {col: stats.first(col) for col in STATISTICS_COLUMNS}
+
+    @cached
+    def get_strategies_statistics(self, strategies):
         """
+        Method to get the performance stats of many strategies at once, where strategies is a tuple of strategy names or
+        '*' for all active strategies. Costs one P&L query and one trade count query whatever the number of strategies;
+        the stats are computed for all strategies together with a pandas groupby.
+        Returns a ResultSet with one row per strategy (that has any P&L) and the columns strategy_name, strategy_id and
+        the get_strategy_statistics stats. Stats that are undefined (e.g. with a single day of P&L) are None.
+        With the columnar snapshot the per-strategy sums and the trade counts are computed by DuckDB instead.
+        """
+        store = self._columnar('get_strategies_statistics')
+        if store is not None:
+            try:
+                ids = self._strategy_ids(strategies)
+                year_start = datetime.now().replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+                g = store.statistics_aggregates(ids, year_start) if ids else None
+                if g is None or len(g) == 0:
+                    return ResultSet.from_rows(['strategy_name', 'strategy_id'] + STATISTICS_COLUMNS, [])
+                g.insert(1, 'strategy_name', [self.strategies.name(sid) for sid in g['strategy_id'].tolist()])
+                trade_counts = store.trade_counts(ids)
+            except Exception as e:
+                raise Exception(f'Error retrieving strategy statistics from the columnar snapshot: {e}')
+            try:
+                return self._statistics(g, trade_counts)
+            except Exception as e:
+                raise Exception(f'Error converting strategy information to JSON: {e}')
 
-        # First, get the pnl information for statistics
+        # First, get the pnl information and the trade counts for statistics
         try:
-            strategy_pnl_json = self.get_strategy_pnl(strategy)
+            pnl = self.get_strategies_pnl(strategies).to_frame()
+            ids = self._strategy_ids(strategies)
+            trade_counts = {}
+            if ids:
+                with self._cursor(analytic=True) as cur:
+                    cur.execute(f"""
+                        Select trade.strategy_id, count(*)
+                        from trade
+                        where trade.strategy_id in ({", ".join(["%s"] * len(ids))})
+                        group by trade.strategy_id;
+                        """, tuple(ids))
+                    trade_counts = dict(cur.fetchall())
+                for strategy_id, count in self.archive.trade_counts(ids).items():
+                    trade_counts[strategy_id] = trade_counts.get(strategy_id, 0) + count
         except Exception as e:
             raise Exception(f'Error retrieving strategy information: {e}')
 
-        # Now, calculate the statistics
+        # Now, calculate the statistics for every strategy in one pass
         try:
-            df = pd.DataFrame(strategy_pnl_json)
-            cum_pnl = df['PNL'].sum()
-            ytd_pnl = df[df['date'] >= datetime.now().replace(
-                month=1, day=1, hour=0, minute=0, second=0, microsecond=0)].sum()['PNL']
-            days = (df['date'].max() - df['date'].min()).days
-            years = (df['date'].max() - df['date'].min()).days / 365
-            avg_annual_return = (cum_pnl / years)
-            avg_daily_return = (cum_pnl / days)
-            avg_trades_per_day = df['PNL'].count(
-            ) / (df['date'].max() - df['date'].min()).days
-            sharpe = cum_pnl / df['PNL'].std()
-
-            r_json = {
-                'cumulative_pnl': round(cum_pnl, 2),
-                'ytd_pnl': round(ytd_pnl, 2),
-                'avg_annual_return': round(avg_annual_return, 2),
-                'avg_daily_return': round(avg_daily_return, 2),
-                'avg_daily_trades': round(avg_trades_per_day, 2),
-                'sharpe': round(sharpe, 2)
-            }
+            if len(pnl) == 0:
+                return ResultSet.from_rows(['strategy_name', 'strategy_id'] + STATISTICS_COLUMNS, [])
+            with section('pandas: statistics groupby'):
+                pnl['date'] = pd.to_datetime(pnl['date'])
+                pnl['pnl'] = pnl['pnl'].astype('float64')
+                pnl['pnl_sq'] = pnl['pnl'] ** 2
+                year_start = datetime.now().replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+                pnl['ytd_pnl'] = pnl['pnl'].where(pnl['date'] >= year_start, 0.0)
+                g = pnl.groupby(['strategy_id', 'strategy_name'], sort=False).agg(
+                    cum_pnl=('pnl', 'sum'), pnl_sq=('pnl_sq', 'sum'), ytd_pnl=('ytd_pnl', 'sum'),
+                    first=('date', 'min'), last=('date', 'max')).reset_index()
 
-            return r_json
+            return self._statistics(g, trade_counts)
         except Exception as e:
             raise Exception(
                 f'Error converting strategy information to JSON: {e}')
 
+    def get_top_of_book(self):
+        """
+        Method to get the top of the book: every open position across the portfolio, served from the in-memory
+        position book (see src/positions.py).
+        Output will come in the format:
+        ---------------------------------------
+        {
+            "capital_usage": <Aggregate Value of All Open Trades>,
+            "active_trades": <Count of All Open Trades>,
+            "strategies": [{"strategy_id", "strategy_name", "active_trades", "capital_usage"}, ...],
+            "positions": [{"contract", "net_qty", "capital_usage", "legs"}, ...],
+            "as_of": <filled_time of the Newest Fill in the Book>
+        }
+        ---------------------------------------
+        """
+        try:
+            self.position_book.maybe_refresh()
+        except Exception as e:
+            raise Exception(f'Error refreshing the position book: {e}')
+        return self.position_book.top_of_book()
+
     ### STRAGEGY PAGE ###
 
+    def get_strategy_status(self, strategy: str):
+        """
+        Method to get the current status of a strategy: its id from the DB, and its open trade count and capital usage
+        from the in-memory position book.
+        Output will come in the format:
+        ---------------------------------------
+        {
+            "strategy_name": <Strategy Name>,
+            "strategy_id": <Strategy ID>,
+            "active_trades": <Count of All Open Trades>,
+            "capital_usage": <Aggregate Value of All Open Trades>,
+            "running_on": <AWS EC2 HostName>
+        }
+        ---------------------------------------
+        """
+        strategy_info = self.get_strategy_info(strategy)
+        s_id = strategy_info.first('strategy_id', 0)
+        position = self.get_strategy_position(s_id) if len(strategy_info) else {'active_trades': 0, 'capital_usage': 0}
+        return {
+            'strategy_name': strategy,
+            'strategy_id': s_id,
+            'active_trades': position['active_trades'],
+            'capital_usage': position['capital_usage'],
+            'running_on': 'unknown',
+        }
+
+    def get_strategy_position(self, strategy_id: int):
+        """
+        Method to get the open trade count and capital usage of a strategy from the in-memory position book.
+        Returns a dict with the keys active_trades and capital_usage.
+        """
+        try:
+            self.position_book.maybe_refresh()
+        except Exception as e:
+            raise Exception(f'Error refreshing the position book: {e}')
+        return self.position_book.strategy_summary(strategy_id)
+
+    @cached
     def get_strategy_pnl(self, strategy):
         """
-        Method to get all daily P&L across the life of a strategy. Data requires further cleaning in the strategy api method.
+        Method to get all daily P&L across the life of a strategy. Reads the daily_pnl rollup (see src/rollup.py), which is
+        brought up to date with any new fills first. Days without any P&L are filled in with 0.
         """
+        store = self._columnar('get_strategy_pnl')
+        if store is not None:
+            try:
+                return store.daily_pnl(self.strategies.strategy_id(strategy))
+            except Exception as e:
+                raise Exception(f'Error retrieving daily P&L from the columnar snapshot: {e}')
+
+        try:
+            self.pnl_rollup.maybe_refresh()
+        except Exception as e:
+            raise Exception(f'Error refreshing the daily P&L rollup: {e}')
 
         # Next, get the pnl information
+        with self._cursor(analytic=True) as cur:
+            try:
+                cur.execute("""
+                    Select daily_pnl.date as date, sum(daily_pnl.pnl) as pnl
+                    from daily_pnl
+                    where daily_pnl.strategy_id = %s
+                    group by daily_pnl.date
+                    order by daily_pnl.date;
+                    """, (self.strategies.strategy_id(strategy),))
+            except Exception as e:
+                raise Exception(f'Error retrieving strategy information: {e}')
+
+            result = ResultSet.from_cursor(cur)
+        return self._fill_days(result)
+
+    def get_strategy_lot_pnl(self, strategy: str, method='fifo', by='leg', marks=None):
+        """
+        Method to get a strategy's P&L from matching its closing fills against the lots they close (see src/lots.py),
+        FIFO or at average cost, per trade leg or per contract across trades. Unlike get_strategy_pnl, realized P&L is
+        booked on the day a lot is closed, and open lots are valued against marks (a dict of contract -> price).
+        Output will come in the format:
+        ---------------------------------------
+        {
+            "realized": ResultSet with the columns date and pnl, one row per day with closes,
+            "unrealized": ResultSet with the columns contract, qty, avg_price, mark and unrealized_pnl, one row per
+                contract with open lots (mark and unrealized_pnl are None without a mark for the contract),
+            "realized_pnl": <Total Realized P&L>,
+            "unrealized_pnl": <Total Unrealized P&L of the Marked Contracts>
+        }
+        ---------------------------------------
+        """
+        if method not in LOT_METHODS or by not in LOT_KEYS:
+            raise ValueError(f'method must be one of {", ".join(LOT_METHODS)} and by one of {", ".join(LOT_KEYS)}')
         try:
-            self.cur.execute(f"""
-                Select trade.open_time as date, sum(fill.qty * fill.avg) * -1 as pnl
-                from trade
-                join trade_leg on trade.trade_id = trade_leg.trade_id
-                join fill on trade_leg.leg_no = fill.leg_no and trade_leg.trade_id = fill.trade_id
-                join strategy on trade.strategy_id = strategy.strategy_id
-                where strategy.strategy_name = "{strategy}"
-                group by trade.open_time
-                order by trade.open_time;
-                """)
+            realized, lots = self.lots.pnl(self.strategies.strategy_id(strategy), method, by)
         except Exception as e:
-            raise Exception(f'Error retrieving strategy information: {e}')
+            raise Exception(f'Error matching lots: {e}')
+
+        marks = marks or {}
+        positions = {}
+        for contract, qty, price, _ in lots:
+            total_qty, cost = positions.get(contract, (0, 0.0))
+            positions[contract] = (total_qty + qty, cost + qty * price)
+        unrealized = []
+        for contract, (qty, cost) in sorted(positions.items(), key=lambda item: str(item[0])):
+            mark = marks.get(contract)
+            value = round(qty * mark - cost, 2) if mark is not None else None
+            unrealized.append((contract, qty, round(cost / qty, 6) if qty else None, mark, value))
+
+        return {
+            'realized': ResultSet.from_rows(['date', 'pnl'], [(day, round(pnl, 2)) for day, pnl in realized]),
+            'unrealized': ResultSet.from_rows(['contract', 'qty', 'avg_price', 'mark', 'unrealized_pnl'], unrealized),
+            'realized_pnl': round(sum(pnl for _, pnl in realized), 2),
+            'unrealized_pnl': round(sum(row[4] for row in unrealized if row[4] is not None), 2),
+        }
+
+    @cached
+    def get_strategy_rolling_stats(self, strategy: str, since=None, series=True):
+        """
+        Method to get a strategy's running statistics, maintained incrementally day by day (see src/rolling.py): mean,
+        volatility and Sharpe ratio over its whole history and over the last 20, 60 and 252 days, equity and drawdown.
+        Volatility and Sharpe are annualized over 252 trading days, and only closed days (before today) are included.
+        Output will come in the format:
+        ---------------------------------------
+        {
+            "current": {"as_of", "days", "cumulative_pnl", "mean", "volatility", "sharpe", "peak", "drawdown",
+                        "max_drawdown", "max_drawdown_date", "windows": {"20": {"volatility", "sharpe"}, ...}},
+            "series": ResultSet with the columns date, pnl, equity, drawdown, mean, volatility, sharpe and
+                volatility_<w> / sharpe_<w> for each window, one row per day from since (a date) on
+        }
+        ---------------------------------------
+        "current" is None for a strategy without closed days, and "series" is left out unless series is true.
+        Window values are None until the strategy has a full window of days.
+        """
+        try:
+            self.rolling.maybe_refresh()
+        except Exception as e:
+            raise Exception(f'Error refreshing the rolling statistics: {e}')
+
+        strategy_id = self.strategies.strategy_id(strategy)
+        try:
+            result = {'current': self.rolling.current(strategy_id)}
+            if series:
+                result['series'] = ResultSet.from_rows(*self.rolling.series(strategy_id, since))
+        except Exception as e:
+            raise Exception(f'Error retrieving rolling statistics: {e}')
+        return result
+
+    def get_strategies_pnl(self, strategies):
+        """
+        Method to get the daily P&L of several strategies in one query, where strategies is a list of strategy names or
+        '*' for all active strategies. Unlike get_strategy_pnl, days without P&L are not filled in.
+        Returns a ResultSet with the columns strategy_id, strategy_name, date and pnl, ordered by strategy and date.
+        """
+        store = self._columnar('get_strategies_pnl')
+        if store is None:
+            try:
+                self.pnl_rollup.maybe_refresh()
+            except Exception as e:
+                raise Exception(f'Error refreshing the daily P&L rollup: {e}')
+
+        ids = self._strategy_ids(strategies)
+        if len(ids) == 0:
+            return ResultSet.from_rows(['strategy_id', 'strategy_name', 'date', 'pnl'], [])
 
-        col_headers = [x[0] for x in self.cur.description]
-        json_data = []
-        the_data = self.cur.fetchall()
-        for row in the_data:
-            json_data.append(dict(zip(col_headers, row)))
-        return json_data
+        if store is not None:
+            try:
+                result = store.strategies_pnl(ids)
+            except Exception as e:
+                raise Exception(f'Error retrieving daily P&L from the columnar snapshot: {e}')
+        else:
+            with self._cursor(analytic=True) as cur:
+                try:
+                    cur.execute(f"""
+                        Select daily_pnl.strategy_id as strategy_id, daily_pnl.date as date, daily_pnl.pnl as pnl
+                        from daily_pnl
+                        where daily_pnl.strategy_id in ({", ".join(["%s"] * len(ids))})
+                        order by daily_pnl.strategy_id, daily_pnl.date;
+                        """, tuple(ids))
+                except Exception as e:
+                    raise Exception(f'Error retrieving strategy information: {e}')
+
+                result = ResultSet.from_cursor(cur)
+
+        # Names come from the registry instead of a join, looked up once per strategy rather than once per row
+        names = {sid: self.strategies.name(sid) for sid in ids}
+        name_column = np.array([names[sid] for sid in result['strategy_id'].tolist()], dtype=object)
+        return ResultSet(['strategy_id', 'strategy_name', 'date', 'pnl'],
+                         {'strategy_id': result['strategy_id'], 'strategy_name': name_column,
+                          'date': result['date'], 'pnl': result['pnl']})
 
+    @cached
     def get_open_trades(self, strategy: str):
         """
         Method to get all open trades on a particular strategy.
@@ -227,63 +518,97 @@ class DBModel():
         }
         """
 
+        with self._cursor() as cur:
+            try:
+                cur.execute(f"""
+                    Select trade.trade_id as trade_id, trade.open_time as open_time, trade_leg.contract as contract,
+                    max(trade_leg.leg_no) as no_legs, count(fill.fill_id) as fills, sum(fill.qty * fill.avg) as capital_out
+                    from trade 
+                    join trade_leg on trade.trade_id = trade_leg.trade_id 
+                    join fill on trade_leg.leg_no = fill.leg_no and trade_leg.trade_id = fill.trade_id
+                    where trade.strategy_id = %s and trade.close_time is NULL
+                    group by trade_id
+                    order by trade.open_time;
+                    """, (self.strategies.strategy_id(strategy),))
+            except Exception as e:
+                raise Exception(f'Error retrieving open trades: {e}')
+
+            return ResultSet.from_cursor(cur)
+
+    @cached
+    def get_historical_trades(self, strategy: str, lookback, after_open_time=None, after_trade_id=None, limit=None):
+        """
+        Method to get a strategy's trades opened in the last lookback calendar months (all of them if lookback is 0),
+        ordered by (open_time, trade_id). Pass the open_time and trade_id of the last trade already seen as
+        after_open_time / after_trade_id and a limit to read the trades one page at a time.
+        Trades moved to the cold tier (see src/archive.py) are merged in from the archive.
+        Returns a ResultSet with the columns trade_id, open_time, close_time, contract, no_legs, fills and pnl.
+        """
+        strategy_id = self.strategies.strategy_id(strategy)
+        since = self._lookback_start(lookback)
+        query, args = self._historical_trades_query(strategy_id, since, after_open_time, after_trade_id, limit)
+        with self._cursor(analytic=True) as cur:
+            try:
+                cur.execute(query, args)
+                columns = [x[0] for x in cur.description]
+                rows = cur.fetchall()
+            except Exception as e:
+                raise Exception(f'Error retrieving historical trades: {e}')
+
         try:
-            self.cur.execute(f"""
-                Select trade.trade_id as trade_id, trade.open_time as open_time, trade_leg.contract as contract,
-                max(trade_leg.leg_no) as no_legs, count(fill.fill_id) as fills, sum(fill.qty * fill.avg) as capital_out
-                from strategy 
-                join trade on strategy.strategy_id = trade.strategy_id 
-                join trade_leg on trade.trade_id = trade_leg.trade_id 
-                join fill on trade_leg.leg_no = fill.leg_no and trade_leg.trade_id = fill.trade_id
-                where strategy.strategy_name = '{strategy}' and trade.close_time is NULL
-                group by trade_id
-                order by trade.open_time;
-                """)
+            archived = self.archive.historical_trades(strategy_id, since, after_open_time, after_trade_id, limit)
         except Exception as e:
-            raise Exception(f'Error retrieving open trades: {e}')
-
-        col_headers = [x[0] for x in self.cur.description]
-        json_data = []
-        the_data = self.cur.fetchall()
-        for row in the_data:
-            json_data.append(dict(zip(col_headers, row)))
-        return json_data
-
-    def get_historical_trades(self, strategy: str, lookback):
-        if lookback == 0:
-            self.cur.execute(f"""
-                Select trade.trade_id as trade_id, trade.open_time as open_time, trade.close_time as close_time, trade_leg.contract as contract,
-                max(trade_leg.leg_no) as no_legs, count(fill.fill_id) as fills, sum(fill.qty * fill.avg) * -1 as pnl 
-                from strategy 
-                join trade on strategy.strategy_id = trade.strategy_id 
-                join trade_leg on trade.trade_id = trade_leg.trade_id 
-                join fill on trade_leg.leg_no = fill.leg_no and trade_leg.trade_id = fill.trade_id
-                where strategy.strategy_name = '{strategy}'
-                group by trade_id
-                order by trade.open_time;
-                """)
-        else:
-            # Convert the lookback into a datetime object that is lookback months from today
-            lookback = datetime.now() - relativedelta(months=lookback)
-            lookback = lookback.strftime("%Y-%m-%d %H:%M:%S")
-            self.cur.execute(f"""
-                Select trade.trade_id as trade_id, trade.open_time as open_time, trade.close_time as close_time, trade_leg.contract as contract,
-                max(trade_leg.leg_no) as no_legs, count(fill.fill_id) as fills, sum(fill.qty * fill.avg) * -1 as pnl 
-                from strategy 
-                join trade on strategy.strategy_id = trade.strategy_id 
-                join trade_leg on trade.trade_id = trade_leg.trade_id 
-                join fill on trade_leg.leg_no = fill.leg_no and trade_leg.trade_id = fill.trade_id
-                where strategy.strategy_name = '{strategy}' and trade.open_time > '{lookback}' 
-                group by trade_id
-                order by trade.open_time;
-                """)
-
-        col_headers = [x[0] for x in self.cur.description]
-        json_data = []
-        the_data = self.cur.fetchall()
-        for row in the_data:
-            json_data.append(dict(zip(col_headers, row)))
-        return json_data
+            raise Exception(f'Error retrieving archived trades: {e}')
+        if archived:
+            rows = list(heapq.merge(rows, archived, key=self._trade_order))[:limit]
+        return ResultSet.from_rows(columns, rows)
+
+    def stream_historical_trades(self, strategy: str, lookback, after_open_time=None, after_trade_id=None,
+                                 batch_size=1000):
+        """
+        Generator version of get_historical_trades for exports of any size. Reads with an unbuffered server-side
+        cursor, so rows leave MySQL as the trade index is walked and memory stays constant (apart from the strategy's
+        archived trades, which are merged in as the live rows stream past).
+        Yields the column names first, then lists of at most batch_size row tuples.
+        """
+        strategy_id = self.strategies.strategy_id(strategy)
+        since = self._lookback_start(lookback)
+        query, args = self._historical_trades_query(strategy_id, since, after_open_time, after_trade_id, None)
+        try:
+            archived = self.archive.historical_trades(strategy_id, since, after_open_time, after_trade_id)
+        except Exception as e:
+            raise Exception(f'Error retrieving archived trades: {e}')
+        pool = self.replicas.choose()
+        conn = pool.acquire()
+        finished = False
+        try:
+            cur = conn.cursor(InstrumentedSSCursor)
+            try:
+                cur.execute(query, args)
+            except Exception as e:
+                raise Exception(f'Error retrieving historical trades: {e}')
+            yield [x[0] for x in cur.description]
+            if not archived:
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+            else:
+                batch = []
+                for row in heapq.merge(self._fetch_rows(cur, batch_size), archived, key=self._trade_order):
+                    batch.append(row)
+                    if len(batch) == batch_size:
+                        yield batch
+                        batch = []
+                if batch:
+                    yield batch
+            cur.close()
+            finished = True
+        finally:
+            # An unbuffered result that was abandoned half way (e.g. the client disconnected) can only be skipped by
+            # reading it to the end, so the connection is closed instead of being returned to the pool
+            pool.release(conn, discard=not finished)
 
     ### DATA EXPLORER PAGE ###
 
@@ -336,18 +661,14 @@ class DBModel():
         }
         """
 
-        try:
-            self.cur.execute(
-                f'select * from trade where trade_id = {trade_id}')
-        except Exception as e:
-            raise Exception(f'Error retrieving trade information: {e}')
+        with self._cursor() as cur:
+            try:
+                cur.execute(
+                    f'select * from trade where trade_id = {trade_id}')
+            except Exception as e:
+                raise Exception(f'Error retrieving trade information: {e}')
 
-        col_headers = [x[0] for x in self.cur.description]
-        json_data = []
-        the_data = self.cur.fetchall()
-        for row in the_data:
-            json_data.append(dict(zip(col_headers, row)))
-        return json_data
+            return ResultSet.from_cursor(cur)
 
     def get_trade_leg_info(self, trade_id: int, leg_no: int):
         """
@@ -388,21 +709,17 @@ class DBModel():
         }
         """
 
-        try:
-            self.cur.execute(f"""
-                Select * from trade_leg join fill on trade_leg.leg_no = fill.leg_no and trade_leg.trade_id = fill.trade_id
-                where trade_leg.trade_id = {trade_id} and trade_leg.leg_no = {leg_no}
-                order by fill.placement_time;
-                """)
-        except Exception as e:
-            raise Exception(f'Error retrieving trade leg information: {e}')
+        with self._cursor() as cur:
+            try:
+                cur.execute(f"""
+                    Select * from trade_leg join fill on trade_leg.leg_no = fill.leg_no and trade_leg.trade_id = fill.trade_id
+                    where trade_leg.trade_id = {trade_id} and trade_leg.leg_no = {leg_no}
+                    order by fill.placement_time;
+                    """)
+            except Exception as e:
+                raise Exception(f'Error retrieving trade leg information: {e}')
 
-        col_headers = [x[0] for x in self.cur.description]
-        json_data = []
-        the_data = self.cur.fetchall()
-        for row in the_data:
-            json_data.append(dict(zip(col_headers, row)))
-        return json_data
+            return ResultSet.from_cursor(cur)
 
     def get_fill_info(self, fill_id: int):
         """
@@ -420,32 +737,306 @@ class DBModel():
         }
         """
 
+        with self._cursor() as cur:
+            try:
+                cur.execute(f'select * from fill where fill_id = {fill_id}')
+            except Exception as e:
+                raise Exception(f'Error retrieving fill information: {e}')
+
+            return ResultSet.from_cursor(cur)
+
+    def strategy_exists(self, strategy: str):
+        """
+        Method to check whether a strategy with the given name exists (active or terminated), from the in-memory
+        strategy registry.
+        """
         try:
-            self.cur.execute(f'select * from fill where fill_id = {fill_id}')
+            return self.strategies.exists(strategy)
         except Exception as e:
-            raise Exception(f'Error retrieving fill information: {e}')
+            raise Exception(f'Error retrieving strategy information: {e}')
 
-        col_headers = [x[0] for x in self.cur.description]
-        json_data = []
-        the_data = self.cur.fetchall()
-        for row in the_data:
-            json_data.append(dict(zip(col_headers, row)))
-        return json_data
+    ### INGESTION ###
 
-    ### HELPERS ###
+    def ingest_batch(self, batch):
+        """
+        Method to write a validated ingestion batch (see src/ingest.py) in a single transaction: trades first, then legs,
+        then fills, each with one multi-row executemany. Fills whose fill_id is already stored are skipped. trade and fill
+        are partitioned and have no foreign keys, so every strategy, trade and leg the batch references must exist (in
+        the batch or in the database), otherwise an IntegrityError is raised and nothing is written.
+        Fills older than the P&L rollup's watermark are added to daily_pnl here and bump the rollup's version, so that
+        cached results (see src/cache.py) are recomputed even though the newest fill did not change.
+        The partitioned tables' primary keys include open_time / filled_time, so MySQL no longer keeps trade_id and
+        fill_id unique: stored ids are looked up regardless of their time, a re-sent fill is skipped even if its
+        filled_time changed, and a re-sent trade is matched (and closed) on its stored open_time.
+        Output will come in the format:
+        ---------------------------------------
+        {
+            "trades": <Trade Rows Inserted or Closed>,
+            "trade_legs": <Trade Leg Rows Inserted or Closed>,
+            "fills_inserted": <New Fills>,
+            "fills_duplicate": <Fills Already Stored>,
+            "fills_backdated": <New Fills Older than the P&L Rollup Watermark>
+        }
+        ---------------------------------------
+        """
+        trades, legs, fills = batch.get('trade', []), batch.get('trade_leg', []), batch.get('fill', [])
+        with self.pool.connection() as conn:
+            conn.begin()
+            with conn.cursor() as cur:
+                # Locking the watermark serializes the batch with PnLRollup.refresh, so every fill ends up in daily_pnl
+                # exactly once: either through the next refresh, or below if it is older than the watermark.
+                cur.execute('select last_filled_time, last_fill_id from rollup_watermark '
+                            'where rollup_name = %s for update', (self.pnl_rollup.NAME,))
+                watermark = cur.fetchone()
+                self._check_references(cur, trades, legs, fills)
+                trades = self._match_stored_trades(cur, trades)
+                stored = self._stored_fill_ids(cur, fills)
+                new_fills = [row for row in fills if row[0] not in stored]
+                behind = []
+                if watermark is not None and watermark[0] is not None:
+                    behind = [(row[0], row[7]) for row in new_fills if (row[7], row[0]) <= tuple(watermark)]
 
-    def strategy_exists(self, strategy: str):
+                trades_written = cur.executemany(insert_statement('trade'), trades) if trades else 0
+                legs_written = cur.executemany(insert_statement('trade_leg'), legs) if legs else 0
+                fills_inserted = cur.executemany(insert_statement('fill'), new_fills) if new_fills else 0
+
+                if behind:
+                    cur.execute(f"""
+                        insert into daily_pnl (strategy_id, date, pnl, fills)
+                        select coalesce(trade.strategy_id, 0), date(trade.open_time), sum(fill.qty * fill.avg) * -1, count(*)
+                        from fill
+                        join trade on fill.trade_id = trade.trade_id
+                        where (fill.fill_id, fill.filled_time) in ({", ".join(["(%s, %s)"] * len(behind))})
+                        group by coalesce(trade.strategy_id, 0), date(trade.open_time)
+                        on duplicate key update pnl = pnl + values(pnl), fills = fills + values(fills);
+                        """, [v for key in behind for v in key])
+                    self.pnl_rollup.bump_version(cur)
+            conn.commit()
+
+        if behind:
+            # Other workers see the new version on their next probe, this one drops its P&L results right away
+            self.cache.clear()
+
+        return {
+            'trades': trades_written or 0,
+            'trade_legs': legs_written or 0,
+            'fills_inserted': fills_inserted or 0,
+            'fills_duplicate': len(fills) - (fills_inserted or 0),
+            'fills_backdated': len(behind),
+        }
+
+    def _match_stored_trades(self, cur, trades):
+        """
+        The trade rows with the open_time of the stored row of the same trade_id, if any, so that a re-sent trade
+        updates that row instead of adding a second one under another (trade_id, open_time) primary key.
+        """
+        if not trades:
+            return trades
+        # trade_id leads the primary key, so this is one index lookup per partition
+        cur.execute(f'select trade_id, open_time from trade where trade_id in ({", ".join(["%s"] * len(trades))})',
+                    [row[0] for row in trades])
+        open_times = dict(cur.fetchall())
+        return [row if row[0] not in open_times else (row[0], row[1], open_times[row[0]], *row[3:]) for row in trades]
+
+    def _stored_fill_ids(self, cur, fills):
+        """
+        The fill_ids of the batch that are already stored, whatever their filled_time.
+        """
+        if not fills:
+            return set()
+        # fill_id leads the primary key, so this is one index lookup per partition
+        cur.execute(f'select fill_id from fill where fill_id in ({", ".join(["%s"] * len(fills))})',
+                    [row[0] for row in fills])
+        return set(row[0] for row in cur.fetchall())
+
+    def _check_references(self, cur, trades, legs, fills):
         """
-        Method to check if a strategy exists in the database.
-        Returns True if the strategy exists, False otherwise.
+        Stand-in for the foreign keys dropped when trade and fill were partitioned: raise an IntegrityError if a trade
+        references an unknown strategy, or a leg / fill a trade / leg that is neither in the batch nor stored.
         """
-        if strategy == None or strategy == '' or strategy == ' ':
-            return False
+        missing = sorted(set(row[1] for row in trades if self.strategies.get(row[1]) is None))
+        if missing:
+            raise pymysql.err.IntegrityError(1452, f'Unknown strategy_id(s) {missing[:10]}')
 
+        trade_ids = set(row[1] for row in legs) - set(row[0] for row in trades)
+        if trade_ids:
+            cur.execute(f'select trade_id from trade where trade_id in ({", ".join(["%s"] * len(trade_ids))})',
+                        list(trade_ids))
+            missing = sorted(trade_ids - set(row[0] for row in cur.fetchall()))
+            if missing:
+                raise pymysql.err.IntegrityError(1452, f'trade_legs reference unknown trade_id(s) {missing[:10]}')
+
+        leg_keys = set((row[2], row[1]) for row in fills) - set((row[1], row[0]) for row in legs)
+        if leg_keys:
+            cur.execute(f'select trade_id, leg_no from trade_leg where (trade_id, leg_no) in '
+                        f'({", ".join(["(%s, %s)"] * len(leg_keys))})', [v for key in leg_keys for v in key])
+            missing = sorted(leg_keys - set(tuple(row) for row in cur.fetchall()))
+            if missing:
+                raise pymysql.err.IntegrityError(1452, f'fills reference unknown trade_id/leg_no(s) {missing[:10]}')
+
+    ### MAINTENANCE ###
+
+    def rebuild_pnl_rollup(self):
+        """
+        Method to recompute the daily_pnl rollup from scratch, e.g. after backdated fills were inserted. The lot-matched
+        P&L is rebuilt on its next read as well.
+        Returns the number of rows written.
+        """
+        try:
+            rows = self.pnl_rollup.rebuild()
+        except Exception as e:
+            raise Exception(f'Error rebuilding the daily P&L rollup: {e}')
+        # The fill table did not change, so the data version alone would not invalidate the cached P&L
+        self.cache.clear()
+        self.lots.reset()
+        return rows
+
+    def get_cache_stats(self):
+        """
+        Method to get the result cache's size and hit/miss/eviction counters.
+        """
+        return self.cache.stats()
+
+    def reload_position_book(self):
+        """
+        Method to reload the in-memory position book from the database, e.g. after backdated fills were inserted.
+        """
         try:
-            self.cur.execute(
-                f'select * from strategy where strategy_name = "{strategy}"')
+            self.position_book.reload()
         except Exception as e:
-            return False
+            raise Exception(f'Error reloading the position book: {e}')
+
+    ### HELPERS ###
+
+    def _statistics(self, g, trade_counts):
+        """
+        The get_strategies_statistics ResultSet from the per-strategy sums g (strategy_id, strategy_name, cum_pnl,
+        pnl_sq, ytd_pnl and the first and last day with P&L) and {strategy_id: trade count}.
+        """
+        days = (g['last'] - g['first']).dt.days.to_numpy().astype('float64')
+        years = days / 365
+        trades = g['strategy_id'].map(trade_counts).fillna(0).to_numpy()
+        # Standard deviation of the daily P&L with days without trades counted as 0, like get_strategy_pnl
+        # returns them, from the sums alone: the zero days add to the count but not to the sums
+        n = days + 1
+        cum_pnl = g['cum_pnl'].to_numpy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            std = np.sqrt(np.maximum(g['pnl_sq'].to_numpy() - cum_pnl ** 2 / n, 0) / (n - 1))
+            stats = {
+                'cumulative_pnl': cum_pnl,
+                'ytd_pnl': g['ytd_pnl'].to_numpy(),
+                'avg_annual_return': cum_pnl / years,
+                'avg_daily_return': cum_pnl / days,
+                'avg_daily_trades': trades / days,
+                'sharpe': cum_pnl / std,
+            }
+
+        data = {'strategy_name': g['strategy_name'].to_numpy(dtype=object),
+                'strategy_id': g['strategy_id'].to_numpy()}
+        data.update({col: self._rounded(stats[col]) for col in STATISTICS_COLUMNS})
+        return ResultSet(['strategy_name', 'strategy_id'] + STATISTICS_COLUMNS, data)
 
-        return len(self.cur.fetchall()) != 0
+    def _strategy_ids(self, strategies):
+        """
+        Ids of a list of strategy names (unknown names are left out), or of every active strategy for '*'.
+        """
+        if strategies == '*':
+            return self.strategies.active_ids()
+        return self.strategies.ids(strategies)
+
+    @staticmethod
+    def _historical_trades_query(strategy_id, since, after_open_time, after_trade_id, limit):
+        """
+        Historical trades query, driven by ix_trade_strategy_open in (open_time, trade_id) order. The per-trade
+        aggregates are correlated lookups on the covering fill / trade_leg indexes instead of a join + group by, so
+        MySQL needs neither a temporary table nor a sort and can return rows (and stop at the limit) as it goes.
+        As before, trades without any fill are left out.
+        """
+        conditions = ['trade.strategy_id = %s']
+        args = [strategy_id]
+        if since:
+            conditions.append('trade.open_time > %s')
+            args.append(since)
+        if after_open_time is not None:
+            conditions.append('(trade.open_time > %s or (trade.open_time = %s and trade.trade_id > %s))')
+            args += [after_open_time, after_open_time, after_trade_id]
+        # The fill lookups are deliberately not bounded on filled_time: nothing keeps a fill from being stamped before
+        # its trade's open_time (the demo data has plenty), and a bound derived from open_time would drop those fills.
+
+        query = f"""
+            Select trade.trade_id as trade_id, trade.open_time as open_time, trade.close_time as close_time,
+            (select trade_leg.contract from trade_leg where trade_leg.trade_id = trade.trade_id
+             order by trade_leg.leg_no limit 1) as contract,
+            (select max(fill.leg_no) from fill where fill.trade_id = trade.trade_id) as no_legs,
+            (select count(*) from fill where fill.trade_id = trade.trade_id) as fills,
+            (select sum(fill.qty * fill.avg) * -1 from fill where fill.trade_id = trade.trade_id) as pnl
+            from trade
+            where {' and '.join(conditions)}
+            having fills > 0
+            order by trade.open_time, trade.trade_id
+            """
+        if limit is not None:
+            query += ' limit %s'
+            args.append(limit)
+        return query, tuple(args)
+
+    @staticmethod
+    def _lookback_start(lookback):
+        """
+        Start of a lookback of this many months from now as a "YYYY-MM-DD HH:MM:SS" string, None for no lookback (0).
+        """
+        if not lookback:
+            return None
+        return (datetime.now() - relativedelta(months=lookback)).strftime("%Y-%m-%d %H:%M:%S")
+
+    @staticmethod
+    def _trade_order(row):
+        # (open_time, trade_id) of a historical trades row, the order live and archived rows are merged in
+        return row[1], row[0]
+
+    @staticmethod
+    def _fetch_rows(cur, batch_size):
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    @staticmethod
+    def _fill_days(result):
+        """
+        Spread a daily (date, pnl) result over every calendar day from its first to its last row, with 0 P&L on days
+        without trades.
+        """
+        if len(result) == 0:
+            return result
+        with section('pandas: fill days'):
+            pnl = pd.Series(result['pnl'], index=pd.to_datetime(result['date']), dtype='float64')
+            pnl = pnl.asfreq('D', fill_value=0)
+        return ResultSet(['date', 'pnl'], {'date': pnl.index.strftime('%Y-%m-%d').to_numpy(dtype=object),
+                                           'pnl': pnl.to_numpy()})
+
+    @staticmethod
+    def _rounded(values):
+        """
+        Values rounded to 2 decimals as an object array, with None where the value is undefined (NaN or infinite).
+        """
+        rounded = np.round(np.asarray(values, dtype='float64'), 2)
+        return np.array([float(x) if np.isfinite(x) else None for x in rounded], dtype=object)
+
+    @staticmethod
+    def split_by_strategy(result):
+        """
+        Split a get_strategies_pnl result into {strategy_name: (strategy_id, daily (date, pnl) ResultSet)}, with every
+        strategy's days filled in the same way as get_strategy_pnl.
+        """
+        split = {}
+        if len(result) == 0:
+            return split
+        ids = np.asarray(result['strategy_id'])
+        # Rows are ordered by strategy, so every strategy is one contiguous slice
+        bounds = np.flatnonzero(ids[1:] != ids[:-1]) + 1
+        for start, end in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(ids)]])):
+            days = ResultSet(['date', 'pnl'], {'date': result['date'][start:end], 'pnl': result['pnl'][start:end]})
+            split[result['strategy_name'][start]] = (int(ids[start]), DBModel._fill_days(days))
+        return split
@@ -0,0 +1,171 @@
+"""
+Validation of ingestion batches against the trade / trade_leg / fill schema (see db-bootstrap/create_db.sql), and the
+statements that write them.
+"""
+
+# imports
+from datetime import datetime
+
+# Column name -> (type, required, max length). Rows are written in this column order.
+SCHEMA = {
+    'trade': {
+        'trade_id': (int, True, None),
+        'strategy_id': (int, True, None),
+        'open_time': (datetime, True, None),
+        'close_time': (datetime, False, None),
+    },
+    'trade_leg': {
+        'leg_no': (int, True, None),
+        'trade_id': (int, True, None),
+        'contract': (str, True, 50),
+        'open_time': (datetime, True, None),
+        'close_time': (datetime, False, None),
+    },
+    'fill': {
+        'fill_id': (int, True, None),
+        'leg_no': (int, True, None),
+        'trade_id': (int, True, None),
+        'contract': (str, True, 50),
+        'qty': (int, True, None),
+        'avg': (float, True, None),
+        'placement_time': (datetime, False, None),
+        'filled_time': (datetime, True, None),
+        'brokerage': (str, False, 50),
+    },
+}
+
+# Key of each table's rows in the request body
+PAYLOAD_KEYS = {'trades': 'trade', 'trade_legs': 'trade_leg', 'fills': 'fill'}
+PRIMARY_KEYS = {'trade': ('trade_id',), 'trade_leg': ('trade_id', 'leg_no'), 'fill': ('fill_id',)}
+# Rows already stored are left as they are, except that a trade or leg can be closed by sending it again with its
+# close_time. A fill is never updated: re-sending a fill is a no-op, so retried batches are harmless. The partitioned
+# tables' primary keys are (trade_id, open_time) and (fill_id, filled_time), so DBModel.ingest_batch looks stored ids up
+# regardless of time first: fills already stored are not sent again, and re-sent trades carry their stored open_time.
+ON_DUPLICATE = {
+    'trade': 'close_time = coalesce(values(close_time), close_time)',
+    'trade_leg': 'close_time = coalesce(values(close_time), close_time)',
+    'fill': 'fill_id = fill_id',
+}
+# Errors reported per request before giving up on the rest of the batch
+MAX_ERRORS = 100
+
+
+class ValidationError(ValueError):
+    """
+    Raised when an ingestion batch does not match the schema. errors lists one message per offending value.
+    """
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} validation error(s): {"; ".join(errors[:5])}')
+        self.errors = errors
+
+
+def validate_batch(payload, max_rows):
+    """
+    Check a batch of the form {"trades": [...], "trade_legs": [...], "fills": [...]} (every key optional, rows as
+    objects keyed by column name) and return {table: [row tuple in SCHEMA column order, ...]}.
+    Raises ValidationError listing every problem found.
+    """
+    if not isinstance(payload, dict):
+        raise ValidationError(['The request body must be a JSON object'])
+    unknown = set(payload) - set(PAYLOAD_KEYS)
+    if unknown:
+        raise ValidationError([f'Unknown key(s) {", ".join(sorted(unknown))}, expected {", ".join(PAYLOAD_KEYS)}'])
+    total = sum(len(rows) if isinstance(rows, list) else 0 for rows in payload.values())
+    if total > max_rows:
+        raise ValidationError([f'Batch has {total} rows, at most {max_rows} are accepted per request'])
+
+    errors = []
+    batch = {}
+    for key, table in PAYLOAD_KEYS.items():
+        rows = payload.get(key, [])
+        if not isinstance(rows, list):
+            errors.append(f'{key} must be a list of objects')
+            continue
+        batch[table] = [_validate_row(table, i, row, errors) for i, row in enumerate(rows)]
+        if len(errors) >= MAX_ERRORS:
+            break
+        _check_unique(key, table, batch[table], errors)
+
+    if errors:
+        raise ValidationError(errors[:MAX_ERRORS])
+    return batch
+
+
+def insert_statement(table):
+    """
+    Multi-row capable insert for a table's validated rows (pymysql's executemany batches 'values (%s, ...)' inserts
+    into as few statements as max_allowed_packet allows).
+    """
+    columns = list(SCHEMA[table])
+    return (f'insert into `{table}` ({", ".join(columns)}) values ({", ".join(["%s"] * len(columns))}) '
+            f'on duplicate key update {ON_DUPLICATE[table]}')
+
+
+def _validate_row(table, i, row, errors):
+    schema = SCHEMA[table]
+    where = f'{table}[{i}]'
+    if not isinstance(row, dict):
+        errors.append(f'{where} must be an object')
+        return None
+    for column in sorted(set(row) - set(schema)):
+        errors.append(f'{where}: unknown column {column}')
+
+    values = []
+    for column, (kind, required, max_length) in schema.items():
+        value = row.get(column)
+        if value is None:
+            if required:
+                errors.append(f'{where}.{column} is required')
+            values.append(None)
+            continue
+        try:
+            values.append(_convert(value, kind, max_length))
+        except ValueError as e:
+            errors.append(f'{where}.{column}: {e}')
+            values.append(None)
+    return tuple(values)
+
+
+def _convert(value, kind, max_length):
+    if kind is int:
+        # bool is an int subclass, and a float like 1.5 must not be truncated silently
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError(f'expected an integer, got {value!r}')
+        if not -2 ** 31 <= value < 2 ** 31:
+            raise ValueError(f'{value} does not fit an integer column')
+        return value
+    if kind is float:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f'expected a number, got {value!r}')
+        return float(value)
+    if kind is str:
+        if not isinstance(value, str):
+            raise ValueError(f'expected a string, got {value!r}')
+        if len(value) > max_length:
+            raise ValueError(f'longer than {max_length} characters')
+        return value
+    if kind is datetime:
+        if not isinstance(value, str):
+            raise ValueError(f'expected a "YYYY-MM-DD HH:MM:SS" timestamp, got {value!r}')
+        try:
+            return datetime.fromisoformat(value).replace(tzinfo=None)
+        except ValueError:
+            raise ValueError(f'expected a "YYYY-MM-DD HH:MM:SS" timestamp, got {value!r}')
+    raise ValueError(f'unsupported type {kind}')
+
+
+def _check_unique(key, table, rows, errors):
+    """
+    A primary key may appear only once per batch, otherwise the outcome would depend on row order.
+    """
+    columns = list(SCHEMA[table])
+    positions = [columns.index(c) for c in PRIMARY_KEYS[table]]
+    seen = set()
+    for i, row in enumerate(rows):
+        if row is None:
+            continue
+        pk = tuple(row[p] for p in positions)
+        if pk in seen:
+            errors.append(f'{table}[{i}]: duplicate {"/".join(PRIMARY_KEYS[table])} {pk} in {key}')
+        seen.add(pk)
@@ -0,0 +1,384 @@
+# imports
+import threading
+
+import numpy as np
+
+LOT_METHODS = ('fifo', 'average')
+# Lots are matched per trade leg, or per (strategy, contract) across the strategy's trades
+LOT_KEYS = ('leg', 'contract')
+
+
+class LotState():
+    """
+    Checkpoint of the lot-matching engine: the lots still open after the fills matched so far, as parallel arrays in
+    matching order (key, open time, signed quantity, price). In average-cost mode there is at most one lot per key, at
+    the average price. Pass it back to match_lots with the next fills to continue where the previous run stopped.
+    """
+
+    def __init__(self, keys=(), times=(), qty=(), price=()):
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.times = np.asarray(times, dtype='datetime64[s]')
+        self.qty = np.asarray(qty, dtype=np.int64)
+        self.price = np.asarray(price, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def save(self, path):
+        np.savez(path, keys=self.keys, times=self.times, qty=self.qty, price=self.price)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['keys'], data['times'], data['qty'], data['price'])
+
+
+def match_lots(keys, times, qty, price, method='fifo', state=None):
+    """
+    Match fills against the open lots of their key, FIFO or at average cost, without a Python loop over fills.
+
+    keys, times, qty and price are parallel arrays: an integer lot key per fill, the fill time, the signed quantity
+    (positive buys) and the price. Fills of a key must come in fill time order. A fill that takes the position through
+    zero is split into a part closing the old position and a part opening the new one.
+
+    FIFO works on cumulative quantities: the opening parts of a key tile [0, opened) and its closing parts tile
+    [0, closed), so the n-th unit closed always matches the n-th unit opened. Cutting both tilings at every boundary
+    and locating each piece with searchsorted pairs every closed quantity with the lot it closes. Average cost carries
+    the cost basis of the position, which opens add to and closes scale down, as a linear recurrence evaluated with a
+    parallel (doubling) scan.
+
+    Returns (closes, state): closes holds one row per closing part as arrays 'key', 'time', 'qty' (signed like the
+    closing fill) and 'pnl' (realized, in price x quantity), and state is the LotState of the lots left open.
+    """
+    if method not in LOT_METHODS:
+        raise ValueError(f'Unknown lot matching method {method}, expected one of {", ".join(LOT_METHODS)}')
+
+    keys = np.asarray(keys, dtype=np.int64)
+    times = np.asarray(times, dtype='datetime64[s]')
+    qty = np.asarray(qty, dtype=np.int64)
+    price = np.asarray(price, dtype=np.float64)
+    seq = np.arange(len(keys))
+    if state is not None and len(state):
+        # The open lots go first, as the oldest fills of their keys
+        keys = np.concatenate([state.keys, keys])
+        times = np.concatenate([state.times, times])
+        qty = np.concatenate([state.qty, qty])
+        price = np.concatenate([state.price, price])
+        seq = np.concatenate([np.arange(-len(state), 0), seq])
+
+    if len(keys) == 0:
+        return {'key': keys, 'time': times, 'qty': qty, 'pnl': np.zeros(0)}, LotState()
+
+    order = np.lexsort((seq, keys))
+    keys, times, qty, price = keys[order], times[order], qty[order], price[order]
+    starts = _starts(keys)
+    after = _group_cumsum(qty, starts)
+    before = after - qty
+
+    # Split the fills that flip the position into a closing part (-before) and an opening part (after)
+    flip = before * after < 0
+    idx = np.repeat(np.arange(len(keys)), 1 + flip)
+    second = np.zeros(len(idx), dtype=bool)
+    second[np.cumsum(1 + flip)[flip] - 1] = True
+    p_qty = np.where(flip[idx], np.where(second, after[idx], -before[idx]), qty[idx])
+    p_before = np.where(second, 0, before[idx])
+    keep = p_qty != 0
+    p_keys, p_times, p_price = keys[idx][keep], times[idx][keep], price[idx][keep]
+    p_qty, p_before = p_qty[keep], p_before[keep]
+    p_starts = _starts(p_keys)
+    if len(p_keys) == 0:
+        return {'key': p_keys, 'time': p_times, 'qty': p_qty, 'pnl': np.zeros(0)}, LotState()
+
+    closing = p_before * p_qty < 0
+    if method == 'fifo':
+        pnl, state = _match_fifo(p_keys, p_times, p_qty, p_price, p_starts, closing)
+    else:
+        pnl, state = _match_average(p_keys, p_times, p_qty, p_price, p_before, p_starts, closing)
+
+    closes = {'key': p_keys[closing], 'time': p_times[closing], 'qty': p_qty[closing], 'pnl': pnl}
+    return closes, state
+
+
+def unrealized_pnl(state, marks):
+    """
+    Unrealized P&L of every open lot against marks (an array of prices aligned with state.keys, NaN if unknown).
+    """
+    return state.qty * (np.asarray(marks, dtype=np.float64) - state.price)
+
+
+class _Book():
+    def __init__(self):
+        # Held while the book is brought up to date or read, not while its fills are fetched
+        self.lock = threading.Lock()
+        self.state = LotState()
+        # date -> realized P&L of the lots closed that day
+        self.realized = {}
+        # contract -> key (by contract) and key -> contract of the keys with open lots
+        self.codes = {}
+        self.contracts = {}
+        self.watermark = None
+
+
+class LotLedger():
+    """
+    Realized P&L by close date and open lots of each strategy, from lot matching its fills (see match_lots).
+
+    One book is kept per (strategy, method, key). It is built on first use from the strategy's archived fills (see
+    src/archive.py) and its live fills, then kept current from a LotState checkpoint and a (filled_time, fill_id)
+    watermark: each read matches only the strategy's fills past the watermark against the open lots. Like the other
+    incremental readers, fills backdated behind the watermark need a reset().
+
+    Each book has its own lock, held only while fills are matched into it, so reads of different strategies run
+    concurrently and the fills are fetched outside any lock. Fills fetched from a watermark another read has since
+    moved past are cut to those past the new watermark before they are matched.
+    """
+
+    def __init__(self, pool, archive=None):
+        self.pool = pool
+        self.archive = archive
+        # Guards _books itself, not the books
+        self._lock = threading.Lock()
+        self._books = {}
+
+    ### READERS ###
+
+    def pnl(self, strategy_id, method='fifo', by='leg'):
+        """
+        Bring the strategy's book up to date and return ([(close date, realized P&L)] in date order,
+        [(contract, signed quantity, price, open time)] of the open lots).
+        """
+        if method not in LOT_METHODS:
+            raise ValueError(f'Unknown lot matching method {method}, expected one of {", ".join(LOT_METHODS)}')
+        if by not in LOT_KEYS:
+            raise ValueError(f'Unknown lot key {by}, expected one of {", ".join(LOT_KEYS)}')
+
+        with self._lock:
+            book = self._books.get((strategy_id, method, by))
+            if book is None:
+                book = self._books[(strategy_id, method, by)] = _Book()
+        watermark = book.watermark
+        fills = self._new_fills(strategy_id, watermark)
+
+        with book.lock:
+            self._update(book, fills, watermark, method, by)
+            state = book.state
+            lots = [(book.contracts[key], qty, price, time.astype(object))
+                    for key, qty, price, time in zip(state.keys.tolist(), state.qty.tolist(), state.price.tolist(),
+                                                     state.times)]
+            return sorted(book.realized.items()), lots
+
+    ### MAINTENANCE ###
+
+    def reset(self):
+        """
+        Drop every book, so each is rebuilt from all fills on its next read, e.g. after backdated fills.
+        """
+        with self._lock:
+            self._books = {}
+
+    ### HELPERS ###
+
+    def _new_fills(self, strategy_id, watermark):
+        """
+        The strategy's fills past the watermark in (filled_time, fill_id) order, archived ones included when building a
+        book from scratch (watermark None).
+        """
+        fills = self._fills(strategy_id, watermark)
+        if watermark is None and self.archive is not None:
+            archived = self.archive.fills(strategy_id)
+            if archived.num_rows:
+                fills = {col: np.concatenate([archived[col].to_numpy(zero_copy_only=False), fills[col]])
+                         for col in fills}
+                fills['qty'] = np.nan_to_num(fills['qty']).astype(np.int64)
+                fills['avg'] = np.nan_to_num(fills['avg'].astype(np.float64))
+        order = np.lexsort((fills['fill_id'], fills['filled_time']))
+        return {col: values[order] for col, values in fills.items()}
+
+    def _update(self, book, fills, watermark, method, by):
+        """
+        Match fills fetched past watermark into the book. Must be called with the book's lock held.
+        """
+        if book.watermark != watermark and book.watermark is not None:
+            # Another read matched fills into the book since these were fetched
+            last_time, last_id = np.datetime64(book.watermark[0], 's'), book.watermark[1]
+            newer = (fills['filled_time'] > last_time) | ((fills['filled_time'] == last_time) &
+                                                           (fills['fill_id'] > last_id))
+            fills = {col: values[newer] for col, values in fills.items()}
+        if len(fills['fill_id']) == 0:
+            return
+
+        contracts = fills['contract']
+        if by == 'leg':
+            keys = (fills['trade_id'].astype(np.int64) << 20) | fills['leg_no'].astype(np.int64)
+        else:
+            for contract in set(contracts.tolist()) - set(book.codes):
+                book.codes[contract] = len(book.codes)
+            keys = np.array([book.codes[contract] for contract in contracts.tolist()], dtype=np.int64)
+
+        closes, state = match_lots(keys, fills['filled_time'], fills['qty'], fills['avg'], method, book.state)
+        days = closes['time'].astype('datetime64[D]')
+        for day, pnl in zip(*_sum_by(days, closes['pnl'])):
+            day = day.astype(object)
+            book.realized[day] = book.realized.get(day, 0.0) + float(pnl)
+
+        contract_of = dict(zip(keys.tolist(), contracts.tolist()))
+        book.contracts = {key: book.contracts.get(key) or contract_of.get(key) for key in set(state.keys.tolist())}
+        book.state = state
+        book.watermark = (fills['filled_time'][-1].astype(object), int(fills['fill_id'][-1]))
+
+    def _fills(self, strategy_id, watermark):
+        """
+        The strategy's live fills past the watermark (all of them if it is None) as arrays by column.
+        """
+        conditions, args = ['trade.strategy_id = %s'], [strategy_id]
+        if watermark is not None:
+            conditions.append('fill.filled_time >= %s and (fill.filled_time > %s or fill.fill_id > %s)')
+            args += [watermark[0], watermark[0], watermark[1]]
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    Select fill.fill_id, fill.trade_id, fill.leg_no, fill.contract, fill.qty, fill.avg, fill.filled_time
+                    from fill
+                    join trade on fill.trade_id = trade.trade_id
+                    where {' and '.join(conditions)};
+                    """, args)
+                rows = cur.fetchall()
+        columns = list(zip(*rows)) if rows else [()] * 7
+        return {
+            'fill_id': np.array(columns[0], dtype=np.int64),
+            'trade_id': np.array(columns[1], dtype=np.int64),
+            'leg_no': np.array(columns[2], dtype=np.int64),
+            'contract': np.array(columns[3], dtype=object),
+            'qty': np.array([q or 0 for q in columns[4]], dtype=np.int64),
+            'avg': np.array([a or 0.0 for a in columns[5]], dtype=np.float64),
+            'filled_time': np.array(columns[6], dtype='datetime64[s]'),
+        }
+
+
+### HELPERS ###
+
+def _sum_by(labels, values):
+    """
+    (unique labels, sum of values per label) for sortable labels.
+    """
+    if len(labels) == 0:
+        return labels, values
+    unique, inverse = np.unique(labels, return_inverse=True)
+    return unique, np.bincount(inverse, weights=values)
+
+
+def _match_fifo(keys, times, qty, price, starts, closing):
+    size = np.abs(qty)
+    opening = ~closing
+    open_size = np.where(opening, size, 0)
+    close_size = np.where(closing, size, 0)
+
+    # Opening parts tile the line one key after the other; each key's closing parts tile the same range from its start
+    open_end = np.cumsum(open_size)
+    key_base = _group_first(open_end - open_size, starts)
+    close_end = key_base + _group_cumsum(close_size, starts)
+    closed_through = key_base + _group_total(close_size, starts)
+
+    o, c = np.flatnonzero(opening), np.flatnonzero(closing)
+    o_end, c_end = open_end[o], close_end[c]
+    o_start, c_start = o_end - open_size[o], c_end - close_size[c]
+
+    # Elementary pieces between consecutive boundaries, kept where a closing part covers them
+    # Opening parts are contiguous, so their starts are the previous ends; sorting beats np.unique's hashing here
+    bounds = np.sort(np.concatenate([o_start[:1], o_end, c_start, c_end]), kind='stable')
+    bounds = bounds[np.r_[True, bounds[1:] != bounds[:-1]]]
+    lo, hi = bounds[:-1], bounds[1:]
+    mid = (lo + hi) / 2
+    ci = np.searchsorted(c_end, mid, side='right')
+    covered = ci < len(c)
+    covered[covered] = c_start[ci[covered]] <= mid[covered]
+    lo, hi, mid, ci = lo[covered], hi[covered], mid[covered], ci[covered]
+    oi = np.searchsorted(o_end, mid, side='right')
+
+    direction = np.sign(qty[o])
+    pieces = (hi - lo) * (price[c][ci] - price[o][oi]) * direction[oi]
+    pnl = np.bincount(ci, weights=pieces, minlength=len(c))
+
+    remaining = np.clip(o_end - np.maximum(o_start, closed_through[o]), 0, None)
+    left = remaining > 0
+    state = LotState(keys[o][left], times[o][left], (remaining * direction)[left], price[o][left])
+    return pnl, state
+
+
+def _match_average(keys, times, qty, price, before, starts, closing):
+    size = np.abs(qty)
+    position_before = np.abs(before)
+    position_after = np.abs(before + qty)
+    episodes = ~closing & (before == 0)
+
+    # Cost basis of the position after each part, restarting with every episode (position opened from flat): an
+    # opening part adds size * price, a closing part scales it by position_after / position_before
+    scale = np.where(closing, position_after / np.maximum(position_before, 1), 1.0)
+    basis = _linear_scan(scale, np.where(closing, 0.0, size * price), episodes)
+
+    c = np.flatnonzero(closing)
+    average = basis[c - 1] / position_before[c]
+    pnl = size[c] * (price[c] - average) * np.sign(before[c])
+
+    last = np.r_[starts[1:], True]
+    position = (before + qty)[last]
+    open_at = _group_first(np.where(episodes, np.arange(len(keys)), 0), episodes)
+    left = position != 0
+    state = LotState(keys[last][left], times[open_at[last]][left], position[left],
+                     (basis[last] / np.maximum(np.abs(position), 1))[left])
+    return pnl, state
+
+
+def _linear_scan(a, b, starts):
+    """
+    x_i = a_i * x_(i-1) + b_i, restarting with x_i = b_i at every True in starts. Each pass composes every element with
+    the one shift places before it in the same group, doubling shift, so it takes log2(longest group) vector passes
+    and only ever multiplies factors, which keeps it exact enough where cumulative-log formulations overflow.
+    """
+    a = np.where(starts, 0.0, a)
+    x = np.asarray(b, dtype=np.float64)
+    if len(x) == 0:
+        return x
+    index = np.arange(len(x))
+    first = _group_first(index, starts)
+    longest = np.diff(np.r_[np.flatnonzero(starts), len(x)]).max()
+    shift = 1
+    while shift < longest:
+        i = np.flatnonzero(index - shift >= first)
+        x_i = a[i] * x[i - shift] + x[i]
+        a_i = a[i] * a[i - shift]
+        x[i], a[i] = x_i, a_i
+        shift *= 2
+    return x
+
+
+def _starts(keys):
+    return np.r_[True, keys[1:] != keys[:-1]] if len(keys) else np.zeros(0, dtype=bool)
+
+
+def _group_cumsum(values, starts):
+    """
+    Cumulative sum of values restarting at every True in starts.
+    """
+    total = np.cumsum(values)
+    return total - _group_first(total - values, starts)
+
+
+def _group_first(values, starts):
+    """
+    Value at the start of each element's group, for every element.
+    """
+    if len(values) == 0:
+        return values
+    return values[np.flatnonzero(starts)][np.cumsum(starts) - 1]
+
+
+def _group_total(values, starts):
+    """
+    Sum of each element's group, for every element.
+    """
+    if len(values) == 0:
+        return values
+    ends = np.r_[np.flatnonzero(starts)[1:], len(values)] - 1
+    total = _group_cumsum(values, starts)[ends]
+    return total[np.cumsum(starts) - 1]
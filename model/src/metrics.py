@@ -0,0 +1,357 @@
+# imports
+import bisect
+import contextvars
+import functools
+import inspect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import pymysql.cursors
+from flask import g, has_request_context, request
+
+from src.profiling import current_profile
+from src.serialization import JSONProvider
+from src.settings import METRICS_ENABLED, SLOW_QUERY_LOG_MAX_CHARS, SLOW_QUERY_THRESHOLD
+
+"""
+Process-wide metrics in the Prometheus text exposition format, served at /metrics (see src/views.py), and the slow
+query log.
+
+Everything is recorded in memory by the process that served the request, so each worker process reports its own
+series. Label values are kept to route rules, DBModel method names and similar fixed sets, never to raw URLs or SQL.
+"""
+
+# Latency buckets in seconds, from a cached lookup up to a full historical scan
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+slow_query_log = logging.getLogger('src.slow_queries')
+
+# DBModel method currently running in this thread / request, used to label the queries it issues
+current_operation = contextvars.ContextVar('current_operation', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _truncate(text):
+    return text if len(text) <= SLOW_QUERY_LOG_MAX_CHARS else text[:SLOW_QUERY_LOG_MAX_CHARS] + '...'
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram():
+    """
+    Cumulative histogram with a fixed set of label names, as in prometheus_client.
+    """
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> [count per bucket (+Inf last), sum]
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((values, list(counts), total) for values, (counts, total) in self._series.items())
+        for values, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labels, values, [f'le="{_format_number(float(bound))}"'])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, values)
+            lines.append(f'{self.name}_sum{labels} {_format_number(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Counter():
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            series = sorted(self._series.items())
+        lines += [f'{self.name}{_format_labels(self.labels, values)} {_format_number(value)}' for values, value in series]
+        return lines
+
+
+class Gauge():
+    """
+    Gauge read at scrape time from a callable returning {label values tuple: value}, e.g. the pool's current size.
+    """
+
+    def __init__(self, name, documentation, labels, collect):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        lines += [f'{self.name}{_format_labels(self.labels, values)} {_format_number(value)}'
+                  for values, value in sorted(self.collect().items())]
+        return lines
+
+
+class MetricsRegistry():
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._metrics = []
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels, collect):
+        return self._register(Gauge(name, documentation, labels, collect))
+
+    def render(self):
+        """
+        Every registered metric in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+registry = MetricsRegistry(enabled=METRICS_ENABLED)
+
+REQUEST_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'Time spent handling a request, by route rule, HTTP method and status code',
+    ('route', 'method', 'status'))
+SERIALIZATION_TIME = registry.histogram(
+    'http_response_serialization_seconds', 'Time spent encoding response bodies to JSON, by route rule', ('route',))
+MODEL_LATENCY = registry.histogram(
+    'dbmodel_method_duration_seconds', 'Duration of DBModel method calls, cache hits included', ('method',))
+QUERY_LATENCY = registry.histogram(
+    'db_query_duration_seconds', 'Duration of SQL statements, by the DBModel method that issued them', ('operation',))
+QUERY_ROWS = registry.histogram(
+    'db_query_rows', 'Rows returned or affected by SQL statements, by the DBModel method that issued them',
+    ('operation',), buckets=ROW_BUCKETS)
+SLOW_QUERIES = registry.counter(
+    'db_slow_queries_total', 'SQL statements slower than SLOW_QUERY_THRESHOLD, by issuing DBModel method',
+    ('operation',))
+POOL_WAIT = registry.histogram(
+    'db_pool_wait_seconds', 'Time spent waiting to check a connection out of the pool')
+
+
+### INSTRUMENTATION ###
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def observe_request(route, method, status, seconds):
+    if registry.enabled:
+        REQUEST_LATENCY.observe(seconds, route, method, str(status))
+
+
+@contextmanager
+def serialization_timer():
+    """
+    Time the block in http_response_serialization_seconds under the current request's route, and in the request's
+    profile if it is being profiled.
+    """
+    profile = current_profile.get()
+    if (not registry.enabled and profile is None) or not has_request_context():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if registry.enabled:
+            SERIALIZATION_TIME.observe(seconds, _route())
+        if profile is not None:
+            profile.serialization_seconds += seconds
+
+
+def observe_pool_wait(seconds):
+    if registry.enabled:
+        POOL_WAIT.observe(seconds)
+
+
+def observe_query(query, args, seconds, rows):
+    """
+    Record one SQL statement, and log it with its parameters if it took longer than SLOW_QUERY_THRESHOLD seconds.
+    """
+    if not registry.enabled:
+        return
+    operation = current_operation.get() or 'other'
+    QUERY_LATENCY.observe(seconds, operation)
+    if rows is not None and rows >= 0:
+        QUERY_ROWS.observe(rows, operation)
+    if SLOW_QUERY_THRESHOLD is not None and seconds >= SLOW_QUERY_THRESHOLD:
+        SLOW_QUERIES.inc(operation)
+        slow_query_log.warning('Slow query (%.1f ms, %s rows, %s): %s | params: %s', seconds * 1000,
+                               rows if rows is not None else '?', operation,
+                               _truncate(' '.join(query.split())), _truncate(repr(args)))
+
+
+def instrumented(cls):
+    """
+    Class decorator for DBModel: time every public method in dbmodel_method_duration_seconds and label the queries
+    it issues with its name. Generator methods (streams) are timed from the first to the last batch.
+    """
+    for name, method in list(vars(cls).items()):
+        if name.startswith('_') or not inspect.isfunction(method):
+            continue
+        if inspect.isgeneratorfunction(method):
+            setattr(cls, name, _timed_generator(method))
+        else:
+            setattr(cls, name, _timed(method))
+    return cls
+
+
+def _timed(method):
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if not registry.enabled:
+            return method(*args, **kwargs)
+        token = current_operation.set(name)
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            MODEL_LATENCY.observe(time.perf_counter() - start, name)
+            current_operation.reset(token)
+    return wrapper
+
+
+def _timed_generator(method):
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if not registry.enabled:
+            yield from method(*args, **kwargs)
+            return
+        start = time.perf_counter()
+        generator = method(*args, **kwargs)
+        try:
+            while True:
+                # Only label the queries run while the generator itself is executing, not the caller's in between
+                token = current_operation.set(name)
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    return
+                finally:
+                    current_operation.reset(token)
+                yield item
+        finally:
+            generator.close()
+            MODEL_LATENCY.observe(time.perf_counter() - start, name)
+    return wrapper
+
+
+class TimedJSONProvider(JSONProvider):
+    """
+    The API's JSON provider (see src/serialization.py), timing the responses built by jsonify.
+    """
+
+    def response(self, *args, **kwargs):
+        with serialization_timer():
+            return super().response(*args, **kwargs)
+
+
+def instrument_app(app):
+    """
+    Record the latency of every request and the time spent serializing responses. Streamed responses are timed up to
+    the point the stream starts, their encoding time is recorded batch by batch (see jsonl_response).
+    """
+    app.json_provider_class = TimedJSONProvider
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            observe_request(_route(), request.method, response.status_code, time.perf_counter() - start)
+        return response
+
+
+class InstrumentedCursor(pymysql.cursors.Cursor):
+    """
+    Default cursor of the pooled connections: records every statement in db_query_duration_seconds / db_query_rows,
+    the slow query log and the profile of the current request (see src/profiling.py). executemany goes through
+    execute, once per multi-row insert or once per row otherwise.
+    """
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        rows = super().execute(query, args)
+        seconds = time.perf_counter() - start
+        observe_query(query, args, seconds, rows)
+        profile = current_profile.get()
+        if profile is not None:
+            profile.statement(self.mogrify(query, args), current_operation.get(), seconds, rows)
+        return rows
+
+
+class InstrumentedSSCursor(pymysql.cursors.SSCursor):
+    """
+    Unbuffered variant for streamed reads. Only the time to the first row is recorded, the row count is not known
+    when execute returns.
+    """
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        rows = super().execute(query, args)
+        seconds = time.perf_counter() - start
+        observe_query(query, args, seconds, None)
+        profile = current_profile.get()
+        if profile is not None:
+            profile.statement(self.mogrify(query, args), current_operation.get(), seconds, None)
+        return rows
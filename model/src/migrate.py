@@ -0,0 +1,158 @@
+"""
+Versioned, forward-only schema migrations.
+
+Migrations are the .sql files in model/migrations, named <version>_<description>.sql (e.g. 0002_query_indexes.sql).
+Each one is applied exactly once, in version order, and recorded in the schema_migrations table together with a
+checksum of its contents. Applied migrations are never edited or rolled back: a change to the schema is always a new
+migration, and an edited file is reported as an error instead of being re-run.
+
+Usage (from the model/ folder):
+    python -m src.migrate           apply every pending migration
+    python -m src.migrate status    list applied and pending migrations
+"""
+
+# imports
+import hashlib
+import os
+import re
+import sys
+
+from src import db_pool
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+MIGRATION_FILE = re.compile(r'^(\d+)_(\w+)\.sql$')
+# Seconds to wait for another process (e.g. a second worker booting) that is already migrating
+LOCK_TIMEOUT = 60
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration():
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+        with open(path) as f:
+            self.sql = f.read()
+        self.checksum = hashlib.sha256(self.sql.encode()).hexdigest()
+
+    def statements(self):
+        """
+        Split the file into statements. Comment lines are dropped; statements end with a semicolon.
+        """
+        lines = [line for line in self.sql.splitlines() if not line.strip().startswith('--')]
+        return [stmt.strip() for stmt in '\n'.join(lines).split(';') if stmt.strip()]
+
+    def __repr__(self):
+        return f'{self.version:04d}_{self.name}'
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """
+    All migration files in version order.
+    """
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise MigrationError(f'Duplicate migration versions in {directory}')
+    return sorted(migrations, key=lambda m: m.version)
+
+
+def applied_migrations(cur):
+    """
+    Map of version -> checksum for every migration already applied to the database.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version integer NOT NULL,
+            name varchar(100) NOT NULL,
+            checksum char(64) NOT NULL,
+            applied_at datetime NOT NULL,
+            PRIMARY KEY (version)
+        );
+        """)
+    cur.execute('select version, checksum from schema_migrations')
+    return dict(cur.fetchall())
+
+
+def pending_migrations(cur, migrations):
+    """
+    Migrations that still need to be applied. Fails if an applied migration was edited or deleted, since that means
+    the database and the files no longer describe the same schema.
+    """
+    applied = applied_migrations(cur)
+    known = {m.version: m for m in migrations}
+    for version, checksum in applied.items():
+        if version not in known:
+            raise MigrationError(f'Migration {version:04d} is applied but its file is missing')
+        if known[version].checksum != checksum:
+            raise MigrationError(f'Migration {known[version]} was edited after it was applied. '
+                                 f'Add a new migration instead.')
+
+    pending = [m for m in migrations if m.version not in applied]
+    if pending and applied and pending[0].version < max(applied):
+        raise MigrationError(f'Migration {pending[0]} is older than the newest applied migration '
+                             f'{max(applied):04d}. Renumber it after the newest one.')
+    return pending
+
+
+def migrate(pool=db_pool, directory=MIGRATIONS_DIR):
+    """
+    Apply every pending migration in order and return the list of migrations applied.
+    MySQL commits DDL implicitly, so each migration is recorded as soon as its statements have run; a migration that
+    fails part-way must be fixed by hand before re-running.
+    """
+    migrations = load_migrations(directory)
+    applied = []
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            # Only one process migrates at a time, the others wait and then find nothing pending
+            cur.execute('select get_lock(%s, %s)', ('schema_migrations', LOCK_TIMEOUT))
+            if cur.fetchone()[0] != 1:
+                raise MigrationError('Timed out waiting for another process to finish migrating')
+            try:
+                for migration in pending_migrations(cur, migrations):
+                    for statement in migration.statements():
+                        try:
+                            cur.execute(statement)
+                        except Exception as e:
+                            raise MigrationError(f'Error applying migration {migration}: {e}')
+                    cur.execute('insert into schema_migrations (version, name, checksum, applied_at) '
+                                'values (%s, %s, %s, now())', (migration.version, migration.name, migration.checksum))
+                    applied.append(migration)
+            finally:
+                cur.execute('select release_lock(%s)', ('schema_migrations',))
+    return applied
+
+
+def status(pool=db_pool, directory=MIGRATIONS_DIR):
+    """
+    List of (migration, applied) pairs.
+    """
+    migrations = load_migrations(directory)
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            applied = applied_migrations(cur)
+    return [(m, m.version in applied) for m in migrations]
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'up'
+    if command == 'status':
+        for migration, is_applied in status():
+            print(f'{"applied" if is_applied else "pending":8} {migration}')
+    elif command == 'up':
+        applied = migrate()
+        for migration in applied:
+            print(f'applied  {migration}')
+        print(f'{len(applied)} migration(s) applied')
+    else:
+        print(__doc__)
+        sys.exit(2)
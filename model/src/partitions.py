@@ -0,0 +1,160 @@
+"""
+Monthly partition maintenance for the partitioned trade and fill tables (see migrations/0005_partition_trade_fill.sql).
+
+Each table has one partition per calendar month, named p<YYYYMM>, plus a catch-all p_future partition for anything
+beyond the last month. 'maintain' splits p_future so that partitions exist for PARTITION_MONTHS_AHEAD months past the
+current one. Run ahead of time, p_future is empty whenever it is split, which makes the split instant. The first run
+after the migration also creates a partition for every month that already has data, which copies the table once.
+
+Old months can be dropped as whole partitions. This is instant and never touches the remaining rows. Dropping is
+never automatic: the daily_pnl rollup keeps the P&L of dropped months, but their trades and fills are gone (archive
+them first).
+
+Usage (from the model/ folder):
+    python -m src.partitions status                 list the partitions of each table and their approximate rows
+    python -m src.partitions maintain               create the partitions for the coming months
+    python -m src.partitions drop 2021-01           drop every partition holding only months before January 2021
+"""
+
+# imports
+import sys
+from datetime import date, datetime
+
+from src import db_pool
+from src.settings import PARTITION_MONTHS_AHEAD
+
+# Partitioned table -> its partitioning column
+PARTITIONED_TABLES = {'trade': 'open_time', 'fill': 'filled_time'}
+FUTURE_PARTITION = 'p_future'
+
+
+class PartitionError(Exception):
+    pass
+
+
+def month_start(day, offset=0):
+    """
+    First day of the month offset months after the month of day.
+    """
+    months = day.year * 12 + day.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'p{month.year:04d}{month.month:02d}'
+
+
+def _parse_bound(bound):
+    """
+    Upper bound of a partition from information_schema, e.g. "'2024-02-01 00:00:00'" or MAXVALUE (None).
+    """
+    if bound == 'MAXVALUE':
+        return None
+    return datetime.fromisoformat(bound.strip("'")).date()
+
+
+class PartitionManager():
+    """
+    Creates and drops the monthly partitions of PARTITIONED_TABLES.
+    """
+
+    def __init__(self, pool=db_pool, months_ahead=PARTITION_MONTHS_AHEAD):
+        self.pool = pool
+        self.months_ahead = months_ahead
+
+    def partitions(self, cur, table):
+        """
+        [(name, upper bound as a date or None for MAXVALUE, approximate rows)] of a table, in order. Empty if the table
+        is not partitioned.
+        """
+        cur.execute("""
+            Select partition_name, partition_description, table_rows
+            from information_schema.partitions
+            where table_schema = database() and table_name = %s and partition_name is not null
+            order by partition_ordinal_position;
+            """, (table,))
+        return [(name, _parse_bound(bound), rows) for name, bound, rows in cur.fetchall()]
+
+    def maintain(self, today=None):
+        """
+        Make sure every table has monthly partitions up to months_ahead months past today. Returns
+        {table: [names of the partitions created]}.
+        """
+        today = today or date.today()
+        target = month_start(today, self.months_ahead + 1)
+        created = {}
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                for table, column in PARTITIONED_TABLES.items():
+                    partitions = self.partitions(cur, table)
+                    if not partitions:
+                        raise PartitionError(f'Table {table} is not partitioned, run the migrations first')
+                    if partitions[-1][0] != FUTURE_PARTITION:
+                        raise PartitionError(f'The last partition of {table} is not {FUTURE_PARTITION}')
+
+                    if len(partitions) > 1:
+                        start = partitions[-2][1]
+                    else:
+                        # First run: one partition per month of existing data
+                        cur.execute(f'select min({column}) from `{table}`')
+                        oldest = cur.fetchone()[0]
+                        start = month_start(oldest if oldest is not None else today)
+
+                    bounds = []
+                    month = start
+                    while month < target:
+                        bounds.append(month)
+                        month = month_start(month, 1)
+                    # The partition named after a month holds the rows before the start of the next month
+                    new = [(partition_name(m), month_start(m, 1)) for m in bounds]
+                    if not new:
+                        created[table] = []
+                        continue
+
+                    definitions = ', '.join(f"PARTITION {name} VALUES LESS THAN ('{bound.isoformat()}')"
+                                            for name, bound in new)
+                    cur.execute(f'ALTER TABLE `{table}` REORGANIZE PARTITION {FUTURE_PARTITION} INTO '
+                                f'({definitions}, PARTITION {FUTURE_PARTITION} VALUES LESS THAN (MAXVALUE))')
+                    created[table] = [name for name, _ in new]
+        return created
+
+    def drop_before(self, month):
+        """
+        Drop the partitions that only hold rows from before month (a date, rounded down to its month). Returns
+        {table: [names of the partitions dropped]}.
+        """
+        cutoff = month_start(month)
+        dropped = {}
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                for table in PARTITIONED_TABLES:
+                    names = [name for name, bound, _ in self.partitions(cur, table)
+                             if bound is not None and bound <= cutoff]
+                    if names:
+                        cur.execute(f'ALTER TABLE `{table}` DROP PARTITION {", ".join(names)}')
+                    dropped[table] = names
+        return dropped
+
+    def status(self):
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                return {table: self.partitions(cur, table) for table in PARTITIONED_TABLES}
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    manager = PartitionManager()
+    if command == 'status':
+        for table, partitions in manager.status().items():
+            print(f'{table}: {len(partitions)} partition(s)')
+            for name, bound, rows in partitions:
+                print(f'  {name:10} < {bound.isoformat() if bound else "MAXVALUE":10}  ~{rows} rows')
+    elif command == 'maintain':
+        for table, names in manager.maintain().items():
+            print(f'{table}: created {", ".join(names) if names else "nothing"}')
+    elif command == 'drop' and len(sys.argv) == 3:
+        for table, names in manager.drop_before(date.fromisoformat(sys.argv[2] + '-01')).items():
+            print(f'{table}: dropped {", ".join(names) if names else "nothing"}')
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,264 @@
+# imports
+import collections
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+import pymysql
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection could be checked out of the pool before the timeout expired.
+    """
+
+
+class ConnectionPool():
+    """
+    Thread-safe pool of database connections.
+
+    Connections are checked out for the duration of a unit of work (see connection()) and returned afterwards, so
+    concurrent requests each get their own socket instead of queueing on a single shared connection.
+    - Connections are opened on demand, none by the constructor, and open() brings the pool up to min_size; no more
+      than max_size are ever open at once.
+    - A process forked from the one that created the pool (e.g. a gunicorn worker of a preloaded app, see
+      gunicorn.conf.py) starts with an empty pool of its own and never uses a socket of its parent.
+    - A connection that has been idle for longer than ping_interval seconds is pinged on checkout, and transparently
+      replaced if the ping fails (e.g. RDS dropped the link).
+    - New connections are retried reconnect_attempts times with exponential backoff starting at reconnect_backoff.
+    """
+
+    def __init__(self, connect, min_size=2, max_size=10, timeout=10, ping_interval=30,
+                 reconnect_attempts=5, reconnect_backoff=0.1, on_wait=None):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f'Invalid pool size: min_size={min_size}, max_size={max_size}')
+
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_backoff = reconnect_backoff
+        # Optional callback receiving the seconds every checkout waited (see src/metrics.py)
+        self.on_wait = on_wait
+
+        self._init_state()
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._init_state())
+
+    def _init_state(self):
+        """
+        Start with no connections. Also runs in a forked child, where the inherited connections are dropped without
+        being closed: their sockets are shared with the parent, and a QUIT would end the parent's sessions. The lock
+        is replaced too, since it may have been held by another thread of the parent at the time of the fork.
+        """
+        # Idle connections as (connection, last_used) pairs. Most recently used connections are reused first
+        # so that surplus connections stay idle and the warmest sockets do the work.
+        self._idle = collections.deque()
+        self._size = 0
+        self._cond = threading.Condition()
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._created = 0
+        self._reconnects = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    ### CHECKOUT / RETURN ###
+
+    def acquire(self, timeout=None):
+        """
+        Check a live connection out of the pool, opening a new one if the pool is below max_size.
+        Blocks for up to timeout seconds (defaults to the pool timeout) when every connection is in use.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # Reserve the slot now and open the connection outside the lock
+                    self._size += 1
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f'No database connection available after {timeout}s '
+                                      f'({self._size} connections in use)')
+                self._cond.wait(remaining)
+
+            waited = time.monotonic() - start
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        if self.on_wait is not None:
+            self.on_wait(waited)
+
+        try:
+            if conn is None:
+                conn = self._new_connection()
+            elif not self._is_alive(conn, last_used):
+                self._close_quietly(conn)
+                conn = self._new_connection()
+                with self._cond:
+                    self._reconnects += 1
+        except Exception:
+            # Give the reserved slot back so that other threads can try again
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        return conn
+
+    def release(self, conn, discard=False):
+        """
+        Return a connection to the pool. Broken connections (or ones the caller asks to discard) are closed instead.
+        """
+        if not discard and not conn.open:
+            discard = True
+
+        with self._cond:
+            if discard:
+                self._size -= 1
+                self._discarded += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+        if discard:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Context manager that checks a connection out for the duration of the block:
+
+            with db_pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute('select 1')
+        """
+        conn = self.acquire(timeout)
+        discard = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            # The link itself is broken, never hand this connection out again
+            discard = True
+            raise
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            raise
+        finally:
+            self.release(conn, discard)
+
+    ### MAINTENANCE ###
+
+    def open(self):
+        """
+        Open connections until at least min_size are open, e.g. when a server worker starts.
+        """
+        conns = []
+        try:
+            with self._cond:
+                missing = self.min_size - (self._size - len(self._idle))
+            # Checked out all at once, so that each one is a new connection rather than the same idle one again
+            for _ in range(max(0, missing)):
+                conns.append(self.acquire())
+        finally:
+            for conn in conns:
+                self.release(conn)
+
+    def reset(self):
+        """
+        Close every idle connection and re-open min_size fresh ones. Checked-out connections are unaffected.
+        """
+        self.close()
+        self.open()
+
+    def close(self):
+        """
+        Close every idle connection. Used when shutting the application down.
+        """
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        """
+        Snapshot of the pool's size and usage counters.
+        """
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'connections_created': self._created,
+                'reconnects': self._reconnects,
+                'discarded': self._discarded,
+                'avg_wait_ms': round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'max_wait_ms': round(self._wait_max * 1000, 3),
+            }
+
+    ### HELPERS ###
+
+    def _new_connection(self):
+        """
+        Open a new connection, retrying with exponential backoff.
+        """
+        attempts = max(1, self.reconnect_attempts)
+        delay = self.reconnect_backoff
+        for attempt in range(attempts):
+            try:
+                conn = self._connect()
+            except pymysql.err.OperationalError:
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(delay)
+                delay *= 2
+                continue
+            with self._cond:
+                self._created += 1
+            return conn
+
+    def _is_alive(self, conn, last_used):
+        """
+        Liveness check on checkout. A ping is only sent if the connection has been idle for longer than ping_interval,
+        so that back-to-back requests do not pay an extra round-trip.
+        """
+        if not conn.open:
+            return False
+        if time.monotonic() - last_used < self.ping_interval:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
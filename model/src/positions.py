@@ -0,0 +1,262 @@
+# imports
+import threading
+import time
+
+
+class _Leg():
+    def __init__(self, contract):
+        self.contract = contract
+        self.qty = 0
+        self.capital = 0.0
+        self.fills = 0
+
+
+class _Trade():
+    def __init__(self, strategy_id, open_time):
+        self.strategy_id = strategy_id
+        self.open_time = open_time
+        self.legs = {}
+        self.capital = 0.0
+        self.fills = 0
+
+
+class PositionBook():
+    """
+    In-memory book of every open trade, keyed strategy -> trade -> leg, with the net quantity, capital usage
+    (sum(fill.qty * fill.avg), as in get_open_trades) and fill count of every leg.
+
+    The book is loaded from the database on first use and then kept current by polling for fills past a
+    (filled_time, fill_id) watermark, like the daily P&L rollup. Each poll also drops the trades that were closed since
+    the previous one. Totals per strategy and per contract are maintained as fills are applied, so the
+    top-of-book and strategy status reads are dictionary lookups rather than joins over trade, trade_leg and fill.
+    Fills are expected to arrive in filled_time order; anything backdated behind the watermark needs a reload().
+    """
+
+    # Open trades whose close_time is checked per statement
+    CLOSE_CHECK_BATCH = 1000
+
+    def __init__(self, pool, refresh_interval=1.0):
+        self.pool = pool
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._last_refresh = 0.0
+        self._loaded = False
+        self._reset()
+
+    def _reset(self):
+        self._trades = {}
+        self._strategies = {}
+        self._contracts = {}
+        self._names = {}
+        self._watermark = None
+
+    ### READERS ###
+
+    def maybe_refresh(self):
+        """
+        Load the book on first use, then poll for new fills at most once per refresh_interval seconds. Readers never
+        wait for another thread's poll, they read the book as of the last completed one.
+        """
+        if self._loaded and time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=not self._loaded):
+            return
+        try:
+            if not self._loaded:
+                self._load()
+            else:
+                self._poll()
+            self._last_refresh = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def strategy_summary(self, strategy_id):
+        """
+        Open trade count and capital usage of one strategy.
+        """
+        with self._lock:
+            trades, capital = self._strategies.get(strategy_id, (0, 0.0))
+        return {'active_trades': trades, 'capital_usage': round(capital, 2)}
+
+    def top_of_book(self):
+        """
+        Snapshot of all open positions: portfolio totals, one row per strategy and one row per contract with a
+        non-zero net quantity.
+        """
+        with self._lock:
+            strategies = [{'strategy_id': sid, 'strategy_name': self._names.get(sid), 'active_trades': trades,
+                           'capital_usage': round(capital, 2)}
+                          for sid, (trades, capital) in sorted(self._strategies.items())]
+            positions = [{'contract': contract, 'net_qty': qty, 'capital_usage': round(capital, 2), 'legs': legs}
+                         for contract, (qty, capital, legs) in sorted(self._contracts.items()) if qty != 0]
+            as_of = self._watermark[0] if self._watermark else None
+
+        return {
+            'capital_usage': round(sum(s['capital_usage'] for s in strategies), 2),
+            'active_trades': sum(s['active_trades'] for s in strategies),
+            'strategies': strategies,
+            'positions': positions,
+            'as_of': as_of.strftime('%Y-%m-%d %H:%M:%S') if as_of else None,
+        }
+
+    def trade_versions(self):
+        """
+        {strategy_id: {trade_id: fill count}} of every open trade, and the (filled_time, fill_id) watermark the book is
+        at. A trade's fill count grows with every fill applied to it, so two of these tell which trades changed.
+        """
+        with self._lock:
+            versions = {}
+            for trade_id, trade in self._trades.items():
+                versions.setdefault(trade.strategy_id, {})[trade_id] = trade.fills
+            return versions, self._watermark
+
+    def open_trades(self, trade_ids):
+        """
+        The given trades that are open, as dicts with their legs' net quantity and capital usage.
+        """
+        with self._lock:
+            trades = [(trade_id, self._trades.get(trade_id)) for trade_id in trade_ids]
+            return [{'trade_id': trade_id, 'strategy_id': trade.strategy_id,
+                     'open_time': trade.open_time.strftime('%Y-%m-%d %H:%M:%S') if trade.open_time else None,
+                     'capital_usage': round(trade.capital, 2), 'fills': trade.fills,
+                     'legs': [{'leg_no': leg_no, 'contract': leg.contract, 'qty': leg.qty,
+                               'capital_usage': round(leg.capital, 2), 'fills': leg.fills}
+                              for leg_no, leg in sorted(trade.legs.items())]}
+                    for trade_id, trade in trades if trade is not None]
+
+    ### MAINTENANCE ###
+
+    def reload(self):
+        """
+        Rebuild the book from the database, e.g. after backdated fills or manual corrections.
+        """
+        with self._refresh_lock:
+            self._load()
+            self._last_refresh = time.monotonic()
+
+    ### HELPERS ###
+
+    def _load(self):
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                high = self._high_watermark(cur)
+                rows = ()
+                if high is not None:
+                    cur.execute("""
+                        Select coalesce(trade.strategy_id, 0), trade.trade_id, trade.open_time, fill.leg_no,
+                        fill.contract, fill.qty, fill.avg
+                        from trade
+                        join fill on trade.trade_id = fill.trade_id
+                        where trade.close_time is null
+                        and fill.filled_time <= %s and (fill.filled_time < %s or fill.fill_id <= %s);
+                        """, (high[0], high[0], high[1]))
+                    rows = cur.fetchall()
+                cur.execute('select strategy_id, strategy_name from strategy')
+                names = dict(cur.fetchall())
+
+        with self._lock:
+            self._reset()
+            self._names = names
+            for row in rows:
+                self._apply(*row)
+            self._watermark = high
+            self._loaded = True
+
+    def _poll(self):
+        if self._watermark is None:
+            # There were no fills at all when the book was loaded
+            return self._load()
+
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                low = self._watermark
+                high = self._high_watermark(cur)
+                rows = ()
+                if high is not None and high > low:
+                    cur.execute("""
+                        Select coalesce(trade.strategy_id, 0), trade.trade_id, trade.open_time, fill.leg_no,
+                        fill.contract, fill.qty, fill.avg, trade.close_time
+                        from fill
+                        join trade on fill.trade_id = trade.trade_id
+                        where fill.filled_time >= %s and (fill.filled_time > %s or fill.fill_id > %s)
+                        and fill.filled_time <= %s and (fill.filled_time < %s or fill.fill_id <= %s);
+                        """, (low[0], low[0], low[1], high[0], high[0], high[1]))
+                    rows = cur.fetchall()
+
+                with self._lock:
+                    open_ids = list(self._trades)
+                closed = set(row[1] for row in rows if row[7] is not None)
+                for i in range(0, len(open_ids), self.CLOSE_CHECK_BATCH):
+                    batch = open_ids[i:i + self.CLOSE_CHECK_BATCH]
+                    cur.execute(f'select trade_id from trade where trade_id in ({", ".join(["%s"] * len(batch))}) '
+                                f'and close_time is not null', batch)
+                    closed.update(row[0] for row in cur.fetchall())
+
+                new_ids = set(row[0] for row in rows) - set(self._names)
+                if new_ids:
+                    cur.execute('select strategy_id, strategy_name from strategy')
+                    names = dict(cur.fetchall())
+
+        with self._lock:
+            if new_ids:
+                self._names = names
+            for row in rows:
+                if row[1] not in closed:
+                    self._apply(*row[:7])
+            for trade_id in closed:
+                self._remove(trade_id)
+            self._watermark = max(high or low, low)
+
+    def _apply(self, strategy_id, trade_id, open_time, leg_no, contract, qty, avg):
+        """
+        Add one fill of an open trade to the book and to the strategy and contract totals. Must hold the lock.
+        """
+        qty = qty or 0
+        capital = float(qty * avg) if avg is not None else 0.0
+        trade = self._trades.get(trade_id)
+        if trade is None:
+            trade = self._trades[trade_id] = _Trade(strategy_id, open_time)
+            trades, total = self._strategies.get(strategy_id, (0, 0.0))
+            self._strategies[strategy_id] = (trades + 1, total)
+        leg = trade.legs.get(leg_no)
+        if leg is None:
+            leg = trade.legs[leg_no] = _Leg(contract)
+            self._add_contract(contract, 0, 0.0, 1)
+
+        leg.qty += qty
+        leg.capital += capital
+        leg.fills += 1
+        trade.capital += capital
+        trade.fills += 1
+        trades, total = self._strategies[strategy_id]
+        self._strategies[strategy_id] = (trades, total + capital)
+        self._add_contract(leg.contract, qty, capital, 0)
+
+    def _remove(self, trade_id):
+        """
+        Take a closed trade out of the book and the totals. Must hold the lock.
+        """
+        trade = self._trades.pop(trade_id, None)
+        if trade is None:
+            return
+        trades, total = self._strategies[trade.strategy_id]
+        if trades == 1:
+            del self._strategies[trade.strategy_id]
+        else:
+            self._strategies[trade.strategy_id] = (trades - 1, total - trade.capital)
+        for leg in trade.legs.values():
+            self._add_contract(leg.contract, -leg.qty, -leg.capital, -1)
+
+    def _add_contract(self, contract, qty, capital, legs):
+        old_qty, old_capital, old_legs = self._contracts.get(contract, (0, 0.0, 0))
+        if old_legs + legs == 0:
+            self._contracts.pop(contract, None)
+        else:
+            self._contracts[contract] = (old_qty + qty, old_capital + capital, old_legs + legs)
+
+    @staticmethod
+    def _high_watermark(cur):
+        cur.execute('select filled_time, fill_id from fill where filled_time is not null '
+                    'order by filled_time desc, fill_id desc limit 1')
+        return cur.fetchone()
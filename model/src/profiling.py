@@ -0,0 +1,255 @@
+# imports
+import collections
+import contextlib
+import contextvars
+import cProfile
+import hmac
+import threading
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import urlencode
+
+from flask import g, make_response, request
+
+from src.settings import PROFILE_MAX_STATEMENTS, PROFILE_STORE_SIZE, PROFILE_TOKEN, PROFILE_TOP_N
+
+"""
+On-demand profiling of single requests.
+
+A request carrying the profiling token, in the X-Profile-Token header or the profile query parameter, is profiled:
+every SQL statement it runs with its time, row count and EXPLAIN plan, the time spent in the pandas sections of the
+DBModel methods, JSON encoding time and the top functions by cumulative time from cProfile. The response gets an
+X-Profile-Id header and a Server-Timing summary, and the full breakdown is kept in memory for GET /profiles/<id>.
+Cached results are bypassed while profiling, so that the breakdown shows the work the request really does.
+
+Profiling is off unless PROFILE_TOKEN is set. Otherwise no request hook is installed and the query / section hooks
+cost a single context variable lookup.
+"""
+
+# Profile of the request being served in this thread / context, None when it is not being profiled
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+_NO_SECTION = contextlib.nullcontext()
+
+
+def profiling():
+    return current_profile.get() is not None
+
+
+def section(name):
+    """
+    Context manager timing a block (e.g. a pandas resample) as a named section of the current profile, if any.
+    """
+    profile = current_profile.get()
+    return _NO_SECTION if profile is None else profile.section(name)
+
+
+def authorized():
+    """
+    Whether the current request carries the profiling token.
+    """
+    token = request.headers.get('X-Profile-Token') or request.args.get('profile')
+    return PROFILE_TOKEN is not None and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+class RequestProfile():
+    """
+    Breakdown of one profiled request. Statements and sections may be recorded from worker threads (e.g. the
+    dashboard sections), cProfile only covers the thread serving the request.
+    """
+
+    def __init__(self, method, path, top_n=PROFILE_TOP_N, max_statements=PROFILE_MAX_STATEMENTS):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.top_n = top_n
+        self.max_statements = max_statements
+        self.started_at = datetime.now()
+        self.status = None
+        self.seconds = None
+        self.serialization_seconds = 0.0
+
+        self._lock = threading.Lock()
+        # [(SQL with its parameters, DBModel method, seconds, rows)], in execution order
+        self._statements = []
+        self._dropped_statements = 0
+        self._sections = []
+        self._explains = {}
+        self._profiler = cProfile.Profile()
+        self._profiler_error = None
+        self._start = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        try:
+            self._profiler.enable()
+        except ValueError as e:
+            # Another profiler is already active in this thread
+            self._profiler, self._profiler_error = None, str(e)
+
+    def stop(self, status):
+        if self._profiler is not None:
+            self._profiler.disable()
+        self.seconds = time.perf_counter() - self._start
+        self.status = status
+
+    ### RECORDING ###
+
+    def statement(self, sql, operation, seconds, rows):
+        with self._lock:
+            if len(self._statements) < self.max_statements:
+                self._statements.append((sql, operation, seconds, rows))
+            else:
+                self._dropped_statements += 1
+
+    @contextlib.contextmanager
+    def section(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._sections.append((name, time.perf_counter() - start))
+
+    def explain(self, pool):
+        """
+        Run EXPLAIN on every distinct SELECT statement recorded. Called once the request is done, on a separate
+        connection, so that the plans are not part of the request's own timings.
+        """
+        from src.query_plans import explain
+
+        statements = {sql for sql, _, _, _ in self._statements if sql.lstrip().lower().startswith('select')}
+        if not statements:
+            return
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                for sql in statements:
+                    try:
+                        self._explains[sql] = explain(cur, sql)
+                    except Exception as e:
+                        self._explains[sql] = f'EXPLAIN failed: {e}'
+
+    ### READERS ###
+
+    def server_timing(self):
+        """
+        Summary for the Server-Timing response header, shown by the browser's developer tools.
+        """
+        db = sum(seconds for _, _, seconds, _ in self._statements)
+        sections = sum(seconds for _, seconds in self._sections)
+        return (f'db;dur={db * 1000:.1f};desc="{len(self._statements)} statements", '
+                f'pandas;dur={sections * 1000:.1f}, json;dur={self.serialization_seconds * 1000:.1f}, '
+                f'total;dur={self.seconds * 1000:.1f}')
+
+    def to_dict(self):
+        with self._lock:
+            statements, sections = list(self._statements), list(self._sections)
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'status': self.status,
+            'started_at': self.started_at.isoformat(),
+            'total_ms': round(self.seconds * 1000, 3),
+            'db_ms': round(sum(seconds for _, _, seconds, _ in statements) * 1000, 3),
+            'statements': [{'sql': ' '.join(sql.split()), 'operation': operation, 'ms': round(seconds * 1000, 3),
+                            'rows': rows, 'explain': self._explains.get(sql)}
+                           for sql, operation, seconds, rows in statements],
+            'dropped_statements': self._dropped_statements,
+            'sections': [{'name': name, 'ms': round(seconds * 1000, 3)} for name, seconds in sections],
+            'serialization_ms': round(self.serialization_seconds * 1000, 3),
+            'cprofile': self._top_functions() if self._profiler is not None else self._profiler_error,
+        }
+
+    def _top_functions(self):
+        """
+        The top_n functions by cumulative time, from the raw cProfile stats.
+        """
+        self._profiler.create_stats()
+        rows = sorted(self._profiler.stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top_n]
+        return [{'function': f'{filename}:{line}({name})', 'calls': calls, 'tottime_ms': round(tottime * 1000, 3),
+                 'cumtime_ms': round(cumtime * 1000, 3)}
+                for (filename, line, name), (_, calls, tottime, cumtime, _) in rows]
+
+
+class ProfileStore():
+    """
+    The last max_entries request profiles of this process, as dicts, by profile id.
+    """
+
+    def __init__(self, max_entries=PROFILE_STORE_SIZE):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        with self._lock:
+            self._entries[profile['id']] = profile
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._entries.get(profile_id)
+
+    def list(self):
+        """
+        Summaries of the stored profiles, newest first.
+        """
+        with self._lock:
+            profiles = list(self._entries.values())
+        return [{key: p[key] for key in ('id', 'method', 'path', 'status', 'started_at', 'total_ms', 'db_ms')}
+                for p in reversed(profiles)]
+
+
+profile_store = ProfileStore()
+
+
+def install_profiling(app, pool):
+    """
+    Profile the requests that carry the profiling token. Does nothing unless PROFILE_TOKEN is set.
+    """
+    if PROFILE_TOKEN is None:
+        return
+
+    @app.before_request
+    def start_profile():
+        if 'X-Profile-Token' not in request.headers and 'profile' not in request.args:
+            return None
+        if request.endpoint in ('views.profiles', 'views.profile'):
+            # Reading the stored profiles is not profiled itself
+            return None
+        if not authorized():
+            return make_response('Error: Invalid profiling token', 403)
+        # The path is stored without the token
+        query = urlencode([(k, v) for k, v in request.args.items(multi=True) if k != 'profile'])
+        profile = RequestProfile(request.method, request.path + (f'?{query}' if query else ''))
+        g.profile_token = current_profile.set(profile)
+        profile.start()
+        return None
+
+    @app.after_request
+    def finish_profile(response):
+        profile = current_profile.get()
+        if profile is None:
+            return response
+        profile.stop(response.status_code)
+        current_profile.reset(g.pop('profile_token'))
+        try:
+            profile.explain(pool)
+        except Exception:
+            # The breakdown is still useful without the plans
+            pass
+        profile_store.add(profile.to_dict())
+        response.headers['X-Profile-Id'] = profile.id
+        response.headers['Server-Timing'] = profile.server_timing()
+        return response
+
+    @app.teardown_request
+    def discard_profile(exc):
+        # The request failed before after_request ran
+        token = g.pop('profile_token', None)
+        if token is not None:
+            current_profile.get().stop(None)
+            current_profile.reset(token)
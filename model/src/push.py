@@ -0,0 +1,217 @@
+# imports
+import os
+import queue
+import threading
+import time
+import weakref
+from datetime import date
+
+
+class Subscription():
+    """
+    One subscriber of an UpdateFeed: the strategies it watches and the queue its events are delivered to. A None in the
+    queue means the feed dropped the subscription.
+    """
+
+    def __init__(self, strategy_ids, queue_size):
+        self.strategy_ids = frozenset(strategy_ids)
+        # Room for the snapshots on top of queue_size updates, so subscribing never blocks on a full queue
+        self.events = queue.Queue(maxsize=len(self.strategy_ids) + queue_size)
+
+
+class UpdateFeed():
+    """
+    Pushes open-trade, capital usage and today's P&L changes of the subscribed strategies, instead of every open screen
+    polling the full queries.
+
+    A single background thread per process polls the in-memory position book (see src/positions.py), which reads only
+    the fills past its watermark, and diffs every watched strategy's open trades against the previous poll. Today's P&L
+    is only re-read from the daily_pnl rollup when the watermark moved. Each subscriber gets a snapshot of its
+    strategies when it subscribes and then only the trades that changed or closed, so database load follows the fill
+    rate and not the number of subscribers.
+
+    The thread starts with the first subscription and idles while there is none. A subscriber that falls more than
+    queue_size events behind is dropped, and reconnecting gets it a fresh snapshot.
+
+    Polls and subscriptions are serialized, so that a subscriber's snapshot is never older than the baseline the next
+    poll diffs against: a poll running between the snapshot and the registration would otherwise advance the shared
+    baseline past it, and the subscriber would never get the changes in between.
+    """
+
+    def __init__(self, pool, position_book, pnl_rollup, registry, interval=1.0, queue_size=100):
+        self.pool = pool
+        self.position_book = position_book
+        self.pnl_rollup = pnl_rollup
+        self.strategies = registry
+        self.interval = interval
+        self.queue_size = queue_size
+        self._init_state()
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._init_state())
+
+    def _init_state(self):
+        """
+        No subscribers and no poll thread. Also runs in a forked child (e.g. a gunicorn worker), which does not inherit
+        the parent's thread and starts its own with its first subscriber.
+        """
+        self._lock = threading.Lock()
+        # Held by a poll and by a subscription from its snapshot to its registration
+        self._poll_lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+        # strategy_id -> {trade_id: fill count} as of the last poll, for the strategies watched at the time
+        self._versions = {}
+        self._watermark = None
+        # strategy_id -> today's P&L, and the day it is for
+        self._pnl = {}
+        self._pnl_date = None
+
+        self._polls = 0
+        self._events = 0
+        self._dropped = 0
+        self._last_error = None
+
+    ### SUBSCRIBERS ###
+
+    def subscribe(self, strategy_ids):
+        """
+        Register a subscriber for these strategy ids. Its queue starts with one snapshot event per strategy.
+        """
+        subscription = Subscription(strategy_ids, self.queue_size)
+        with self._poll_lock:
+            self.position_book.maybe_refresh()
+            versions, _ = self.position_book.trade_versions()
+            pnl = self._today_pnl(subscription.strategy_ids)
+            for strategy_id in sorted(subscription.strategy_ids):
+                trades = versions.get(strategy_id, {})
+                subscription.events.put_nowait(('snapshot', self._event(strategy_id, sorted(trades), [], pnl)))
+
+            with self._lock:
+                # Strategies nobody watched yet are diffed against this snapshot from the next poll on. Watched ones
+                # keep the last poll's baseline, which is not newer than the snapshot: the next update may repeat
+                # changes the snapshot already has, but cannot miss any.
+                for strategy_id in subscription.strategy_ids:
+                    self._versions.setdefault(strategy_id, versions.get(strategy_id, {}))
+                    self._pnl.setdefault(strategy_id, pnl[strategy_id])
+                self._subscribers.add(subscription)
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='update-feed', daemon=True)
+                    self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'watched_strategies': len(self._versions),
+                'polls': self._polls,
+                'events': self._events,
+                'dropped_subscribers': self._dropped,
+                'last_error': self._last_error,
+            }
+
+    ### HELPERS ###
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            # Subscribers are listed under the poll lock, so that every subscriber registered before the poll gets its
+            # events
+            with self._poll_lock:
+                with self._lock:
+                    subscribers = list(self._subscribers)
+                    if not subscribers:
+                        self._versions, self._pnl = {}, {}
+                        continue
+                try:
+                    self._poll(subscribers)
+                    self._last_error = None
+                except Exception as e:
+                    # Keep the feed alive through database hiccups, the next poll diffs against the last good one
+                    self._last_error = f'{type(e).__name__}: {e}'
+
+    def _poll(self, subscribers):
+        self.position_book.maybe_refresh()
+        versions, watermark = self.position_book.trade_versions()
+        watched = set().union(*(s.strategy_ids for s in subscribers))
+        with self._lock:
+            previous, previous_pnl = dict(self._versions), dict(self._pnl)
+
+        pnl = previous_pnl
+        if watermark != self._watermark or self._pnl_date != date.today():
+            pnl = self._today_pnl(watched)
+            self._pnl_date = date.today()
+
+        events = {}
+        for strategy_id in watched:
+            old, new = previous.get(strategy_id, {}), versions.get(strategy_id, {})
+            changed = sorted(trade_id for trade_id, fills in new.items() if old.get(trade_id) != fills)
+            closed = sorted(trade_id for trade_id in old if trade_id not in new)
+            if changed or closed or pnl.get(strategy_id) != previous_pnl.get(strategy_id):
+                events[strategy_id] = ('update', self._event(strategy_id, changed, closed, pnl))
+
+        for subscription in subscribers:
+            for strategy_id in sorted(subscription.strategy_ids & set(events)):
+                try:
+                    subscription.events.put_nowait(events[strategy_id])
+                    self._events += 1
+                except queue.Full:
+                    self._drop(subscription)
+                    break
+
+        with self._lock:
+            # No subscription can start during the poll, so the strategies watched now are all there is to track
+            self._versions = {strategy_id: versions.get(strategy_id, {}) for strategy_id in watched}
+            self._pnl = {strategy_id: pnl.get(strategy_id, 0.0) for strategy_id in watched}
+            self._polls += 1
+        self._watermark = watermark
+
+    def _drop(self, subscription):
+        self.unsubscribe(subscription)
+        self._dropped += 1
+        # Make room for the end-of-stream marker, the subscriber resyncs from a new snapshot anyway
+        while True:
+            try:
+                subscription.events.get_nowait()
+            except queue.Empty:
+                break
+        subscription.events.put_nowait(None)
+
+    def _event(self, strategy_id, trade_ids, closed, pnl):
+        """
+        Payload of a snapshot / update event: the strategy's totals, the given open trades in full and the closed ones.
+        """
+        summary = self.position_book.strategy_summary(strategy_id)
+        return {
+            'strategy_id': strategy_id,
+            'strategy_name': self.strategies.name(strategy_id),
+            'active_trades': summary['active_trades'],
+            'capital_usage': summary['capital_usage'],
+            'today_pnl': pnl.get(strategy_id, 0.0),
+            'trades': self.position_book.open_trades(trade_ids),
+            'closed_trades': closed,
+        }
+
+    def _today_pnl(self, strategy_ids):
+        """
+        {strategy_id: today's P&L} from the daily_pnl rollup, brought up to date first.
+        """
+        today = date.today()
+        pnl = {}
+        if strategy_ids:
+            self.pnl_rollup.maybe_refresh()
+            ids = sorted(strategy_ids)
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"""
+                        Select daily_pnl.strategy_id, sum(daily_pnl.pnl)
+                        from daily_pnl
+                        where daily_pnl.date = %s and daily_pnl.strategy_id in ({", ".join(["%s"] * len(ids))})
+                        group by daily_pnl.strategy_id;
+                        """, (today,) + tuple(ids))
+                    pnl = {strategy_id: round(float(value), 2) for strategy_id, value in cur.fetchall()}
+        return {strategy_id: pnl.get(strategy_id, 0.0) for strategy_id in strategy_ids}
@@ -0,0 +1,128 @@
+"""
+Query-plan regression check for the DBModel read methods.
+
+Runs every DBModel read method against the configured database, records each SQL statement it issues and runs
+EXPLAIN on it. A plan that reads a table with access type ALL (a full table scan) fails the check, unless that table
+is expected to be scanned for that method (e.g. listing every strategy). Run it against a local MySQL loaded with
+realistic data volumes, since the optimizer may legitimately prefer a full scan on a handful of demo rows.
+
+Usage (from the model/ folder, after 'python -m src.migrate'):
+    python -m src.query_plans       exits with status 1 if any plan regressed
+"""
+
+# imports
+import sys
+from functools import partial
+
+import pymysql
+import pymysql.cursors
+
+from src.db_model import DBModel
+from src.pool import ConnectionPool
+from src.settings import *
+
+
+class RecordingCursor(pymysql.cursors.Cursor):
+    """
+    Cursor that keeps the final SQL of every statement it executes while recording is switched on.
+    """
+    statements = None
+
+    def execute(self, query, args=None):
+        if RecordingCursor.statements is not None:
+            RecordingCursor.statements.append(self.mogrify(query, args))
+        return super().execute(query, args)
+
+
+# (DBModel method, function building its arguments from sample ids, tables it is allowed to scan in full)
+CHECKS = [
+    ('get_strategy_info', lambda s: (s['strategy'],), ()),
+    ('get_strategy_info', lambda s: ('*',), ('strategy',)),
+    ('get_active_strategies', lambda s: (), ('strategy',)),
+    ('get_daily_pnl', lambda s: (), ('daily_pnl',)),
+    ('get_strategy_pnl', lambda s: (s['strategy'],), ()),
+    ('get_strategies_pnl', lambda s: ([s['strategy']],), ()),
+    ('get_strategy_statistics', lambda s: (s['strategy'],), ()),
+    ('get_strategies_statistics', lambda s: ((s['strategy'],),), ()),
+    ('get_open_trades', lambda s: (s['strategy'],), ()),
+    ('get_historical_trades', lambda s: (s['strategy'], 0), ()),
+    ('get_historical_trades', lambda s: (s['strategy'], 6), ()),
+    ('get_historical_trades', lambda s: (s['strategy'], 0, '2000-01-01 00:00:00', 0, 100), ()),
+    ('get_trade_info', lambda s: (s['trade_id'],), ()),
+    ('get_trade_leg_info', lambda s: (s['trade_id'], s['leg_no']), ()),
+    ('get_fill_info', lambda s: (s['fill_id'],), ()),
+    ('strategy_exists', lambda s: (s['strategy'],), ()),
+]
+
+
+def sample_ids(cur):
+    """
+    A strategy that has trades, and one of its fills, to use as method arguments.
+    """
+    cur.execute("""
+        Select strategy.strategy_name, fill.trade_id, fill.leg_no, fill.fill_id
+        from fill
+        join trade on fill.trade_id = trade.trade_id
+        join strategy on trade.strategy_id = strategy.strategy_id
+        limit 1;
+        """)
+    row = cur.fetchone()
+    if row is None:
+        raise Exception('The database has no fills to check query plans against')
+    return dict(zip(['strategy', 'trade_id', 'leg_no', 'fill_id'], row))
+
+
+def explain(cur, statement):
+    cur.execute(f'EXPLAIN {statement}')
+    columns = [x[0] for x in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+def check_query_plans(pool):
+    """
+    Run every check and return a list of (method, args, statement, plan row) tuples for each full table scan found.
+    """
+    model = DBModel(pool=pool)
+    with pool.connection() as conn:
+        with conn.cursor(pymysql.cursors.Cursor) as cur:
+            samples = sample_ids(cur)
+
+    failures = []
+    for method, build_args, allowed_scans in CHECKS:
+        args = build_args(samples)
+        RecordingCursor.statements = []
+        try:
+            getattr(model, method)(*args)
+            statements = RecordingCursor.statements
+        finally:
+            RecordingCursor.statements = None
+
+        with pool.connection() as conn:
+            with conn.cursor(pymysql.cursors.Cursor) as cur:
+                for statement in statements:
+                    if not statement.lstrip().lower().startswith('select'):
+                        continue
+                    for row in explain(cur, statement):
+                        if row['type'] == 'ALL' and row['table'] not in allowed_scans:
+                            failures.append((method, args, statement, row))
+    return failures
+
+
+def recording_pool():
+    """
+    A small pool on the configured database whose connections record their statements for check_query_plans.
+    """
+    return ConnectionPool(
+        partial(pymysql.connect, host=RDS_HOSTNAME, user=RDS_USER, password=RDS_PASSWORD, database=DB_NAME,
+                autocommit=True, cursorclass=RecordingCursor),
+        min_size=1, max_size=2)
+
+
+if __name__ == '__main__':
+    failures = check_query_plans(recording_pool())
+    for method, args, statement, row in failures:
+        print(f'FULL SCAN in {method}{args} on table {row["table"]} (rows={row["rows"]}, extra={row["Extra"]}):')
+        print(' '.join(statement.split()))
+        print()
+    print(f'{len(CHECKS)} methods checked, {len(failures)} full table scan(s) found')
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,112 @@
+# imports
+import threading
+import time
+
+
+class StrategyRegistry():
+    """
+    In-memory copy of the strategy table: name -> strategy_id and strategy_id -> row (every column of the table).
+
+    The table is tiny and rarely changes, so it is loaded once (on first use) and reloaded only when a change-detection
+    probe, a count and a CRC32 sum over every column, differs from the one taken at the last load. The probe runs at
+    most once per refresh_interval seconds per process. Lookups are plain dict reads, so the DBModel methods resolve
+    names without a query and filter trade / daily_pnl on strategy_id without joining strategy.
+    """
+
+    def __init__(self, pool, refresh_interval=5.0):
+        self.pool = pool
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._signature = None
+        # (columns, strategy_id -> row, name -> strategy_id), replaced as a whole on reload
+        self._table = ([], {}, {})
+
+    ### LOOKUPS ###
+
+    def strategy_id(self, name):
+        """
+        The id of the strategy with this name, or None if there is no such strategy.
+        """
+        self.maybe_refresh()
+        return self._table[2].get(name)
+
+    def exists(self, name):
+        return self.strategy_id(name) is not None
+
+    def get(self, strategy_id):
+        """
+        The strategy's row as a dict of column -> value, or None if there is no such strategy.
+        """
+        self.maybe_refresh()
+        return self._table[1].get(strategy_id)
+
+    def name(self, strategy_id):
+        row = self.get(strategy_id)
+        return None if row is None else row['strategy_name']
+
+    def ids(self, names):
+        """
+        Ids of the named strategies that exist, in the order given.
+        """
+        self.maybe_refresh()
+        by_name = self._table[2]
+        return [by_name[n] for n in names if n in by_name]
+
+    def active_ids(self):
+        """
+        Ids of every active strategy (no termination_date), in id order.
+        """
+        self.maybe_refresh()
+        return [sid for sid, row in sorted(self._table[1].items()) if row['termination_date'] is None]
+
+    def rows(self, strategy_ids=None):
+        """
+        (columns, row tuples) of the given strategies in the order given, or of every strategy in id order.
+        """
+        self.maybe_refresh()
+        columns, by_id, _ = self._table
+        ids = sorted(by_id) if strategy_ids is None else [sid for sid in strategy_ids if sid in by_id]
+        return columns, [tuple(by_id[sid][col] for col in columns) for sid in ids]
+
+    ### MAINTENANCE ###
+
+    def maybe_refresh(self):
+        """
+        Load the registry on first use, then probe for changes at most once per refresh_interval seconds.
+        """
+        if self._signature is not None and time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+        with self._lock:
+            if self._signature is not None and time.monotonic() - self._checked_at < self.refresh_interval:
+                return
+            self._refresh()
+
+    def reload(self):
+        with self._lock:
+            self._signature = None
+            self._refresh()
+
+    ### HELPERS ###
+
+    def _refresh(self):
+        """
+        Probe the strategy table and reload it if it changed. Must be called with the lock held.
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    Select count(*), coalesce(sum(crc32(concat_ws('|', strategy_id, strategy_name, documentation_link,
+                    host_link, launch_date, termination_date))), 0)
+                    from strategy;
+                    """)
+                signature = tuple(cur.fetchone())
+                if signature != self._signature:
+                    cur.execute('select * from strategy order by strategy_id')
+                    columns = [x[0] for x in cur.description]
+                    rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+                    # Swapped in as one tuple, so lock-free readers see either the old or the new table
+                    self._table = (columns, {row['strategy_id']: row for row in rows},
+                                   {row['strategy_name']: row['strategy_id'] for row in rows})
+                    self._signature = signature
+        self._checked_at = time.monotonic()
@@ -0,0 +1,250 @@
+# imports
+import contextvars
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+import pymysql
+from flask import g, make_response, request
+
+from src.pool import PoolTimeout
+
+# Replication lag (seconds) the current request tolerates, None for the router's default (see install_lag_tolerance)
+max_lag = contextvars.ContextVar('max_replica_lag', default=None)
+# [largest lag of the replicas read from, None if none was] while a computation is being tracked (see track_lag)
+_lag_seen = contextvars.ContextVar('replica_lag_seen', default=None)
+
+
+def begin_lag_tracking():
+    """
+    Start tracking the replicas read from in this context, returns the token for end_lag_tracking.
+    """
+    return _lag_seen.set([None])
+
+
+def end_lag_tracking(token):
+    """
+    Stop tracking and return the largest replication lag (seconds) of the replicas read from since
+    begin_lag_tracking, or None if every read went to the primary. An enclosing tracked block is told about it too.
+    """
+    lag = _lag_seen.get()[0]
+    _lag_seen.reset(token)
+    if lag is not None:
+        note_lag(lag)
+    return lag
+
+
+@contextmanager
+def track_lag():
+    """
+    Track the replicas read from inside the block, e.g. by a result that is about to be cached. Yields a one-element
+    list holding the largest lag seen, None as long as only the primary was read.
+    """
+    token = begin_lag_tracking()
+    seen = _lag_seen.get()
+    try:
+        yield seen
+    finally:
+        end_lag_tracking(token)
+
+
+def note_lag(lag):
+    """
+    Report data read from a replica lag seconds behind the primary to the enclosing tracked block, if any (e.g. on a
+    cache hit on an entry computed from a replica).
+    """
+    seen = _lag_seen.get()
+    if seen is not None and (seen[0] is None or lag > seen[0]):
+        seen[0] = lag
+
+
+class Replica():
+    """
+    One read replica: its connection pool and the result of its last health check.
+    """
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.healthy = False
+        self.lag = None
+        self.error = None
+        self.checked_at = None
+        self.reads = 0
+        self.lock = threading.Lock()
+
+
+class ReplicaRouter():
+    """
+    Routes DBModel's analytic reads (P&L, statistics, historical trades and what risk is computed from) to read
+    replicas, round-robin, while writes and freshness-sensitive reads (open trades, top of book, single-row lookups)
+    use the primary pool directly.
+
+    Each replica is health-checked at most once per check_interval seconds, when a read is routed to it: a replica
+    that cannot be reached, whose replication threads are stopped or that is further behind the primary than the
+    request tolerates (max_lag seconds by default, see install_lag_tolerance) is skipped. When no replica qualifies the
+    read goes to the primary. An instance that is not replicating at all (empty SHOW REPLICA STATUS) counts as up to
+    date, so that a second, standalone local MySQL loaded with the same data can stand in for a replica in testing.
+
+    Without replicas every read simply goes to the primary.
+    """
+
+    def __init__(self, primary, replicas=(), max_lag=30.0, check_interval=5.0):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._next = 0
+        self._primary_reads = 0
+        self._fallbacks = 0
+
+    ### ROUTING ###
+
+    def choose(self):
+        """
+        The pool the next analytic read should use: the next healthy replica within the tolerated lag, or the primary.
+        """
+        if not self.replicas:
+            return self.primary
+        tolerance = self.max_lag if max_lag.get() is None else max_lag.get()
+        if tolerance > 0:
+            for _ in range(len(self.replicas)):
+                with self._lock:
+                    replica = self.replicas[self._next % len(self.replicas)]
+                    self._next += 1
+                self._maybe_check(replica)
+                if replica.healthy and replica.lag <= tolerance:
+                    with self._lock:
+                        replica.reads += 1
+                    note_lag(replica.lag)
+                    return replica.pool
+            with self._lock:
+                self._fallbacks += 1
+        with self._lock:
+            self._primary_reads += 1
+        return self.primary
+
+    @contextmanager
+    def connection(self):
+        """
+        Like ConnectionPool.connection(), on the pool chosen for an analytic read. A replica that cannot be connected
+        to is marked down and the read goes to the primary instead.
+        """
+        pool = self.choose()
+        with ExitStack() as stack:
+            try:
+                conn = stack.enter_context(pool.connection())
+            except (pymysql.err.OperationalError, PoolTimeout) as e:
+                if pool is self.primary:
+                    raise
+                self._mark_down(pool, e)
+                with self._lock:
+                    self._fallbacks += 1
+                conn = stack.enter_context(self.primary.connection())
+            yield conn
+
+    ### MAINTENANCE ###
+
+    def close(self):
+        for replica in self.replicas:
+            replica.pool.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_lag': self.max_lag,
+                'primary_reads': self._primary_reads,
+                'fallbacks': self._fallbacks,
+                'replicas': [{'name': r.name, 'healthy': r.healthy, 'lag': r.lag, 'error': r.error, 'reads': r.reads}
+                             for r in self.replicas],
+            }
+
+    ### HELPERS ###
+
+    def _maybe_check(self, replica):
+        if replica.checked_at is not None and time.monotonic() - replica.checked_at < self.check_interval:
+            return
+        # One thread checks while the others route on the previous result
+        if not replica.lock.acquire(blocking=replica.checked_at is None):
+            return
+        try:
+            if replica.checked_at is None or time.monotonic() - replica.checked_at >= self.check_interval:
+                self._check(replica)
+        finally:
+            replica.lock.release()
+
+    def _check(self, replica):
+        try:
+            with replica.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    lag, error = self._lag(self._replication_status(cur))
+        except Exception as e:
+            lag, error = None, f'{type(e).__name__}: {e}'
+        replica.healthy, replica.lag, replica.error = error is None, lag, error
+        replica.checked_at = time.monotonic()
+
+    def _mark_down(self, pool, error):
+        for replica in self.replicas:
+            if replica.pool is pool:
+                replica.healthy, replica.error = False, f'{type(error).__name__}: {error}'
+                replica.checked_at = time.monotonic()
+
+    @staticmethod
+    def _replication_status(cur):
+        """
+        SHOW REPLICA STATUS as a dict, or None if the server is not a replica. Falls back to SHOW SLAVE STATUS on
+        MySQL versions before 8.0.22.
+        """
+        try:
+            cur.execute('SHOW REPLICA STATUS')
+        except pymysql.err.ProgrammingError:
+            cur.execute('SHOW SLAVE STATUS')
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return dict(zip([x[0] for x in cur.description], row))
+
+    @staticmethod
+    def _lag(status):
+        """
+        (seconds behind the primary, None) of a replication status, or (None, reason) if the replica is not usable.
+        """
+        if status is None:
+            return 0.0, None
+        io = status.get('Replica_IO_Running', status.get('Slave_IO_Running'))
+        sql = status.get('Replica_SQL_Running', status.get('Slave_SQL_Running'))
+        if io != 'Yes' or sql != 'Yes':
+            return None, f'Replication is not running (IO thread: {io}, SQL thread: {sql})'
+        seconds = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+        if seconds is None:
+            return None, 'Replication lag is unknown'
+        return float(seconds), None
+
+
+def install_lag_tolerance(app):
+    """
+    Let a request set the replication lag it tolerates, in seconds, with the max_lag query parameter or the
+    X-Max-Replica-Lag header. 0 sends all of its reads to the primary.
+    """
+
+    @app.before_request
+    def set_lag_tolerance():
+        value = request.args.get('max_lag', request.headers.get('X-Max-Replica-Lag'))
+        if value is None:
+            return None
+        try:
+            seconds = float(value)
+            if seconds < 0:
+                raise ValueError
+        except ValueError:
+            return make_response(f'Error: max_lag must be a non-negative number of seconds, got {value}', 400)
+        g.max_lag_token = max_lag.set(seconds)
+        return None
+
+    @app.teardown_request
+    def reset_lag_tolerance(exc):
+        # Threads are reused across requests, the tolerance must not carry over to the next one
+        token = g.pop('max_lag_token', None)
+        if token is not None:
+            max_lag.reset(token)
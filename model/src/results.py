@@ -0,0 +1,92 @@
+# imports
+import numpy as np
+import pandas as pd
+
+
+class ResultSet():
+    """
+    Query result held column by column: one NumPy array per column instead of one dict per row.
+
+    Numeric columns without NULLs become typed arrays (int64/float64); everything else (strings, datetimes, Decimals,
+    columns containing NULL) is kept as an object array so values round-trip unchanged. Rows are only materialized as
+    dicts when a caller asks for to_records(), i.e. once, at serialization time.
+
+    ----- Example -----
+
+    result = ResultSet.from_cursor(cur)
+    result.columns          -> ['date', 'pnl']
+    result['pnl'].sum()     -> -1234.5
+    result.to_columnar()    -> {"columns": ["date", "pnl"], "data": {"date": [...], "pnl": [...]}}
+    """
+
+    def __init__(self, columns, data):
+        self.columns = list(columns)
+        self.data = data
+
+    @classmethod
+    def from_cursor(cls, cur):
+        """
+        Fetch every remaining row of an executed cursor straight into column arrays.
+        """
+        columns = [x[0] for x in cur.description]
+        return cls.from_rows(columns, cur.fetchall())
+
+    @classmethod
+    def from_rows(cls, columns, rows):
+        if len(rows) == 0:
+            return cls(columns, {col: np.array([], dtype=object) for col in columns})
+        return cls(columns, {col: cls._to_array(values) for col, values in zip(columns, zip(*rows))})
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(df.columns, {col: df[col].to_numpy() for col in df.columns})
+
+    ### ACCESS ###
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        return len(self.data[self.columns[0]])
+
+    def __getitem__(self, column):
+        return self.data[column]
+
+    def first(self, column, default=None):
+        """
+        Value of column in the first row, or default if there are no rows.
+        """
+        if len(self) == 0:
+            return default
+        value = self.data[column][0]
+        return value.item() if isinstance(value, np.generic) else value
+
+    ### CONVERSION ###
+
+    def to_frame(self):
+        return pd.DataFrame(self.data, columns=self.columns)
+
+    def to_lists(self):
+        """
+        Columns as plain Python lists (NumPy scalars converted to int/float).
+        """
+        return {col: self.data[col].tolist() for col in self.columns}
+
+    def to_records(self):
+        """
+        Rows as a list of dicts, the shape every endpoint returned before columnar responses existed.
+        """
+        lists = self.to_lists()
+        return [dict(zip(self.columns, row)) for row in zip(*[lists[col] for col in self.columns])]
+
+    def to_columnar(self):
+        return {'columns': self.columns, 'data': self.to_lists()}
+
+    ### HELPERS ###
+
+    @staticmethod
+    def _to_array(values):
+        if isinstance(values[0], (int, float)):
+            arr = np.array(values)
+            if arr.dtype.kind in 'biuf':
+                return arr
+        return np.array(values, dtype=object)
@@ -0,0 +1,190 @@
+# imports
+import collections
+import threading
+from statistics import NormalDist
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+RISK_METHODS = ('historical', 'parametric')
+
+
+### VECTORIZED METRICS ###
+
+def window_var_es(windows, confidence, method):
+    """
+    Value at Risk and Expected Shortfall for every row of a 2-D array of daily P&L windows (one window per row).
+    Both are reported as positive losses at the given confidence level (e.g. 0.95).
+    - historical: VaR is the (1 - confidence) quantile of the window, ES the mean of the P&L at or below it.
+    - parametric: normal approximation from the window's mean and standard deviation.
+    """
+    alpha = 1 - confidence
+    if method == 'historical':
+        ordered = np.sort(windows, axis=1)
+        var = -np.quantile(ordered, alpha, axis=1)
+        tail = max(1, int(np.ceil(windows.shape[1] * alpha)))
+        es = -ordered[:, :tail].mean(axis=1)
+    elif method == 'parametric':
+        mean = windows.mean(axis=1)
+        std = windows.std(axis=1, ddof=1) if windows.shape[1] > 1 else np.zeros(len(windows))
+        z = NormalDist().inv_cdf(alpha)
+        var = -(mean + z * std)
+        es = -(mean - std * NormalDist().pdf(z) / alpha)
+    else:
+        raise ValueError(f'Unknown risk method {method}, expected one of {", ".join(RISK_METHODS)}')
+    return var, es
+
+
+def rolling_var_es(pnl, window, confidence, method):
+    """
+    VaR and ES over a rolling window ending on every day of pnl. Days without a full window are NaN.
+    """
+    var = np.full(len(pnl), np.nan)
+    es = np.full(len(pnl), np.nan)
+    if len(pnl) >= window:
+        var[window - 1:], es[window - 1:] = window_var_es(sliding_window_view(pnl, window), confidence, method)
+    return var, es
+
+
+def drawdown(pnl, peak=0.0, equity=0.0):
+    """
+    Drawdown of cumulative P&L on every day, as a non-positive number. peak/equity carry the running state over from
+    the days before pnl, so that drawdowns can be extended one day at a time.
+    """
+    curve = equity + np.cumsum(pnl)
+    running_peak = np.maximum.accumulate(np.maximum(curve, peak))
+    return curve - running_peak, curve, running_peak
+
+
+### ENGINE ###
+
+class _RiskState():
+    """
+    Cached results for one (method, confidence, window) over the closed days seen so far.
+    """
+
+    def __init__(self):
+        self.pnl = np.empty(0)
+        self.var = np.empty(0)
+        self.es = np.empty(0)
+        self.dd = np.empty(0)
+        self.equity = 0.0
+        self.peak = 0.0
+
+
+class RiskEngine():
+    """
+    Portfolio risk metrics over a daily P&L series: VaR and ES (historical or parametric, at any confidence level and
+    rolling window), maximum drawdown and the date it was reached.
+
+    Closed days never change, so their rolling values are cached per (method, confidence, window). A refresh only
+    computes the days added since the previous call; today's (still open) day is evaluated on top of the cache on every
+    call without being stored. If an already-cached day changed (e.g. the P&L rollup was rebuilt) the cache for that
+    key is recomputed from scratch. Confidence and window come from the request, so at most max_states keys are kept,
+    least recently used first out.
+    """
+
+    def __init__(self, max_states=64):
+        self.max_states = max_states
+        # (method, confidence, window) -> _RiskState, least recently used first
+        self._states = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def metrics(self, dates, pnl, today, confidence=0.95, window=252, method='historical', series=False):
+        """
+        dates: 'YYYY-MM-DD' strings in ascending order, pnl: daily P&L for those dates, today: 'YYYY-MM-DD'.
+        Returns a dict of the current VaR, ES, MaxDD and MaxDDDate (plus the rolling series if asked for).
+        """
+        if method not in RISK_METHODS:
+            raise ValueError(f'Unknown risk method {method}, expected one of {", ".join(RISK_METHODS)}')
+        if not 0 < confidence < 1:
+            raise ValueError(f'Confidence must be between 0 and 1, got {confidence}')
+        if window < 2:
+            raise ValueError(f'Window must be at least 2 days, got {window}')
+
+        dates = np.asarray(dates, dtype=object)
+        pnl = np.asarray(pnl, dtype=np.float64)
+        n_closed = int(np.searchsorted(dates, today, side='left'))
+        with self._lock:
+            state = self._refresh((method, confidence, window), pnl[:n_closed], confidence, window, method)
+
+            # Today's partial day on top of the cached closed days
+            open_pnl = pnl[n_closed:]
+            if len(open_pnl):
+                tail = np.concatenate([state.pnl[-(window - 1):], open_pnl])
+                var_open, es_open = rolling_var_es(tail, min(window, len(tail)), confidence, method)
+                var_open, es_open = var_open[-len(open_pnl):], es_open[-len(open_pnl):]
+                dd_open = drawdown(open_pnl, state.peak, state.equity)[0]
+            else:
+                var_open = es_open = dd_open = np.empty(0)
+
+            var = np.concatenate([state.var, var_open])
+            es = np.concatenate([state.es, es_open])
+            dd = np.concatenate([state.dd, dd_open])
+
+        result = {
+            'VaR': None, 'ES': None, 'MaxDD': None, 'MaxDDDate': None,
+            'method': method, 'confidence': confidence, 'window': window, 'days': len(pnl),
+            'as_of': dates[-1] if len(dates) else None,
+        }
+        if len(pnl) == 0:
+            return result
+
+        if np.isnan(var[-1]):
+            # Less history than one full window: use everything available
+            current_var, current_es = window_var_es(pnl[np.newaxis, :], confidence, method) if len(pnl) > 1 \
+                else (np.array([np.nan]), np.array([np.nan]))
+            var[-1], es[-1] = current_var[0], current_es[0]
+        worst = int(np.argmin(dd))
+        result.update({
+            'VaR': _rounded(var[-1]),
+            'ES': _rounded(es[-1]),
+            'MaxDD': _rounded(dd[worst]),
+            'MaxDDDate': dates[worst] if dd[worst] < 0 else None,
+        })
+        if series:
+            result['series'] = {
+                'date': dates.tolist(),
+                'VaR': [_rounded(x) for x in var],
+                'ES': [_rounded(x) for x in es],
+                'drawdown': [_rounded(x) for x in dd],
+            }
+        return result
+
+    def _refresh(self, key, closed_pnl, confidence, window, method):
+        """
+        Bring the cached state for key up to date with closed_pnl. Must be called with the lock held.
+        """
+        state = self._states.get(key)
+        n_cached = 0 if state is None else len(state.pnl)
+        if state is None or n_cached > len(closed_pnl) or not np.array_equal(state.pnl, closed_pnl[:n_cached]):
+            state = _RiskState()
+            n_cached = 0
+
+        if len(closed_pnl) > n_cached:
+            new_pnl = closed_pnl[n_cached:]
+            # Rolling windows for the new days only reach back window - 1 cached days
+            lookback = min(n_cached, window - 1)
+            var, es = rolling_var_es(closed_pnl[n_cached - lookback:], window, confidence, method)
+            dd, curve, running_peak = drawdown(new_pnl, state.peak, state.equity)
+
+            state.pnl = closed_pnl.copy()
+            state.var = np.concatenate([state.var, var[lookback:]])
+            state.es = np.concatenate([state.es, es[lookback:]])
+            state.dd = np.concatenate([state.dd, dd])
+            state.equity = float(curve[-1])
+            state.peak = float(running_peak[-1])
+
+        self._states[key] = state
+        self._states.move_to_end(key)
+        while len(self._states) > self.max_states:
+            self._states.popitem(last=False)
+        return state
+
+
+def _rounded(value):
+    return None if np.isnan(value) else round(float(value), 2)
+
+
+# risk engine shared by all requests, so the cache survives between them
+risk_engine = RiskEngine()
@@ -0,0 +1,416 @@
+# imports
+import json
+import math
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+# Rolling windows in days, each with a volatility_<w> and sharpe_<w> column in rolling_stats
+WINDOWS = (20, 60, 252)
+# Trading days per year the volatility and Sharpe ratios are annualized with
+ANNUALIZATION = 252
+
+# Columns of rolling_stats after strategy_id, in order
+SERIES_COLUMNS = ['date', 'pnl', 'equity', 'drawdown', 'mean', 'volatility', 'sharpe'] + \
+    [f'{stat}_{w}' for w in WINDOWS for stat in ('volatility', 'sharpe')]
+
+
+class _Welford():
+    """
+    Running count, mean and sum of squared deviations (M2) of a series, with O(1) removal for sliding windows.
+    """
+
+    def __init__(self, n=0, mean=0.0, m2=0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def remove(self, x):
+        self.n -= 1
+        if self.n == 0:
+            self.mean = self.m2 = 0.0
+            return
+        delta = x - self.mean
+        self.mean -= delta / self.n
+        # Removal can leave a tiny negative rounding residue
+        self.m2 = max(self.m2 - delta * (x - self.mean), 0.0)
+
+    def volatility_sharpe(self):
+        """
+        Annualized volatility and Sharpe ratio (mean over standard deviation), None while undefined.
+        """
+        if self.n < 2:
+            return None, None
+        std = math.sqrt(self.m2 / (self.n - 1))
+        sharpe = self.mean / std * math.sqrt(ANNUALIZATION) if std > 0 else None
+        return std * math.sqrt(ANNUALIZATION), sharpe
+
+
+class _StrategyState():
+    """
+    Everything needed to extend one strategy's statistics by a day, in O(1): the all-time Welford accumulator, equity,
+    peak and maximum drawdown, one sliding Welford accumulator per window and the last max(WINDOWS) days of P&L, the
+    values leaving the windows.
+    """
+
+    def __init__(self):
+        self.last_date = None
+        self.total = _Welford()
+        self.equity = 0.0
+        self.peak = 0.0
+        self.max_drawdown = 0.0
+        self.max_drawdown_date = None
+        self.windows = {w: _Welford() for w in WINDOWS}
+        self.recent = []
+
+    def fold(self, day, pnl):
+        """
+        Extend the statistics by one day's P&L. Returns the day's rolling_stats row (after strategy_id).
+        """
+        self.total.add(pnl)
+        self.equity += pnl
+        self.peak = max(self.peak, self.equity)
+        drawdown = self.equity - self.peak
+        if drawdown < self.max_drawdown:
+            self.max_drawdown, self.max_drawdown_date = drawdown, day
+
+        self.recent.append(pnl)
+        row = [day, pnl, self.equity, drawdown, self.total.mean, *self.total.volatility_sharpe()]
+        for w in WINDOWS:
+            window = self.windows[w]
+            window.add(pnl)
+            if window.n > w:
+                window.remove(self.recent[-w - 1])
+            row += window.volatility_sharpe() if window.n == w else (None, None)
+        # Only the values that will leave a window are kept
+        del self.recent[:-max(WINDOWS)]
+        self.last_date = day
+        return row
+
+    def current(self):
+        """
+        The statistics as of last_date.
+        """
+        volatility, sharpe = self.total.volatility_sharpe()
+        windows = {}
+        for w in WINDOWS:
+            window_volatility, window_sharpe = self.windows[w].volatility_sharpe() if self.windows[w].n == w \
+                else (None, None)
+            windows[str(w)] = {'volatility': _rounded(window_volatility), 'sharpe': _rounded(window_sharpe)}
+        return {
+            'as_of': self.last_date.isoformat() if self.last_date else None,
+            'days': self.total.n,
+            'cumulative_pnl': _rounded(self.equity),
+            'mean': _rounded(self.total.mean),
+            'volatility': _rounded(volatility),
+            'sharpe': _rounded(sharpe),
+            'peak': _rounded(self.peak),
+            'drawdown': _rounded(self.equity - self.peak),
+            'max_drawdown': _rounded(self.max_drawdown),
+            'max_drawdown_date': self.max_drawdown_date.isoformat() if self.max_drawdown_date else None,
+            'windows': windows,
+        }
+
+    def sums(self):
+        """
+        (sum, sum of squares) of the P&L folded in so far, to compare against the rollup.
+        """
+        n, mean, m2 = self.total.n, self.total.mean, self.total.m2
+        return n * mean, m2 + n * mean * mean
+
+    def dumps(self):
+        return json.dumps({
+            'last_date': self.last_date.isoformat(),
+            'total': [self.total.n, self.total.mean, self.total.m2],
+            'equity': self.equity,
+            'peak': self.peak,
+            'max_drawdown': self.max_drawdown,
+            'max_drawdown_date': self.max_drawdown_date.isoformat() if self.max_drawdown_date else None,
+            'windows': {str(w): [a.n, a.mean, a.m2] for w, a in self.windows.items()},
+            'recent': self.recent,
+        })
+
+    @classmethod
+    def resume(cls, day, n, recent, max_drawdown, max_drawdown_date):
+        """
+        The state after day, rebuilt from its rolling_stats rows: n rows up to day in all, the last max(WINDOWS) of them
+        as (pnl, equity, drawdown, mean, volatility) in date order, and the lowest drawdown with its first date.
+        """
+        pnl, equity, drawdown, mean, volatility = recent[-1]
+        state = cls()
+        state.last_date = day
+        # volatility is sqrt(m2 / (n - 1)) annualized, None while n < 2 (when m2 is 0)
+        m2 = (volatility / math.sqrt(ANNUALIZATION)) ** 2 * (n - 1) if volatility is not None else 0.0
+        state.total = _Welford(n, mean, m2)
+        state.equity, state.peak = equity, equity - drawdown
+        if max_drawdown < 0:
+            state.max_drawdown, state.max_drawdown_date = max_drawdown, max_drawdown_date
+        state.recent = [row[0] for row in recent]
+        for w in WINDOWS:
+            for x in state.recent[-w:]:
+                state.windows[w].add(x)
+        return state
+
+    @classmethod
+    def loads(cls, text):
+        data = json.loads(text)
+        state = cls()
+        state.last_date = date.fromisoformat(data['last_date'])
+        state.total = _Welford(*data['total'])
+        state.equity, state.peak, state.max_drawdown = data['equity'], data['peak'], data['max_drawdown']
+        if data['max_drawdown_date'] is not None:
+            state.max_drawdown_date = date.fromisoformat(data['max_drawdown_date'])
+        state.windows = {w: _Welford(*data['windows'][str(w)]) for w in WINDOWS}
+        state.recent = data['recent']
+        return state
+
+
+class RollingStatistics():
+    """
+    Online per-strategy statistics over the daily P&L of the daily_pnl rollup (see src/rollup.py): running mean,
+    volatility and Sharpe ratio (Welford), equity, peak and drawdown, and volatility / Sharpe over rolling 20, 60 and
+    252-day windows.
+
+    Each closed day (before today) is folded in once, in O(1) per strategy, and days without P&L between two days with
+    P&L count as 0, as in get_strategy_pnl. The state after the last folded day is kept in rolling_stats_state and every
+    day's values in rolling_stats, so nothing is recomputed after a restart. P&L is booked on the day a trade opened,
+    so an already-folded day still changes when one of its trades gets a fill later (e.g. when it closes), or when the
+    rollup is rebuilt. The sum and sum of squares of the folded days are compared with the rollup on every refresh;
+    for a strategy whose history changed, the stored rows are compared day by day and only the days from the earliest
+    changed one on are refolded, from the state as of the day before, rebuilt from the stored rows.
+
+    Refreshes run at most once per refresh_interval seconds per process, and in one process at a time (a MySQL named
+    lock), the others skip them and read the stored statistics.
+    """
+
+    LOCK = 'rolling_stats'
+
+    def __init__(self, pool, pnl_rollup, refresh_interval=5.0):
+        self.pool = pool
+        self.pnl_rollup = pnl_rollup
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._last_refresh = 0.0
+
+    ### READERS ###
+
+    def maybe_refresh(self):
+        """
+        Refresh the statistics unless they were refreshed recently or another thread is already refreshing them.
+        """
+        if time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self.refresh()
+        finally:
+            self._lock.release()
+
+    def current(self, strategy_id):
+        """
+        The statistics of a strategy as of its last folded day, None if it has none yet.
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('select state from rolling_stats_state where strategy_id = %s', (strategy_id,))
+                row = cur.fetchone()
+        return _StrategyState.loads(row[0]).current() if row is not None else None
+
+    def series(self, strategy_id, since=None):
+        """
+        (columns, rows) of a strategy's daily statistics in date order, from since (a date) on if given.
+        """
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    Select {', '.join(SERIES_COLUMNS)}
+                    from rolling_stats
+                    where strategy_id = %s {'and date >= %s' if since is not None else ''}
+                    order by date;
+                    """, (strategy_id,) if since is None else (strategy_id, since))
+                return SERIES_COLUMNS, cur.fetchall()
+
+    ### MAINTENANCE ###
+
+    def refresh(self):
+        """
+        Fold every closed day not folded yet into the statistics. Returns the number of days folded.
+        """
+        self.pnl_rollup.maybe_refresh()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('select get_lock(%s, 0)', (self.LOCK,))
+                if cur.fetchone()[0] != 1:
+                    # Another process is refreshing
+                    return 0
+                try:
+                    conn.begin()
+                    folded = self._refresh(cur, date.today())
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    cur.execute('select release_lock(%s)', (self.LOCK,))
+
+        self._last_refresh = time.monotonic()
+        return folded
+
+    ### HELPERS ###
+
+    def _refresh(self, cur, today):
+        cur.execute('select strategy_id, state from rolling_stats_state')
+        states = {strategy_id: _StrategyState.loads(state) for strategy_id, state in cur.fetchall()}
+
+        # Strategies whose already-folded days no longer add up to the rollup
+        cur.execute("""
+            Select daily_pnl.strategy_id, sum(daily_pnl.pnl), sum(daily_pnl.pnl * daily_pnl.pnl)
+            from daily_pnl
+            join rolling_stats_state on rolling_stats_state.strategy_id = daily_pnl.strategy_id
+            where daily_pnl.date <= rolling_stats_state.last_date
+            group by daily_pnl.strategy_id;
+            """)
+        folded_sums = {strategy_id: (total, squares) for strategy_id, total, squares in cur.fetchall()}
+        changed = [strategy_id for strategy_id, state in states.items()
+                   if not _close(state.sums(), folded_sums.get(strategy_id, (0.0, 0.0)))]
+
+        # Their days from the first one to refold on, from the state the day before (from scratch if None)
+        restated = self._restart_days(cur, changed) if changed else {}
+        restated_days = []
+        for strategy_id, restart in restated.items():
+            if restart is None:
+                cur.execute('delete from rolling_stats where strategy_id = %s', (strategy_id,))
+                del states[strategy_id]
+            else:
+                cur.execute('delete from rolling_stats where strategy_id = %s and date >= %s', (strategy_id, restart))
+                states[strategy_id] = self._state_before(cur, strategy_id, restart)
+            cur.execute("""
+                Select strategy_id, date, pnl
+                from daily_pnl
+                where strategy_id = %s and date >= %s and date < %s
+                order by date;
+                """, (strategy_id, restart or date.min, today))
+            restated_days += cur.fetchall()
+
+        # Closed days after each strategy's last folded day (all of them for new strategies)
+        cur.execute("""
+            Select daily_pnl.strategy_id, daily_pnl.date, daily_pnl.pnl
+            from daily_pnl
+            left join rolling_stats_state on rolling_stats_state.strategy_id = daily_pnl.strategy_id
+            where daily_pnl.date < %s
+            and (rolling_stats_state.last_date is null or daily_pnl.date > rolling_stats_state.last_date)
+            order by daily_pnl.strategy_id, daily_pnl.date;
+            """, (today,))
+        new_days = [row for row in cur.fetchall() if row[0] not in restated] + restated_days
+
+        rows = []
+        touched = {strategy_id: states[strategy_id] for strategy_id in restated if strategy_id in states}
+        for strategy_id, day, pnl in new_days:
+            state = states.get(strategy_id)
+            if state is None:
+                state = states[strategy_id] = _StrategyState()
+            # Days without P&L since the previous one count as 0
+            if state.last_date is not None:
+                gap = state.last_date + timedelta(days=1)
+                while gap < day:
+                    rows.append((strategy_id, *state.fold(gap, 0.0)))
+                    gap += timedelta(days=1)
+            rows.append((strategy_id, *state.fold(day, float(pnl))))
+            touched[strategy_id] = state
+
+        if rows:
+            cur.executemany(f"""
+                insert into rolling_stats (strategy_id, {', '.join(SERIES_COLUMNS)})
+                values ({", ".join(["%s"] * (len(SERIES_COLUMNS) + 1))});
+                """, rows)
+        if touched:
+            cur.executemany("""
+                insert into rolling_stats_state (strategy_id, last_date, state, updated_at) values (%s, %s, %s, now())
+                on duplicate key update last_date = values(last_date), state = values(state),
+                updated_at = values(updated_at);
+                """, [(strategy_id, state.last_date, state.dumps()) for strategy_id, state in touched.items()])
+        # Strategies restated from scratch without any closed day left
+        gone = [strategy_id for strategy_id in restated if strategy_id not in touched]
+        if gone:
+            cur.execute(f'delete from rolling_stats_state where strategy_id in ({", ".join(["%s"] * len(gone))})',
+                        tuple(gone))
+        return len(rows)
+
+    def _restart_days(self, cur, strategy_ids):
+        """
+        {strategy_id: first day to refold, or None to start from scratch} of the given strategies, whose folded P&L
+        differs from the rollup on some day. Strategies without any differing day (rounding only) are left out.
+        """
+        placeholders = ", ".join(["%s"] * len(strategy_ids))
+        # Days whose P&L changed or that got P&L, and days whose P&L is gone from the rollup
+        cur.execute(f"""
+            Select daily_pnl.strategy_id, min(daily_pnl.date)
+            from daily_pnl
+            join rolling_stats_state on rolling_stats_state.strategy_id = daily_pnl.strategy_id
+            left join rolling_stats on rolling_stats.strategy_id = daily_pnl.strategy_id
+            and rolling_stats.date = daily_pnl.date
+            where daily_pnl.strategy_id in ({placeholders}) and daily_pnl.date <= rolling_stats_state.last_date
+            and (rolling_stats.pnl is null or rolling_stats.pnl <> daily_pnl.pnl)
+            group by daily_pnl.strategy_id;
+            """, tuple(strategy_ids))
+        first = dict(cur.fetchall())
+        cur.execute(f"""
+            Select rolling_stats.strategy_id, min(rolling_stats.date)
+            from rolling_stats
+            left join daily_pnl on daily_pnl.strategy_id = rolling_stats.strategy_id
+            and daily_pnl.date = rolling_stats.date
+            where rolling_stats.strategy_id in ({placeholders}) and rolling_stats.pnl <> 0 and daily_pnl.date is null
+            group by rolling_stats.strategy_id;
+            """, tuple(strategy_ids))
+        for strategy_id, day in cur.fetchall():
+            first[strategy_id] = min(day, first.get(strategy_id, day))
+
+        restarts = {}
+        for strategy_id, day in first.items():
+            # Refold from the day after the last unchanged day with P&L, so that the zero days in between (and any
+            # that are no longer followed by a day with P&L) are redone too
+            cur.execute('select max(date) from daily_pnl where strategy_id = %s and date < %s', (strategy_id, day))
+            kept = cur.fetchone()[0]
+            restarts[strategy_id] = kept + timedelta(days=1) if kept is not None else None
+        return restarts
+
+    def _state_before(self, cur, strategy_id, restart):
+        """
+        The strategy's state after the day before restart, rebuilt from its rolling_stats rows up to that day.
+        """
+        day = restart - timedelta(days=1)
+        cur.execute('select count(*), min(drawdown) from rolling_stats where strategy_id = %s and date <= %s',
+                    (strategy_id, day))
+        n, worst = cur.fetchone()
+        worst_date = None
+        if worst < 0:
+            cur.execute('select min(date) from rolling_stats where strategy_id = %s and date <= %s and drawdown = %s',
+                        (strategy_id, day, worst))
+            worst_date = cur.fetchone()[0]
+        cur.execute(f"""
+            Select pnl, equity, drawdown, mean, volatility
+            from rolling_stats
+            where strategy_id = %s and date <= %s
+            order by date desc
+            limit {max(WINDOWS)};
+            """, (strategy_id, day))
+        recent = cur.fetchall()[::-1]
+        return _StrategyState.resume(day, n, recent, worst, worst_date)
+
+
+def _close(a, b):
+    """
+    Whether two (sum, sum of squares) pairs agree up to floating-point error.
+    """
+    return all(math.isclose(x, float(y), rel_tol=1e-9, abs_tol=1e-6) for x, y in zip(a, b))
+
+
+def _rounded(value):
+    return None if value is None else round(float(value), 2)
@@ -0,0 +1,141 @@
+# imports
+import threading
+import time
+
+
+class PnLRollup():
+    """
+    Per-strategy, per-day P&L rollup (the daily_pnl table) maintained incrementally from the fill table.
+
+    P&L is booked the same way the original queries did it: sum(fill.qty * fill.avg) * -1, on the date the parent
+    trade was opened. Progress is tracked with a (filled_time, fill_id) watermark stored in rollup_watermark, so each
+    refresh only aggregates the fills that landed since the previous one and folds them into the existing rows.
+    Fills are expected to arrive in filled_time order; anything backdated behind the watermark needs a rebuild().
+    Trades moved to the cold tier keep their rows in the rollup, and a rebuild() adds them back from the archive.
+    """
+
+    NAME = 'daily_pnl'
+
+    def __init__(self, pool, refresh_interval=1.0, archive=None):
+        self.pool = pool
+        self.archive = archive
+        # Readers refresh before every read, but at most once per refresh_interval seconds per process
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._last_refresh = 0.0
+
+    ### READERS ###
+
+    def maybe_refresh(self):
+        """
+        Refresh the rollup unless it was refreshed recently or another thread is already refreshing it.
+        """
+        if time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self.refresh()
+        finally:
+            self._lock.release()
+
+    ### MAINTENANCE ###
+
+    def refresh(self):
+        """
+        Fold all fills past the watermark into the rollup. Returns the affected row count reported by MySQL.
+        The watermark row is locked for the duration, so concurrent workers never apply the same fills twice.
+        """
+        with self.pool.connection() as conn:
+            conn.begin()
+            with conn.cursor() as cur:
+                cur.execute('select last_filled_time, last_fill_id from rollup_watermark '
+                            'where rollup_name = %s for update', (self.NAME,))
+                low = cur.fetchone()
+                if low is None or low[0] is None:
+                    touched = self._rebuild(cur)
+                else:
+                    high = self._high_watermark(cur)
+                    if high is None or high <= low:
+                        touched = 0
+                    else:
+                        touched = cur.execute("""
+                            insert into daily_pnl (strategy_id, date, pnl, fills)
+                            select coalesce(trade.strategy_id, 0), date(trade.open_time), sum(fill.qty * fill.avg) * -1, count(*)
+                            from fill
+                            join trade on fill.trade_id = trade.trade_id
+                            where fill.filled_time >= %s and (fill.filled_time > %s or fill.fill_id > %s)
+                            and fill.filled_time <= %s and (fill.filled_time < %s or fill.fill_id <= %s)
+                            group by coalesce(trade.strategy_id, 0), date(trade.open_time)
+                            on duplicate key update pnl = pnl + values(pnl), fills = fills + values(fills);
+                            """, (low[0], low[0], low[1], high[0], high[0], high[1]))
+                        self._set_watermark(cur, high)
+            conn.commit()
+
+        self._last_refresh = time.monotonic()
+        return touched
+
+    def rebuild(self):
+        """
+        Recompute the whole rollup from the fill table and the archive. Needed after backdated fills or manual
+        corrections.
+        """
+        with self.pool.connection() as conn:
+            conn.begin()
+            with conn.cursor() as cur:
+                cur.execute('select last_fill_id from rollup_watermark where rollup_name = %s for update', (self.NAME,))
+                touched = self._rebuild(cur)
+            conn.commit()
+
+        self._last_refresh = time.monotonic()
+        return touched
+
+    ### HELPERS ###
+
+    def _rebuild(self, cur):
+        high = self._high_watermark(cur)
+        cur.execute('delete from daily_pnl')
+        touched = 0
+        if high is not None:
+            touched = cur.execute("""
+                insert into daily_pnl (strategy_id, date, pnl, fills)
+                select coalesce(trade.strategy_id, 0), date(trade.open_time), sum(fill.qty * fill.avg) * -1, count(*)
+                from fill
+                join trade on fill.trade_id = trade.trade_id
+                where fill.filled_time <= %s and (fill.filled_time < %s or fill.fill_id <= %s)
+                group by coalesce(trade.strategy_id, 0), date(trade.open_time);
+                """, (high[0], high[0], high[1]))
+        archived = self.archive.daily_pnl() if self.archive is not None else []
+        if archived:
+            touched += cur.executemany("""
+                insert into daily_pnl (strategy_id, date, pnl, fills) values (%s, %s, %s, %s)
+                on duplicate key update pnl = pnl + values(pnl), fills = fills + values(fills);
+                """, archived)
+        self._set_watermark(cur, high or (None, None))
+        self.bump_version(cur)
+        return touched
+
+    @staticmethod
+    def _high_watermark(cur):
+        """
+        The newest (filled_time, fill_id) in the fill table. Captured before aggregating so that fills landing
+        mid-refresh are left for the next one.
+        """
+        cur.execute('select filled_time, fill_id from fill where filled_time is not null '
+                    'order by filled_time desc, fill_id desc limit 1')
+        return cur.fetchone()
+
+    def bump_version(self, cur):
+        """
+        Bump the watermark row's version, for a change to daily_pnl that leaves the watermark where it is (see
+        src/cache.py). Runs in the caller's transaction, with the watermark row locked.
+        """
+        cur.execute('update rollup_watermark set version = version + 1 where rollup_name = %s', (self.NAME,))
+
+    def _set_watermark(self, cur, high):
+        cur.execute("""
+            insert into rollup_watermark (rollup_name, last_filled_time, last_fill_id, updated_at)
+            values (%s, %s, %s, now())
+            on duplicate key update last_filled_time = values(last_filled_time), last_fill_id = values(last_fill_id),
+            updated_at = values(updated_at);
+            """, (self.NAME, high[0], high[1]))
@@ -0,0 +1,112 @@
+# imports
+import datetime
+import decimal
+import json
+
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+from src.settings import JSON_DATETIME_FORMAT
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+"""
+JSON encoding of the API responses.
+
+orjson is used when it is installed, with a stdlib json fallback producing the same output. Both handle the values
+coming out of pymysql and the ResultSet arrays natively:
+- NumPy arrays and scalars become JSON arrays / numbers (Flask's own encoder rejects NumPy integers).
+- Decimal becomes a string, as Flask has always sent it, so no precision is lost.
+- datetime / date become HTTP dates ('Mon, 01 Jan 2024 00:00:00 GMT') as Flask sends them, or ISO 8601 strings with
+  JSON_DATETIME_FORMAT = 'iso'.
+- NaN and infinities become null, so the output is always valid JSON.
+Keys are sorted, as Flask's default provider sorts them, so the wire format is the same with either encoder.
+"""
+
+
+def _date(value):
+    if JSON_DATETIME_FORMAT == 'iso':
+        return value.isoformat()
+    return http_date(value)
+
+
+def _default(value):
+    """
+    Values neither encoder handles natively.
+    """
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return _date(value)
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, datetime.time):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _dumps_stdlib(obj):
+    return json.dumps(_plain(obj), default=_default, separators=(',', ':'), allow_nan=False, sort_keys=True).encode()
+
+
+if orjson is not None:
+    # Dates are passed through to _default so that they keep Flask's format
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | \
+        orjson.OPT_SORT_KEYS
+
+    def dumps_bytes(obj):
+        try:
+            return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # Non-contiguous or object-dtype NumPy arrays are not supported natively
+            return orjson.dumps(_plain(obj), default=_default, option=_ORJSON_OPTIONS)
+else:
+    dumps_bytes = _dumps_stdlib
+
+
+def _plain(obj):
+    """
+    A copy of obj with NaN / infinite floats replaced by None, NumPy containers turned into lists and non-string keys
+    turned into strings (so that they sort like orjson sorts them), for the fallback paths.
+    """
+    if isinstance(obj, float):
+        return obj if obj == obj and obj not in (float('inf'), float('-inf')) else None
+    if isinstance(obj, dict):
+        return {key if isinstance(key, str) else _key(key): _plain(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_plain(value) for value in obj]
+    if isinstance(obj, np.ndarray):
+        return _plain(obj.tolist())
+    if isinstance(obj, np.generic):
+        return _plain(obj.item())
+    return obj
+
+
+def _key(key):
+    if isinstance(key, np.generic):
+        key = key.item()
+    if key is None or isinstance(key, (bool, int, float)):
+        return json.dumps(key)
+    if isinstance(key, (datetime.datetime, datetime.date, datetime.time)):
+        return key.isoformat()
+    return str(key)
+
+
+class JSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider using dumps_bytes, for jsonify and current_app.json.dumps (JSON Lines and event streams).
+    """
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Flask's default provider ends the body with a newline
+        return self._app.response_class(dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
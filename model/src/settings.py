@@ -0,0 +1,184 @@
+# Settings for the application.
+#
+# Credentials live in config.py (mounted into the container, see docker-compose.yml). Everything
+# else has a sensible default here and can be overridden by defining the same name in config.py.
+
+import os
+
+import config
+
+RDS_HOSTNAME = config.RDS_HOSTNAME
+RDS_USER = config.RDS_USER
+RDS_PASSWORD = config.RDS_PASSWORD
+SECRET_KEY = config.SECRET_KEY
+DB_NAME = getattr(config, 'DB_NAME', 'nts_lightning_db_v2')
+
+### CONNECTION POOL ###
+
+# Connections kept open at all times / hard cap on open connections
+DB_POOL_MIN_SIZE = getattr(config, 'DB_POOL_MIN_SIZE', 2)
+DB_POOL_MAX_SIZE = getattr(config, 'DB_POOL_MAX_SIZE', 10)
+# Seconds a request will wait for a free connection before giving up
+DB_POOL_TIMEOUT = getattr(config, 'DB_POOL_TIMEOUT', 10)
+# Idle connections that have not been used for this many seconds are pinged before checkout
+DB_POOL_PING_INTERVAL = getattr(config, 'DB_POOL_PING_INTERVAL', 30)
+# Reconnect attempts and the base delay (doubled after each failed attempt)
+DB_RECONNECT_ATTEMPTS = getattr(config, 'DB_RECONNECT_ATTEMPTS', 5)
+DB_RECONNECT_BACKOFF = getattr(config, 'DB_RECONNECT_BACKOFF', 0.1)
+
+### READ REPLICAS ###
+
+# Read replicas for the analytic reads (P&L, statistics, historical trades, risk), each a dict of pymysql.connect
+# arguments overriding the primary's, e.g. [{'host': 'replica-1.xxx.rds.amazonaws.com'}]. Empty: everything reads the
+# primary
+DB_REPLICAS = getattr(config, 'DB_REPLICAS', [])
+# Seconds of replication lag a read tolerates unless the request asks otherwise (max_lag / X-Max-Replica-Lag)
+DB_REPLICA_MAX_LAG = getattr(config, 'DB_REPLICA_MAX_LAG', 30.0)
+# Minimum seconds between health / lag checks of each replica (per process)
+DB_REPLICA_CHECK_INTERVAL = getattr(config, 'DB_REPLICA_CHECK_INTERVAL', 5.0)
+# Hard cap on open connections per replica, which are only opened on demand
+DB_REPLICA_POOL_MAX_SIZE = getattr(config, 'DB_REPLICA_POOL_MAX_SIZE', DB_POOL_MAX_SIZE)
+
+### P&L ROLLUP ###
+
+# Minimum seconds between incremental refreshes of the daily_pnl rollup (per process)
+PNL_ROLLUP_REFRESH_INTERVAL = getattr(config, 'PNL_ROLLUP_REFRESH_INTERVAL', 1.0)
+
+### ROLLING STATISTICS ###
+
+# Minimum seconds between refreshes of the rolling statistics from the daily_pnl rollup (per process)
+ROLLING_STATS_REFRESH_INTERVAL = getattr(config, 'ROLLING_STATS_REFRESH_INTERVAL', 5.0)
+
+### POSITION BOOK ###
+
+# Minimum seconds between polls of the fill table by the in-memory position book (per process)
+POSITION_BOOK_REFRESH_INTERVAL = getattr(config, 'POSITION_BOOK_REFRESH_INTERVAL', 1.0)
+
+### STRATEGY REGISTRY ###
+
+# Minimum seconds between change-detection probes of the strategy table (per process)
+STRATEGY_REGISTRY_REFRESH_INTERVAL = getattr(config, 'STRATEGY_REGISTRY_REFRESH_INTERVAL', 5.0)
+
+### PARTITIONING ###
+
+# Months past the current one that 'python -m src.partitions maintain' keeps trade and fill partitions ready for
+PARTITION_MONTHS_AHEAD = getattr(config, 'PARTITION_MONTHS_AHEAD', 3)
+
+### ARCHIVE ###
+
+# Directory of the Parquet cold tier that 'python -m src.archive run' moves closed trades to (None disables it)
+ARCHIVE_DIR = getattr(config, 'ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'archive'))
+# Parquet codec of archived files
+ARCHIVE_COMPRESSION = getattr(config, 'ARCHIVE_COMPRESSION', 'zstd')
+# Trades moved (written to Parquet, then deleted from MySQL in one transaction) per batch
+ARCHIVE_BATCH_TRADES = getattr(config, 'ARCHIVE_BATCH_TRADES', 10_000)
+
+### COLUMNAR SNAPSHOT ###
+
+# DuckDB file of the trade / trade_leg / fill snapshot maintained by 'python -m src.columnar sync' (None disables it)
+COLUMNAR_PATH = getattr(config, 'COLUMNAR_PATH',
+                        os.path.join(os.path.dirname(os.path.dirname(__file__)), 'columnar', 'snapshot.duckdb'))
+# DBModel methods computed from the snapshot instead of MySQL, any of get_daily_pnl, get_strategy_pnl,
+# get_strategies_pnl and get_strategies_statistics (the risk metrics are built on the P&L ones). Needs duckdb
+COLUMNAR_METHODS = getattr(config, 'COLUMNAR_METHODS', ())
+# Seconds since its last sync after which the snapshot is not used unless the request passes a larger max_lag
+COLUMNAR_MAX_AGE = getattr(config, 'COLUMNAR_MAX_AGE', 300.0)
+# Rows copied from MySQL per batch while syncing
+COLUMNAR_SYNC_BATCH_ROWS = getattr(config, 'COLUMNAR_SYNC_BATCH_ROWS', 50_000)
+
+### RESULT CACHE ###
+
+# Cache DBModel read results until the data version (newest fill / trade / strategy change, rollup progress) moves on
+RESULT_CACHE_ENABLED = getattr(config, 'RESULT_CACHE_ENABLED', True)
+RESULT_CACHE_MAX_ENTRIES = getattr(config, 'RESULT_CACHE_MAX_ENTRIES', 1024)
+# Seconds after which an entry is recomputed even if the data version did not change
+RESULT_CACHE_TTL = getattr(config, 'RESULT_CACHE_TTL', 300.0)
+# Minimum seconds between data-version probes (per process)
+RESULT_CACHE_PROBE_INTERVAL = getattr(config, 'RESULT_CACHE_PROBE_INTERVAL', 0.5)
+
+### INGESTION ###
+
+# Most trade + leg + fill rows accepted by one POST /ingest/batch (each batch is written in one transaction)
+INGEST_MAX_BATCH_ROWS = getattr(config, 'INGEST_MAX_BATCH_ROWS', 100_000)
+
+### EXPORTS ###
+
+# Largest page of historical trades returned by one paginated request
+HIST_TRADES_MAX_LIMIT = getattr(config, 'HIST_TRADES_MAX_LIMIT', 10_000)
+# Rows fetched from the server-side cursor and encoded per chunk of a JSON Lines export
+STREAM_BATCH_ROWS = getattr(config, 'STREAM_BATCH_ROWS', 1000)
+
+### RESPONSES ###
+
+# Dates in JSON responses: 'http' ('Mon, 01 Jan 2024 00:00:00 GMT', what Flask has always sent) or 'iso' (ISO 8601)
+JSON_DATETIME_FORMAT = getattr(config, 'JSON_DATETIME_FORMAT', 'http')
+# Smallest response body (bytes) that is gzip / brotli encoded for clients that accept it
+COMPRESSION_MIN_SIZE = getattr(config, 'COMPRESSION_MIN_SIZE', 1024)
+# gzip level (1-9) and brotli quality (0-11), chosen for speed over ratio since every response is encoded on the fly
+GZIP_LEVEL = getattr(config, 'GZIP_LEVEL', 5)
+BROTLI_QUALITY = getattr(config, 'BROTLI_QUALITY', 4)
+
+### PUSH UPDATES ###
+
+# Seconds between two polls of the update feed behind /stream/updates (one background thread per process)
+PUSH_INTERVAL = getattr(config, 'PUSH_INTERVAL', 1.0)
+# Seconds without an event after which a keep-alive comment is sent, which also detects disconnected clients
+PUSH_HEARTBEAT = getattr(config, 'PUSH_HEARTBEAT', 15.0)
+# Undelivered events a subscriber may fall behind by before it is dropped (it gets a new snapshot on reconnect)
+PUSH_QUEUE_SIZE = getattr(config, 'PUSH_QUEUE_SIZE', 100)
+
+### DASHBOARD ###
+
+# Threads running the sections of /strategy/dashboard concurrently (each holds its own pooled connection)
+DASHBOARD_WORKERS = getattr(config, 'DASHBOARD_WORKERS', DB_POOL_MAX_SIZE)
+# Seconds a dashboard request waits for its sections, slower sections are reported as timed out and their queries
+# are interrupted (MySQL max_execution_time)
+DASHBOARD_TIMEOUT = getattr(config, 'DASHBOARD_TIMEOUT', 10.0)
+# Most strategy x section queries one dashboard request may ask for
+DASHBOARD_MAX_TASKS = getattr(config, 'DASHBOARD_MAX_TASKS', 100)
+
+### RISK SIMULATION ###
+
+# Worker processes for bootstrap / Monte Carlo simulations (None = one per CPU core), per API process
+SIMULATION_WORKERS = getattr(config, 'SIMULATION_WORKERS', None)
+# How the simulation processes are started: 'forkserver' (safe from a multi-threaded API process), 'spawn' or 'fork'
+SIMULATION_START_METHOD = getattr(config, 'SIMULATION_START_METHOD', 'forkserver')
+# Paths simulated per task sent to a worker, and the most paths a single request may ask for per strategy
+SIMULATION_CHUNK_PATHS = getattr(config, 'SIMULATION_CHUNK_PATHS', 5000)
+SIMULATION_MAX_PATHS = getattr(config, 'SIMULATION_MAX_PATHS', 1_000_000)
+# Default seconds a simulation request may take before unfinished chunks are dropped
+SIMULATION_TIME_BUDGET = getattr(config, 'SIMULATION_TIME_BUDGET', 10.0)
+# Default loss (in dollars of cumulative P&L) counted as ruin
+SIMULATION_RUIN_LEVEL = getattr(config, 'SIMULATION_RUIN_LEVEL', 100_000)
+
+### METRICS ###
+
+# Record request, DBModel method, query and pool wait metrics for /metrics
+METRICS_ENABLED = getattr(config, 'METRICS_ENABLED', True)
+# Seconds after which a SQL statement is written to the 'src.slow_queries' log with its parameters (None disables it)
+SLOW_QUERY_THRESHOLD = getattr(config, 'SLOW_QUERY_THRESHOLD', 0.5)
+# Longest SQL text / parameter list written per slow query, longer ones are cut
+SLOW_QUERY_LOG_MAX_CHARS = getattr(config, 'SLOW_QUERY_LOG_MAX_CHARS', 2000)
+
+### PROFILING ###
+
+# Token a request passes in the X-Profile-Token header or the profile query parameter to be profiled (None disables
+# profiling entirely, see src/profiling.py)
+PROFILE_TOKEN = getattr(config, 'PROFILE_TOKEN', None)
+# Functions listed from cProfile, by cumulative time
+PROFILE_TOP_N = getattr(config, 'PROFILE_TOP_N', 30)
+# Most SQL statements recorded (and explained) per profiled request
+PROFILE_MAX_STATEMENTS = getattr(config, 'PROFILE_MAX_STATEMENTS', 200)
+# Profiles kept per process for GET /profiles/<id>
+PROFILE_STORE_SIZE = getattr(config, 'PROFILE_STORE_SIZE', 50)
+
+### SERVER ###
+
+# Address the production server (gunicorn.conf.py) listens on
+SERVER_BIND = getattr(config, 'SERVER_BIND', '0.0.0.0:4000')
+# Worker processes (None = one per CPU core) and threads per worker. Every open /stream/updates stream holds a thread
+SERVER_WORKERS = getattr(config, 'SERVER_WORKERS', None)
+SERVER_THREADS = getattr(config, 'SERVER_THREADS', 16)
+# Seconds a worker may stay silent before it is restarted, and seconds to finish in-flight requests on shutdown
+SERVER_TIMEOUT = getattr(config, 'SERVER_TIMEOUT', 60)
+SERVER_GRACEFUL_TIMEOUT = getattr(config, 'SERVER_GRACEFUL_TIMEOUT', 30)
@@ -0,0 +1,210 @@
+# imports
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from src.settings import SIMULATION_WORKERS, SIMULATION_CHUNK_PATHS, SIMULATION_START_METHOD
+
+SIMULATION_METHODS = ('bootstrap', 'montecarlo')
+# Paths a worker simulates between two checks of the request's deadline
+BATCH_PATHS = 500
+
+
+### WORKER ###
+
+def simulate_paths(pnl, n_paths, horizon, method, block_size, seed, deadline=None):
+    """
+    Simulate n_paths future P&L paths of horizon days from a strategy's daily P&L history, and return per path:
+    the terminal P&L, the maximum drawdown and the worst cumulative P&L reached along the way.
+    Runs inside a worker process, so it only takes and returns plain NumPy data.
+    - bootstrap: circular block bootstrap of the history (blocks of block_size days keep short-term autocorrelation)
+    - montecarlo: i.i.d. normal days with the history's mean and standard deviation
+    Paths are simulated BATCH_PATHS at a time. Past deadline (a time.time() value) no further batch is started, so
+    fewer paths (possibly none) are returned and the worker is free for the next task.
+    """
+    if method not in SIMULATION_METHODS:
+        raise ValueError(f'Unknown simulation method {method}, expected one of {", ".join(SIMULATION_METHODS)}')
+    rng = np.random.default_rng(seed)
+    parts = []
+    for offset in range(0, n_paths, BATCH_PATHS):
+        if deadline is not None and time.time() >= deadline:
+            break
+        parts.append(_simulate_batch(rng, pnl, min(BATCH_PATHS, n_paths - offset), horizon, method, block_size))
+    if not parts:
+        return np.empty(0), np.empty(0), np.empty(0)
+    return tuple(np.concatenate(x) for x in zip(*parts))
+
+
+def _simulate_batch(rng, pnl, n_paths, horizon, method, block_size):
+    if method == 'bootstrap':
+        n_blocks = -(-horizon // block_size)
+        starts = rng.integers(0, len(pnl), (n_paths, n_blocks))
+        idx = (starts[:, :, np.newaxis] + np.arange(block_size)) % len(pnl)
+        days = pnl[idx.reshape(n_paths, -1)[:, :horizon]]
+    else:
+        std = pnl.std(ddof=1) if len(pnl) > 1 else 0.0
+        days = rng.normal(pnl.mean(), std, (n_paths, horizon))
+
+    curve = np.cumsum(days, axis=1)
+    peak = np.maximum.accumulate(np.maximum(curve, 0), axis=1)
+    return curve[:, -1], (curve - peak).min(axis=1), np.minimum(curve.min(axis=1), 0)
+
+
+### AGGREGATION ###
+
+def summarize(terminal, max_dd, worst, confidence, ruin_level):
+    """
+    Risk figures over all simulated paths of one strategy. Losses are reported as positive numbers, drawdowns as
+    non-positive ones (the p95 drawdown is the drawdown exceeded by only 5% of paths).
+    """
+    if len(terminal) == 0:
+        return None
+    cutoff = np.quantile(terminal, 1 - confidence)
+    return {
+        'VaR': round(float(-cutoff), 2),
+        'ES': round(float(-terminal[terminal <= cutoff].mean()), 2),
+        'mean_pnl': round(float(terminal.mean()), 2),
+        'drawdown': {
+            'p50': round(float(np.quantile(max_dd, 0.50)), 2),
+            'p95': round(float(np.quantile(max_dd, 0.05)), 2),
+            'p99': round(float(np.quantile(max_dd, 0.01)), 2),
+            'worst': round(float(max_dd.min()), 2),
+        },
+        'probability_of_ruin': round(float((worst <= -ruin_level).mean()), 4),
+        'paths': len(terminal),
+    }
+
+
+class Simulator():
+    """
+    Runs bootstrap / Monte Carlo simulations for one or many strategies on a process pool.
+
+    Every strategy's paths are split into fixed-size chunks, each with its own child of
+    SeedSequence([seed, strategy_id]), so results depend only on the seed and the path count, never on the number of
+    workers, which chunk finished first or which other strategies were simulated in the same batch.
+    When the time budget expires, chunks that have not started are cancelled and the ones already running stop at
+    their next batch of BATCH_PATHS paths (a worker cannot be interrupted mid-batch), so abandoned work does not hold
+    the workers up for the next request. Only chunks finished within the budget are counted, and the response reports
+    how many paths completed.
+    A pool broken by a dead worker (e.g. killed for memory) is replaced: a run that finds it broken when submitting
+    retries once on a fresh pool, and a run it broke under fails and leaves a fresh pool to the next request.
+    """
+
+    def __init__(self, workers=None, chunk_paths=5000, start_method='forkserver'):
+        self.workers = workers or os.cpu_count()
+        self.chunk_paths = chunk_paths
+        self.start_method = start_method
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        # Created on first use, so importing this module never starts processes. The API process is multi-threaded, and
+        # forking it could copy a lock held by another thread into the child, so by default the simulation processes are
+        # forked from a single-threaded fork server that has only imported this module.
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context(self.start_method)
+                if self.start_method == 'forkserver':
+                    context.set_forkserver_preload([__name__])
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._executor
+
+    def run(self, histories, n_paths, horizon, method='bootstrap', block_size=5, confidence=0.95, ruin_level=1e5,
+            seed=0, budget=10.0):
+        """
+        histories: {strategy_name: (strategy_id, daily P&L array)}. Returns (results per strategy, time budget report).
+        """
+        if method not in SIMULATION_METHODS:
+            raise ValueError(f'Unknown simulation method {method}, expected one of {", ".join(SIMULATION_METHODS)}')
+        start = time.perf_counter()
+        # Wall-clock deadline the workers check between batches (perf_counter is not comparable across processes)
+        deadline = time.time() + budget
+
+        for attempt in range(2):
+            executor = self.executor()
+            try:
+                futures = self._submit(executor, histories, n_paths, horizon, method, block_size, seed, deadline)
+                break
+            except BrokenProcessPool:
+                # A worker died while the pool was idle or after an earlier request gave up on it (e.g. killed for
+                # memory): retry once on a fresh pool
+                self._discard(executor)
+                if attempt:
+                    raise
+
+        done, not_done = wait(futures, timeout=max(0.0, budget - (time.perf_counter() - start)))
+        for future in not_done:
+            future.cancel()
+
+        # Combine chunks in chunk order, so that the aggregates do not depend on completion order
+        parts = {name: [] for name in histories}
+        try:
+            for future in sorted(done, key=lambda f: futures[f][1]):
+                parts[futures[future][0]].append(future.result())
+        except BrokenProcessPool:
+            # A worker died during this run, start a fresh pool for the next request
+            self._discard(executor)
+            raise
+
+        results = {}
+        for name, (strategy_id, pnl) in histories.items():
+            if parts[name]:
+                terminal, max_dd, worst = (np.concatenate(x) for x in zip(*parts[name]))
+                results[name] = summarize(terminal, max_dd, worst, confidence, ruin_level)
+            else:
+                results[name] = None
+            if results[name] is not None:
+                results[name]['history_days'] = len(pnl)
+
+        elapsed = time.perf_counter() - start
+        paths_done = sum(r['paths'] for r in results.values() if r is not None)
+        paths_requested = n_paths * sum(1 for _, pnl in histories.values() if len(pnl))
+        report = {
+            'budget_s': budget,
+            'elapsed_s': round(elapsed, 3),
+            'budget_used': round(elapsed / budget, 3) if budget else None,
+            'paths_requested': paths_requested,
+            'paths_completed': paths_done,
+            # A chunk can also finish on time with fewer paths, when it stopped at the deadline
+            'truncated': paths_done < paths_requested,
+            'workers': self.workers,
+        }
+        return results, report
+
+    def _submit(self, executor, histories, n_paths, horizon, method, block_size, seed, deadline):
+        """
+        Submit every strategy's chunks. Returns {future: (strategy name, chunk number)}.
+        """
+        futures = {}
+        for name, (strategy_id, pnl) in histories.items():
+            if len(pnl) == 0:
+                continue
+            pnl = np.asarray(pnl, dtype=np.float64)
+            n_chunks = -(-n_paths // self.chunk_paths)
+            seeds = np.random.SeedSequence([seed, int(strategy_id)]).spawn(n_chunks)
+            for chunk, chunk_seed in enumerate(seeds):
+                size = min(self.chunk_paths, n_paths - chunk * self.chunk_paths)
+                future = executor.submit(simulate_paths, pnl, size, horizon, method, block_size, chunk_seed,
+                                         deadline)
+                futures[future] = (name, chunk)
+        return futures
+
+    def _discard(self, executor):
+        """
+        Drop a broken pool, so that the next call to executor() starts a fresh one. A pool another request already
+        replaced is left alone.
+        """
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# simulator shared by all requests, its worker processes are started on the first simulation
+simulator = Simulator(workers=SIMULATION_WORKERS, chunk_paths=SIMULATION_CHUNK_PATHS,
+                      start_method=SIMULATION_START_METHOD)
@@ -1,5 +1,7 @@
-from flask import Blueprint
-from src import db
+from flask import Blueprint, Response, jsonify, make_response
+from src import columnar_store, db_pool, replica_router, result_cache, update_feed
+from src.metrics import registry
+from src.profiling import authorized, profile_store
 
 views_blueprint = Blueprint('views', __name__)
 
@@ -15,8 +17,55 @@ def home():
 def tester():
     return "<h1>this is a test!</h1>"
 
-# This is a hack to reload broken database connection
+# Broken connections are replaced by the pool on checkout, this just recycles all idle connections
 @views_blueprint.route('/reload')
 def reloader():
-    db.ping();
-    return "<h1>reload success</h1>"
\ No newline at end of file
+    db_pool.reset()
+    return "<h1>reload success</h1>"
+
+# Connection pool size and usage counters
+@views_blueprint.route('/pool_stats')
+def pool_stats():
+    return jsonify(db_pool.stats())
+
+# Health, lag and read counts of the read replicas, and how many analytic reads fell back to the primary
+@views_blueprint.route('/replica_stats')
+def replica_stats():
+    return jsonify(replica_router.stats())
+
+# Rows, watermark and age of the columnar snapshot (null without one)
+@views_blueprint.route('/columnar_stats')
+def columnar_stats():
+    return jsonify(columnar_store.status())
+
+# Result cache size and hit/miss/eviction counters
+@views_blueprint.route('/cache_stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+# Subscribers and event counters of the /stream/updates feed
+@views_blueprint.route('/push_stats')
+def push_stats():
+    return jsonify(update_feed.stats())
+
+# Request, DBModel method, query and pool wait metrics of this process in the Prometheus text format
+@views_blueprint.route('/metrics')
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+# Profiles of the requests sent with the profiling token (see src/profiling.py), newest first
+@views_blueprint.route('/profiles')
+def profiles():
+    if not authorized():
+        return make_response('Error: Invalid profiling token', 403)
+    return jsonify(profile_store.list())
+
+# One stored profile, by the X-Profile-Id header of the profiled response
+@views_blueprint.route('/profiles/<profile_id>')
+def profile(profile_id):
+    if not authorized():
+        return make_response('Error: Invalid profiling token', 403)
+    stored = profile_store.get(profile_id)
+    if stored is None:
+        return make_response(f'Error: No stored profile {profile_id}', 404)
+    return jsonify(stored)
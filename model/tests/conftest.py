@@ -0,0 +1,21 @@
+"""
+Fixtures shared by the tests. They run from model/ like the API, with config.py importable (see docker-compose.yml).
+Tests that need MySQL use the db_model fixture, which skips them when the configured database cannot be reached.
+"""
+
+# imports
+import pytest
+
+from src import db_pool
+from src.db_model import DBModel
+
+
+@pytest.fixture(scope='session')
+def db_model():
+    try:
+        with db_pool.connection(timeout=5) as conn:
+            with conn.cursor() as cur:
+                cur.execute('select 1')
+    except Exception as e:
+        pytest.skip(f'No MySQL database to test against: {e}')
+    return DBModel()
@@ -0,0 +1,72 @@
+# imports
+import pytest
+
+from src.cache import ResultCache, cached
+
+
+class FakeModel():
+    """
+    The DBModel side of the cache: a cache attribute and cached read methods, counting the computations.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.calls = 0
+
+    @cached
+    def get_trades(self, strategy, lookback, limit=None):
+        self.calls += 1
+        return (strategy, lookback, limit)
+
+
+@pytest.fixture
+def version():
+    return [1]
+
+
+@pytest.fixture
+def cache(version, monkeypatch):
+    cache = ResultCache(None, probe_interval=0.0)
+    monkeypatch.setattr(cache, '_probe', lambda: version[0])
+    return cache
+
+
+def test_keyword_and_positional_calls_share_an_entry(cache):
+    model = FakeModel(cache)
+    assert model.get_trades('A', 30) == ('A', 30, None)
+    assert model.get_trades('A', lookback=30) == ('A', 30, None)
+    assert model.get_trades(strategy='A', lookback=30, limit=None) == ('A', 30, None)
+    assert model.calls == 1
+
+    assert model.get_trades('A', 30, limit=5) == ('A', 30, 5)
+    assert model.get_trades('B', 30) == ('B', 30, None)
+    assert model.calls == 3
+    assert cache.stats()['hits'] == 2
+
+
+def test_invalid_arguments_raise_like_the_method(cache):
+    model = FakeModel(cache)
+    with pytest.raises(TypeError):
+        model.get_trades('A')
+    with pytest.raises(TypeError):
+        model.get_trades('A', 30, since=1)
+    assert model.calls == 0
+
+
+def test_new_data_version_recomputes(cache, version):
+    model = FakeModel(cache)
+    model.get_trades('A', 30)
+    version[0] += 1
+    model.get_trades('A', 30)
+    assert model.calls == 2
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_clear_recomputes_and_bumps_the_generation(cache):
+    model = FakeModel(cache)
+    model.get_trades('A', 30)
+    generation = cache.generation
+    cache.clear()
+    model.get_trades('A', 30)
+    assert model.calls == 2
+    assert cache.generation == generation + 1
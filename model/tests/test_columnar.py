@@ -0,0 +1,14 @@
+# imports
+import pytest
+
+from src import columnar_store
+from src.columnar import check
+
+
+def test_columnar_methods_match_mysql(db_model):
+    # As python -m src.columnar check: syncs the rollup and the snapshot, then runs every columnar method both ways
+    pytest.importorskip('duckdb')
+    if columnar_store.path is None:
+        pytest.skip('The columnar snapshot is disabled (COLUMNAR_PATH is None)')
+    diffs = [call for call, same in check([]) if not same]
+    assert diffs == []
@@ -0,0 +1,64 @@
+# imports
+import pytest
+
+from src.db_model import DBModel
+
+# Reference for the historical trades query: every trade with its fills joined in, without any bound on the fills
+REFERENCE_QUERY = """
+    Select trade.trade_id, trade.open_time, trade.close_time,
+    (select trade_leg.contract from trade_leg where trade_leg.trade_id = trade.trade_id
+     order by trade_leg.leg_no limit 1),
+    max(fill.leg_no), count(*), sum(fill.qty * fill.avg) * -1
+    from trade
+    join fill on fill.trade_id = trade.trade_id
+    where trade.strategy_id = %s
+    group by trade.trade_id, trade.open_time, trade.close_time
+    order by trade.open_time, trade.trade_id
+    """
+
+
+def _execute(db_model, query, args):
+    with db_model.pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, args)
+            return list(cur.fetchall())
+
+
+@pytest.fixture(scope='module')
+def trades(db_model):
+    """
+    The strategy with the most trades and its reference rows.
+    """
+    rows = _execute(db_model, 'select strategy_id from trade where strategy_id is not null '
+                              'group by strategy_id order by count(*) desc limit 1', ())
+    if not rows:
+        pytest.skip('No trades to query')
+    strategy_id = rows[0][0]
+    return strategy_id, _execute(db_model, REFERENCE_QUERY, (strategy_id,))
+
+
+def _query(db_model, strategy_id, since=None, after=None, limit=None):
+    after_open_time, after_trade_id = after if after is not None else (None, None)
+    return _execute(db_model, *DBModel._historical_trades_query(strategy_id, since, after_open_time, after_trade_id,
+                                                                limit))
+
+
+def test_lookback_matches_the_unbounded_query(db_model, trades):
+    strategy_id, reference = trades
+    assert _query(db_model, strategy_id) == reference
+    for row in reference[::max(1, len(reference) // 5)]:
+        since = row[1].strftime('%Y-%m-%d %H:%M:%S')
+        assert _query(db_model, strategy_id, since) == [r for r in reference if r[1] > row[1]]
+
+
+@pytest.mark.parametrize('limit', [1, 7])
+def test_keyset_pages_match_the_unbounded_query(db_model, trades, limit):
+    strategy_id, reference = trades
+    pages, after = [], None
+    while True:
+        page = _query(db_model, strategy_id, after=after, limit=limit)
+        if not page:
+            break
+        pages += page
+        after = page[-1][1], page[-1][0]
+    assert pages == reference
@@ -0,0 +1,87 @@
+# imports
+from datetime import timedelta
+
+import pytest
+
+from src.ingest import validate_batch
+
+# Ids far above the demo and benchmark data, removed before and after each test
+TRADE_ID = 2_000_000_001
+FILL_ID = 2_000_000_001
+BACKDATED_FILL_ID = 2_000_000_000
+
+
+@pytest.fixture
+def strategy_id(db_model):
+    columns, rows = db_model.strategies.rows()
+    if not rows:
+        pytest.skip('No strategy to ingest trades for')
+    return rows[0][columns.index('strategy_id')]
+
+
+@pytest.fixture(autouse=True)
+def cleanup(db_model):
+    def delete():
+        with db_model.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('delete from fill where fill_id in (%s, %s)', (FILL_ID, BACKDATED_FILL_ID))
+                cur.execute('delete from trade_leg where trade_id = %s', (TRADE_ID,))
+                cur.execute('delete from trade where trade_id = %s', (TRADE_ID,))
+    delete()
+    yield
+    delete()
+
+
+def _count(db_model, table, column, value):
+    with db_model.pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f'select count(*) from `{table}` where {column} = %s', (value,))
+            return cur.fetchone()[0]
+
+
+def _batch(strategy_id, open_time, filled_time, close_time=None, fill_id=FILL_ID):
+    # qty 0 keeps the P&L of the test days unchanged, whatever the rollup folds in
+    return validate_batch({
+        'trades': [{'trade_id': TRADE_ID, 'strategy_id': strategy_id, 'open_time': open_time,
+                    'close_time': close_time}],
+        'trade_legs': [{'leg_no': 1, 'trade_id': TRADE_ID, 'contract': 'TEST', 'open_time': open_time}],
+        'fills': [{'fill_id': fill_id, 'leg_no': 1, 'trade_id': TRADE_ID, 'contract': 'TEST', 'qty': 0, 'avg': 1.0,
+                   'filled_time': filled_time}],
+    }, 100)
+
+
+def test_refiled_fill_with_shifted_filled_time_is_not_inserted_twice(db_model, strategy_id):
+    first = db_model.ingest_batch(_batch(strategy_id, '2024-03-01 09:30:00', '2024-03-01 09:31:00'))
+    assert first['fills_inserted'] == 1
+
+    # Same fill_id, filled_time corrected by an hour (and into another day and month for good measure)
+    second = db_model.ingest_batch(_batch(strategy_id, '2024-03-01 09:30:00', '2024-04-02 10:31:00'))
+    assert second['fills_inserted'] == 0
+    assert second['fills_duplicate'] == 1
+    assert _count(db_model, 'fill', 'fill_id', FILL_ID) == 1
+
+
+def test_resent_trade_with_shifted_open_time_closes_the_stored_trade(db_model, strategy_id):
+    db_model.ingest_batch(_batch(strategy_id, '2024-03-01 09:30:00', '2024-03-01 09:31:00'))
+    db_model.ingest_batch(_batch(strategy_id, '2024-03-01 10:30:00', '2024-03-01 09:31:00',
+                                 close_time='2024-03-01 15:00:00'))
+
+    assert _count(db_model, 'trade', 'trade_id', TRADE_ID) == 1
+    with db_model.pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('select open_time, close_time from trade where trade_id = %s', (TRADE_ID,))
+            open_time, close_time = cur.fetchone()
+    assert close_time - open_time == timedelta(hours=5, minutes=30)
+
+
+def test_backdated_fill_changes_the_data_version(db_model, strategy_id):
+    # The watermark ends up past the test day, whatever fills the database holds
+    db_model.ingest_batch(_batch(strategy_id, '2024-03-01 09:30:00', '2024-03-01 09:31:00'))
+    db_model.pnl_rollup.refresh()
+    version = db_model.cache._probe()
+
+    # Neither the newest fill nor the highest fill_id, only the rollup's version tells it apart
+    result = db_model.ingest_batch(_batch(strategy_id, '2024-03-01 09:30:00', '2000-01-03 09:31:00',
+                                          fill_id=BACKDATED_FILL_ID))
+    assert result['fills_backdated'] == 1
+    assert db_model.cache._probe() != version
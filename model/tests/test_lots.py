@@ -0,0 +1,79 @@
+# imports
+import numpy as np
+import pytest
+
+from src.lots import LotState, match_lots, unrealized_pnl
+
+
+def _fills(*fills):
+    """
+    Parallel arrays of (key, minute, signed quantity, price) fills.
+    """
+    keys, minutes, qty, price = zip(*fills)
+    times = np.datetime64('2024-03-01T09:30:00') + np.array(minutes, dtype='timedelta64[m]')
+    return np.array(keys), times, np.array(qty), np.array(price, dtype=np.float64)
+
+
+def test_fifo_closes_the_oldest_lots_first():
+    closes, state = match_lots(*_fills((1, 0, 10, 100.0), (1, 1, 10, 110.0), (1, 2, -15, 120.0)))
+    assert closes['qty'].tolist() == [-15]
+    assert closes['pnl'].tolist() == [10 * 20.0 + 5 * 10.0]
+    assert state.qty.tolist() == [5]
+    assert state.price.tolist() == [110.0]
+
+
+def test_average_cost_closes_at_the_average_price():
+    closes, state = match_lots(*_fills((1, 0, 10, 100.0), (1, 1, 10, 110.0), (1, 2, -15, 120.0)), method='average')
+    assert closes['pnl'].tolist() == pytest.approx([15 * 15.0])
+    assert state.qty.tolist() == [5]
+    assert state.price.tolist() == pytest.approx([105.0])
+
+
+@pytest.mark.parametrize('method', ['fifo', 'average'])
+def test_fill_through_zero_closes_and_opens(method):
+    closes, state = match_lots(*_fills((1, 0, 5, 100.0), (1, 1, -8, 90.0)), method=method)
+    assert closes['qty'].tolist() == [-5]
+    assert closes['pnl'].tolist() == pytest.approx([-50.0])
+    # The short lot opened by the rest of the fill
+    assert state.qty.tolist() == [-3]
+    assert state.price.tolist() == [90.0]
+
+
+def test_short_lots_and_keys_are_matched_separately():
+    closes, state = match_lots(*_fills((1, 0, -4, 50.0), (2, 1, 3, 10.0), (1, 2, 4, 45.0), (2, 3, -1, 12.0)))
+    assert dict(zip(closes['key'].tolist(), closes['pnl'].tolist())) == {1: 20.0, 2: 2.0}
+    assert state.keys.tolist() == [2]
+    assert state.qty.tolist() == [2]
+
+
+@pytest.mark.parametrize('method', ['fifo', 'average'])
+def test_matching_from_a_checkpoint_gives_the_same_result(method, tmp_path):
+    rng = np.random.default_rng(7)
+    n = 2000
+    keys = rng.integers(0, 20, n)
+    minutes = np.arange(n)
+    qty = rng.integers(-50, 51, n)
+    price = rng.uniform(90, 110, n).round(2)
+    fills = list(zip(keys, minutes, qty, price))
+
+    closes, state = match_lots(*_fills(*fills), method=method)
+    first, checkpoint = match_lots(*_fills(*fills[:1200]), method=method)
+    checkpoint.save(tmp_path / 'lots.npz')
+    second, resumed = match_lots(*_fills(*fills[1200:]), method=method, state=LotState.load(tmp_path / 'lots.npz'))
+
+    assert np.concatenate([first['pnl'], second['pnl']]).sum() == pytest.approx(closes['pnl'].sum())
+    order = np.lexsort((resumed.times, resumed.keys))
+    expected = np.lexsort((state.times, state.keys))
+    assert resumed.keys[order].tolist() == state.keys[expected].tolist()
+    assert resumed.qty[order].tolist() == state.qty[expected].tolist()
+    assert resumed.price[order] == pytest.approx(state.price[expected])
+
+
+def test_unrealized_pnl_against_marks():
+    state = LotState([1, 2], ['2024-03-01T09:30:00'] * 2, [5, -3], [100.0, 20.0])
+    assert unrealized_pnl(state, [110.0, 25.0]).tolist() == [50.0, -15.0]
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        match_lots(*_fills((1, 0, 1, 1.0)), method='lifo')
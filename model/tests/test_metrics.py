@@ -0,0 +1,88 @@
+# imports
+import pytest
+
+from src import metrics
+from src.metrics import MetricsRegistry, current_operation, instrumented
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, '/a')
+
+    assert registry.render().splitlines() == [
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{route="/a",le="0.1"} 1',
+        'latency_seconds_bucket{route="/a",le="1.0"} 3',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a"} 6.05',
+        'latency_seconds_count{route="/a"} 4',
+    ]
+
+
+def test_counter_and_gauge_series_are_sorted_and_escaped():
+    registry = MetricsRegistry()
+    counter = registry.counter('slow_total', 'Slow queries', ('operation',))
+    counter.inc('b')
+    counter.inc('a', amount=2)
+    counter.inc('say "hi"\n')
+    registry.gauge('pool_size', 'Pool size', ('state',), lambda: {('idle',): 2, ('in_use',): 1})
+
+    assert registry.render() == '\n'.join([
+        '# HELP slow_total Slow queries',
+        '# TYPE slow_total counter',
+        'slow_total{operation="a"} 2',
+        'slow_total{operation="b"} 1',
+        'slow_total{operation="say \\"hi\\"\\n"} 1',
+        '# HELP pool_size Pool size',
+        '# TYPE pool_size gauge',
+        'pool_size{state="idle"} 2',
+        'pool_size{state="in_use"} 1',
+    ]) + '\n'
+
+
+def test_unlabelled_series():
+    registry = MetricsRegistry()
+    registry.histogram('wait_seconds', 'Wait', buckets=(1.0,)).observe(0.5)
+    assert 'wait_seconds_bucket{le="1.0"} 1' in registry.render().splitlines()
+    assert 'wait_seconds_count 1' in registry.render().splitlines()
+
+
+def test_instrumented_methods_label_their_queries(monkeypatch):
+    monkeypatch.setattr(metrics.registry, 'enabled', True)
+
+    @instrumented
+    class Model():
+        def read(self):
+            return current_operation.get()
+
+        def stream(self):
+            yield current_operation.get()
+
+        def _helper(self):
+            return current_operation.get()
+
+    model = Model()
+    assert model.read() == 'read'
+    assert list(model.stream()) == ['stream']
+    assert model._helper() is None
+    assert current_operation.get() is None
+
+
+@pytest.fixture
+def slow_queries(monkeypatch):
+    monkeypatch.setattr(metrics.registry, 'enabled', True)
+    monkeypatch.setattr(metrics, 'SLOW_QUERY_THRESHOLD', 0.5)
+    logged = []
+    monkeypatch.setattr(metrics.slow_query_log, 'warning', lambda *args: logged.append(args))
+    return logged
+
+
+def test_slow_queries_are_logged_with_their_parameters(slow_queries):
+    metrics.observe_query('select  *\n from fill where fill_id = %s', (7,), 0.75, 1)
+    metrics.observe_query('select 1', None, 0.01, 1)
+    assert len(slow_queries) == 1
+    assert 'select * from fill where fill_id = %s' in slow_queries[0]
+    assert '(7,)' in slow_queries[0]
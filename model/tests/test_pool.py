@@ -0,0 +1,70 @@
+# imports
+import pytest
+
+from src.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection():
+    def __init__(self):
+        self.open = True
+
+    def ping(self, reconnect=False):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.open = False
+
+
+@pytest.fixture
+def connections():
+    # Every connection the pool opened, in order
+    return []
+
+
+@pytest.fixture
+def pool(connections):
+    def connect():
+        conn = FakeConnection()
+        connections.append(conn)
+        return conn
+    return ConnectionPool(connect, min_size=3, max_size=4, timeout=0.05)
+
+
+def test_idle_connection_is_reused(pool, connections):
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert second is first
+    assert pool.stats()['checkouts'] == 2
+
+
+def test_checkout_times_out_when_every_connection_is_in_use(pool):
+    held = [pool.acquire() for _ in range(pool.max_size)]
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+    for conn in held:
+        pool.release(conn)
+
+
+def test_broken_connection_is_discarded_on_release(pool):
+    conn = pool.acquire()
+    size = pool.stats()['size']
+    conn.close()
+    pool.release(conn)
+    assert pool.stats()['size'] == size - 1
+    assert pool.stats()['discarded'] == 1
+
+
+def test_reset_reopens_min_size_connections(pool, connections):
+    before = list(connections)
+    pool.reset()
+    reopened = connections[len(before):]
+    assert all(not conn.open for conn in before)
+    assert len(reopened) == pool.min_size
+    assert all(conn.open for conn in reopened)
+    assert pool.stats()['idle'] == pool.min_size
@@ -0,0 +1,135 @@
+# imports
+import queue
+
+import pytest
+
+from src.push import UpdateFeed
+
+
+class FakePositionBook():
+    """
+    Open trades as {strategy_id: {trade_id: fill count}}, moved on by the tests.
+    """
+
+    def __init__(self, versions):
+        self.versions = versions
+        self.watermark = 0
+
+    def maybe_refresh(self):
+        pass
+
+    def trade_versions(self):
+        return {strategy_id: dict(trades) for strategy_id, trades in self.versions.items()}, self.watermark
+
+    def strategy_summary(self, strategy_id):
+        trades = self.versions.get(strategy_id, {})
+        return {'active_trades': len(trades), 'capital_usage': 100.0 * len(trades)}
+
+    def open_trades(self, trade_ids):
+        return [{'trade_id': trade_id} for trade_id in trade_ids]
+
+
+class FakeRegistry():
+    def name(self, strategy_id):
+        return f'S{strategy_id}'
+
+
+@pytest.fixture
+def book():
+    return FakePositionBook({1: {10: 1, 11: 2}, 2: {20: 1}})
+
+
+@pytest.fixture
+def pnl():
+    return {1: 5.0, 2: -3.0}
+
+
+@pytest.fixture
+def feed(book, pnl, monkeypatch):
+    # A long interval keeps the background thread out of the way, the tests run the polls
+    feed = UpdateFeed(None, book, None, FakeRegistry(), interval=3600, queue_size=10)
+    monkeypatch.setattr(feed, '_today_pnl', lambda ids: {strategy_id: pnl.get(strategy_id, 0.0) for strategy_id in ids})
+    return feed
+
+
+def _events(subscription):
+    events = []
+    while not subscription.events.empty():
+        events.append(subscription.events.get_nowait())
+    return events
+
+
+def _poll(feed, book):
+    book.watermark += 1
+    with feed._lock:
+        subscribers = list(feed._subscribers)
+    feed._poll(subscribers)
+
+
+def test_subscription_starts_with_a_snapshot_per_strategy(feed):
+    events = _events(feed.subscribe([2, 1]))
+    assert [kind for kind, _ in events] == ['snapshot', 'snapshot']
+    first, second = (event for _, event in events)
+    assert (first['strategy_name'], first['active_trades'], first['today_pnl']) == ('S1', 2, 5.0)
+    assert [trade['trade_id'] for trade in first['trades']] == [10, 11]
+    assert (second['strategy_id'], second['today_pnl']) == (2, -3.0)
+
+
+def test_subscribing_to_more_strategies_than_the_queue_size(feed, book):
+    book.versions.update({strategy_id: {} for strategy_id in range(3, 3 + feed.queue_size)})
+    subscription = feed.subscribe(list(book.versions))
+    assert len(_events(subscription)) == len(book.versions)
+
+    book.versions[1] = {10: 2}
+    _poll(feed, book)
+    assert [event['strategy_id'] for _, event in _events(subscription)] == [1]
+
+
+def test_poll_sends_only_changed_and_closed_trades(feed, book):
+    subscription = feed.subscribe([1, 2])
+    _events(subscription)
+
+    book.versions[1] = {11: 3, 12: 1}
+    _poll(feed, book)
+    [(kind, event)] = _events(subscription)
+    assert kind == 'update'
+    assert event['strategy_id'] == 1
+    assert [trade['trade_id'] for trade in event['trades']] == [11, 12]
+    assert event['closed_trades'] == [10]
+
+    # Nothing changed since
+    _poll(feed, book)
+    assert _events(subscription) == []
+
+
+def test_pnl_change_alone_sends_an_update(feed, book, pnl):
+    subscription = feed.subscribe([1, 2])
+    _events(subscription)
+    pnl[2] = 7.5
+    _poll(feed, book)
+    [(_, event)] = _events(subscription)
+    assert (event['strategy_id'], event['today_pnl'], event['trades']) == (2, 7.5, [])
+
+
+def test_subscribers_only_get_their_strategies(feed, book):
+    first, second = feed.subscribe([1]), feed.subscribe([2])
+    _events(first)
+    _events(second)
+    book.versions[2] = {}
+    _poll(feed, book)
+    assert _events(first) == []
+    assert [event['closed_trades'] for _, event in _events(second)] == [[20]]
+
+
+def test_subscriber_falling_behind_is_dropped(feed, book):
+    subscription = feed.subscribe([1])
+    # The snapshot and queue_size updates fit, the next one does not
+    for fills in range(2, 3 + feed.queue_size):
+        book.versions[1] = {10: fills}
+        _poll(feed, book)
+    # The queue is cut to the end-of-stream marker
+    assert subscription.events.get_nowait() is None
+    with pytest.raises(queue.Empty):
+        subscription.events.get_nowait()
+    assert feed.stats()['subscribers'] == 0
+    assert feed.stats()['dropped_subscribers'] == 1
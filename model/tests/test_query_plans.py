@@ -0,0 +1,25 @@
+# imports
+import pytest
+
+from src.query_plans import CHECKS, check_query_plans, recording_pool
+
+
+@pytest.fixture(scope='module')
+def pool(db_model):
+    with db_model.pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute('select 1 from fill limit 1')
+            if cur.fetchone() is None:
+                pytest.skip('No fills to check query plans against')
+    pool = recording_pool()
+    yield pool
+    pool.close()
+
+
+def test_no_query_falls_back_to_a_full_table_scan(pool):
+    # As python -m src.query_plans: meaningful on realistic volumes (see benchmarks/generate_data.py), the optimizer
+    # may prefer scanning a table of a few demo rows
+    failures = check_query_plans(pool)
+    scans = [f'{method}{args} on {row["table"]}: {" ".join(statement.split())}'
+             for method, args, statement, row in failures]
+    assert scans == [], f'{len(scans)} of {len(CHECKS)} checks fell back to a full table scan'
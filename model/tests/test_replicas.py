@@ -0,0 +1,113 @@
+# imports
+from contextlib import contextmanager
+
+import pymysql
+import pytest
+
+from src.replicas import Replica, ReplicaRouter, max_lag, track_lag
+
+STATUS_COLUMNS = ('Replica_IO_Running', 'Replica_SQL_Running', 'Seconds_Behind_Source')
+
+
+class FakeCursor():
+    def __init__(self, status):
+        self.status = status
+        self.description = [(name,) for name in STATUS_COLUMNS]
+
+    def execute(self, query, args=None):
+        pass
+
+    def fetchone(self):
+        return self.status
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakePool():
+    """
+    Pool of a server whose SHOW REPLICA STATUS returns status (None if not a replica), or that cannot be reached.
+    """
+
+    def __init__(self, status=None, down=False):
+        self.status = status
+        self.down = down
+        self.checks = 0
+
+    @contextmanager
+    def connection(self):
+        if self.down:
+            raise pymysql.err.OperationalError(2003, 'Can\'t connect to MySQL server')
+        self.checks += 1
+        yield self
+
+    def cursor(self):
+        return FakeCursor(self.status)
+
+
+def _router(*pools, **kwargs):
+    return ReplicaRouter('primary', [Replica(f'replica{i}', pool) for i, pool in enumerate(pools)], **kwargs)
+
+
+def test_lag_of_a_replication_status():
+    assert ReplicaRouter._lag(None) == (0.0, None)
+    assert ReplicaRouter._lag(dict(zip(STATUS_COLUMNS, ('Yes', 'Yes', 12)))) == (12.0, None)
+    assert ReplicaRouter._lag({'Slave_IO_Running': 'Yes', 'Slave_SQL_Running': 'Yes',
+                               'Seconds_Behind_Master': 3}) == (3.0, None)
+    lag, error = ReplicaRouter._lag(dict(zip(STATUS_COLUMNS, ('No', 'Yes', None))))
+    assert lag is None and 'not running' in error
+    lag, error = ReplicaRouter._lag(dict(zip(STATUS_COLUMNS, ('Yes', 'Yes', None))))
+    assert lag is None and 'unknown' in error
+
+
+def test_without_replicas_reads_go_to_the_primary():
+    router = ReplicaRouter('primary')
+    assert router.choose() == 'primary'
+
+
+def test_healthy_replicas_are_used_round_robin():
+    first, second = FakePool(), FakePool(('Yes', 'Yes', 1))
+    router = _router(first, second)
+    assert [router.choose() for _ in range(4)] == [first, second, first, second]
+    # Checked once each, then routed on the cached result
+    assert (first.checks, second.checks) == (1, 1)
+    assert [r['reads'] for r in router.stats()['replicas']] == [2, 2]
+
+
+def test_lagging_stopped_and_unreachable_replicas_are_skipped():
+    lagging, stopped, down = FakePool(('Yes', 'Yes', 120)), FakePool(('Yes', 'No', None)), FakePool(down=True)
+    router = _router(lagging, stopped, down, max_lag=30)
+    assert router.choose() == 'primary'
+    assert router.stats()['fallbacks'] == 1
+    assert [r['healthy'] for r in router.stats()['replicas']] == [True, False, False]
+
+
+def test_request_tolerance_overrides_the_default():
+    lagging = FakePool(('Yes', 'Yes', 120))
+    router = _router(lagging, max_lag=30)
+    token = max_lag.set(300)
+    try:
+        with track_lag() as seen:
+            assert router.choose() is lagging
+        assert seen == [120.0]
+    finally:
+        max_lag.reset(token)
+
+    # 0 reads only the primary, without checking the replicas
+    token = max_lag.set(0)
+    try:
+        assert router.choose() == 'primary'
+    finally:
+        max_lag.reset(token)
+
+
+@pytest.mark.parametrize('interval, checks', [(0, 3), (60, 1)])
+def test_replicas_are_checked_at_most_once_per_interval(interval, checks):
+    replica = FakePool()
+    router = _router(replica, check_interval=interval)
+    for _ in range(3):
+        router.choose()
+    assert replica.checks == checks
@@ -0,0 +1,93 @@
+# imports
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from src.risk import RiskEngine, drawdown, window_var_es
+
+
+def _history(n, seed=1):
+    rng = np.random.default_rng(seed)
+    dates = [(date(2023, 1, 1) + timedelta(days=i)).isoformat() for i in range(n)]
+    return dates, rng.normal(10, 100, n)
+
+
+def test_historical_var_es():
+    pnl = np.arange(-50.0, 50.0)
+    var, es = window_var_es(pnl[np.newaxis, :], 0.9, 'historical')
+    assert var[0] == pytest.approx(-np.quantile(pnl, 0.1))
+    # The 10 worst days of 100
+    assert es[0] == pytest.approx(-pnl[:10].mean())
+
+
+def test_parametric_var_is_normal_quantile():
+    pnl = _history(500)[1]
+    var, es = window_var_es(pnl[np.newaxis, :], 0.95, 'parametric')
+    assert var[0] == pytest.approx(-(pnl.mean() - 1.6448536 * pnl.std(ddof=1)), rel=1e-6)
+    assert es[0] > var[0]
+
+
+def test_drawdown_carries_peak_and_equity_over():
+    pnl = np.array([10.0, -5.0, 20.0, -30.0, 5.0])
+    dd = drawdown(pnl)[0]
+    assert dd.tolist() == [0.0, -5.0, 0.0, -30.0, -25.0]
+    _, curve, peak = drawdown(pnl[:2])
+    assert drawdown(pnl[2:], peak[-1], curve[-1])[0].tolist() == dd[2:].tolist()
+
+
+@pytest.mark.parametrize('method', ['historical', 'parametric'])
+def test_incremental_metrics_match_a_fresh_computation(method):
+    dates, pnl = _history(400)
+    engine = RiskEngine()
+    # Grow the closed history a few days at a time, with an open day on top
+    for n in (50, 120, 121, 300, 399):
+        engine.metrics(dates[:n + 1], pnl[:n + 1], dates[n], window=60, method=method, series=True)
+    result = engine.metrics(dates, pnl, dates[-1], window=60, method=method, series=True)
+    assert result == RiskEngine().metrics(dates, pnl, dates[-1], window=60, method=method, series=True)
+
+
+def test_changed_closed_day_is_recomputed():
+    dates, pnl = _history(200)
+    engine = RiskEngine()
+    engine.metrics(dates, pnl, dates[-1], window=20)
+    restated = pnl.copy()
+    restated[10] -= 1e6
+    result = engine.metrics(dates, restated, dates[-1], window=20)
+    assert result == RiskEngine().metrics(dates, restated, dates[-1], window=20)
+    assert result['MaxDD'] <= -1e6
+
+
+def test_short_history_uses_every_day():
+    dates, pnl = _history(10)
+    result = RiskEngine().metrics(dates, pnl, '2099-01-01', window=252)
+    var, es = window_var_es(pnl[np.newaxis, :], 0.95, 'historical')
+    assert result['VaR'] == round(float(var[0]), 2)
+    assert result['ES'] == round(float(es[0]), 2)
+
+
+def test_invalid_parameters_are_rejected():
+    dates, pnl = _history(30)
+    engine = RiskEngine()
+    with pytest.raises(ValueError):
+        engine.metrics(dates, pnl, dates[-1], method='garch')
+    with pytest.raises(ValueError):
+        engine.metrics(dates, pnl, dates[-1], confidence=1.5)
+    with pytest.raises(ValueError):
+        engine.metrics(dates, pnl, dates[-1], window=1)
+
+
+def test_states_are_kept_least_recently_used_first():
+    dates, pnl = _history(30)
+    engine = RiskEngine(max_states=2)
+    for window in (5, 10, 5, 20):
+        engine.metrics(dates, pnl, dates[-1], window=window)
+    assert list(engine._states) == [('historical', 0.95, 5), ('historical', 0.95, 20)]
+
+
+def test_unknown_method_does_not_keep_a_state():
+    dates, pnl = _history(30)
+    engine = RiskEngine()
+    with pytest.raises(ValueError):
+        engine.metrics(dates, pnl, dates[-1], method='garch')
+    assert len(engine._states) == 0
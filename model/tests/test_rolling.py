@@ -0,0 +1,95 @@
+# imports
+import math
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from src.rolling import ANNUALIZATION, SERIES_COLUMNS, WINDOWS, _StrategyState, _Welford
+
+START = date(2023, 1, 2)
+
+
+def _pnl(n, seed=3):
+    return np.random.default_rng(seed).normal(20, 150, n).round(2)
+
+
+def _fold(pnl):
+    state = _StrategyState()
+    rows = [state.fold(START + timedelta(days=i), float(x)) for i, x in enumerate(pnl)]
+    return state, rows
+
+
+def _volatility_sharpe(window):
+    std = window.std(ddof=1)
+    return std * math.sqrt(ANNUALIZATION), window.mean() / std * math.sqrt(ANNUALIZATION)
+
+
+def test_welford_add_and_remove():
+    x = _pnl(50)
+    acc = _Welford()
+    for value in x:
+        acc.add(value)
+    for value in x[:20]:
+        acc.remove(value)
+    assert acc.n == 30
+    assert acc.mean == pytest.approx(x[20:].mean())
+    assert acc.m2 == pytest.approx(((x[20:] - x[20:].mean()) ** 2).sum())
+
+
+def test_fold_matches_a_full_recomputation():
+    pnl = _pnl(300)
+    state, rows = _fold(pnl)
+    row = dict(zip(SERIES_COLUMNS, rows[-1]))
+    equity = np.cumsum(pnl)
+    drawdown = equity - np.maximum.accumulate(np.maximum(equity, 0))
+
+    assert row['date'] == START + timedelta(days=299)
+    assert row['equity'] == pytest.approx(equity[-1])
+    assert row['drawdown'] == pytest.approx(drawdown[-1])
+    assert row['mean'] == pytest.approx(pnl.mean())
+    assert (row['volatility'], row['sharpe']) == pytest.approx(_volatility_sharpe(pnl))
+    for w in WINDOWS:
+        assert (row[f'volatility_{w}'], row[f'sharpe_{w}']) == pytest.approx(_volatility_sharpe(pnl[-w:]))
+
+    current = state.current()
+    assert current['days'] == 300
+    assert current['max_drawdown'] == round(drawdown.min(), 2)
+    assert current['max_drawdown_date'] == (START + timedelta(days=int(drawdown.argmin()))).isoformat()
+    assert state.sums() == pytest.approx((pnl.sum(), (pnl * pnl).sum()))
+
+
+def test_windows_are_undefined_until_full():
+    _, rows = _fold(_pnl(30))
+    row = dict(zip(SERIES_COLUMNS, rows[-1]))
+    assert row['volatility_20'] is not None
+    assert (row['volatility_60'], row['sharpe_60']) == (None, None)
+    first = dict(zip(SERIES_COLUMNS, rows[0]))
+    assert (first['volatility'], first['sharpe']) == (None, None)
+
+
+def test_state_survives_a_round_trip():
+    pnl = _pnl(400)
+    state, _ = _fold(pnl[:350])
+    restored = _StrategyState.loads(state.dumps())
+    tail = [(START + timedelta(days=350 + i), float(x)) for i, x in enumerate(pnl[350:])]
+    assert [restored.fold(*day) for day in tail] == [state.fold(*day) for day in tail]
+    assert restored.current() == state.current()
+
+
+@pytest.mark.parametrize('days', [1, 2, 100, 350])
+def test_resume_from_stored_rows_continues_like_the_state(days):
+    pnl = _pnl(400)
+    state, rows = _fold(pnl[:days])
+    # As _state_before reads them from rolling_stats
+    recent = [(row[1], row[2], row[3], row[4], row[5]) for row in rows[-max(WINDOWS):]]
+    worst = min(row[3] for row in rows)
+    worst_date = next(row[0] for row in rows if row[3] == worst)
+    resumed = _StrategyState.resume(rows[-1][0], len(rows), recent, worst, worst_date)
+
+    for i, x in enumerate(pnl[days:]):
+        day = START + timedelta(days=days + i)
+        mine, expected = resumed.fold(day, float(x)), state.fold(day, float(x))
+        assert mine[0] == expected[0]
+        assert mine[1:] == pytest.approx(expected[1:], rel=1e-9)
+    assert resumed.current() == state.current()
@@ -0,0 +1,48 @@
+# imports
+import datetime
+import decimal
+
+import pytest
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from src import serialization
+from src.serialization import JSONProvider
+
+# Values Flask's default provider can encode, with keys out of order at every level
+PAYLOADS = [
+    {'strategy_name': 'MeanReversion', 'strategy_id': 1, 'active_trades': 3, 'capital_usage': 1234.5,
+     'running_on': None},
+    {'realized': [{'pnl': -12.25, 'date': datetime.date(2024, 3, 1)}], 'unrealized_pnl': 0.0, 'by': 'leg',
+     'method': 'fifo'},
+    {'z': {'b': [1, 2, {'y': True, 'x': False}], 'a': 'text'}, 'a': decimal.Decimal('10.125'),
+     'm': datetime.datetime(2024, 1, 2, 3, 4, 5)},
+    [{'b': 1, 'a': 2}, [], {}, 'plain'],
+]
+
+
+def _app(provider):
+    app = Flask(__name__)
+    app.json = provider(app)
+    return app
+
+
+@pytest.fixture(scope='module')
+def default_app():
+    return _app(DefaultJSONProvider)
+
+
+@pytest.fixture(scope='module')
+def app():
+    return _app(JSONProvider)
+
+
+@pytest.mark.parametrize('payload', PAYLOADS)
+def test_jsonify_matches_flask_default_provider(default_app, app, payload):
+    expected = default_app.json.response(payload).get_data()
+    assert app.json.response(payload).get_data() == expected
+
+
+@pytest.mark.parametrize('payload', PAYLOADS)
+def test_stdlib_fallback_matches_flask_default_provider(default_app, payload):
+    assert serialization._dumps_stdlib(payload) + b'\n' == default_app.json.response(payload).get_data()
@@ -0,0 +1,101 @@
+# imports
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+from src.simulation import Simulator, simulate_paths, summarize
+
+
+def test_summarize_reports_losses_as_positive_numbers():
+    terminal = np.arange(-500.0, 500.0)
+    max_dd = -np.arange(1000.0)
+    worst = np.minimum(terminal, 0)
+    result = summarize(terminal, max_dd, worst, 0.95, ruin_level=400)
+
+    cutoff = np.quantile(terminal, 0.05)
+    assert result['VaR'] == round(-cutoff, 2)
+    assert result['ES'] == round(-terminal[terminal <= cutoff].mean(), 2)
+    assert result['mean_pnl'] == -0.5
+    assert result['drawdown']['worst'] == -999.0
+    assert result['drawdown']['p95'] == round(np.quantile(max_dd, 0.05), 2)
+    # Paths whose worst P&L reached -400 or below
+    assert result['probability_of_ruin'] == 0.101
+    assert result['paths'] == 1000
+
+
+def test_summarize_without_paths():
+    assert summarize(np.empty(0), np.empty(0), np.empty(0), 0.95, 1e5) is None
+
+
+@pytest.mark.parametrize('method', ['bootstrap', 'montecarlo'])
+def test_paths_depend_only_on_the_seed(method):
+    pnl = np.random.default_rng(0).normal(0, 100, 300)
+    first = simulate_paths(pnl, 200, 20, method, 5, 42)
+    second = simulate_paths(pnl, 200, 20, method, 5, 42)
+    other = simulate_paths(pnl, 200, 20, method, 5, 43)
+    assert all(len(x) == 200 for x in first)
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+    assert not np.array_equal(first[0], other[0])
+
+
+def test_bootstrap_of_a_constant_history():
+    terminal, max_dd, worst = simulate_paths(np.full(50, 3.0), 10, 7, 'bootstrap', 5, 0)
+    assert terminal.tolist() == [21.0] * 10
+    assert max_dd.tolist() == [0.0] * 10
+    assert worst.tolist() == [0.0] * 10
+
+
+def test_drawdown_and_worst_of_a_losing_history():
+    terminal, max_dd, worst = simulate_paths(np.full(50, -2.0), 10, 7, 'montecarlo', 5, 0)
+    assert terminal.tolist() == [-14.0] * 10
+    assert max_dd.tolist() == [-14.0] * 10
+    assert worst.tolist() == [-14.0] * 10
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        simulate_paths(np.ones(10), 10, 5, 'garch', 5, 0)
+
+
+def test_no_batch_starts_past_the_deadline():
+    pnl = np.ones(10)
+    assert all(len(x) == 0 for x in simulate_paths(pnl, 2000, 5, 'bootstrap', 5, 0, deadline=time.time() - 1))
+    assert all(len(x) == 2000 for x in simulate_paths(pnl, 2000, 5, 'bootstrap', 5, 0, deadline=time.time() + 60))
+
+
+class BrokenExecutor():
+    """
+    A process pool one of whose workers died, e.g. while it was idle.
+    """
+
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool('A child process terminated abruptly')
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def test_pool_found_broken_is_replaced():
+    simulator = Simulator(workers=1, chunk_paths=100, start_method='fork')
+    simulator._executor = BrokenExecutor()
+    try:
+        results, report = simulator.run({'A': (1, np.ones(20))}, 200, 5)
+        assert results['A']['paths'] == 200
+        assert not report['truncated']
+    finally:
+        simulator._executor.shutdown()
+
+
+def test_pool_broken_again_fails_and_is_dropped(monkeypatch):
+    simulator = Simulator(workers=1)
+
+    def broken():
+        simulator._executor = BrokenExecutor()
+        return simulator._executor
+
+    monkeypatch.setattr(simulator, 'executor', broken)
+    with pytest.raises(BrokenProcessPool):
+        simulator.run({'A': (1, np.ones(20))}, 200, 5)
+    assert simulator._executor is None